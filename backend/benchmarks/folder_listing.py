@@ -0,0 +1,149 @@
+"""Compare the one-pass folder listing against the two-pass one it replaced.
+
+Builds a synthetic root of album folders, then lists it with
+``filesystem.list_folders`` and with the previous implementation, which
+read every subfolder twice (once for audio files, once to count its own
+subfolders) through ``iterdir`` and a stat per entry. Directory reads and
+stat calls are counted for both; ``--latency`` adds a delay to each, to
+stand in for the round trips of a network mount.
+
+Run from the backend directory:
+
+    PYTHONPATH=src python benchmarks/folder_listing.py
+"""
+
+import argparse
+import contextlib
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any
+
+FOLDERS = 500
+FILES = 15
+SUBFOLDERS = 5
+
+
+def make_library(base: Path, folders: int) -> None:
+    """Create album folders, each with some audio files, a cover and subfolders."""
+    for number in range(folders):
+        folder = base / f"Album {number:04d}"
+        folder.mkdir()
+        for track in range(FILES):
+            (folder / f"{track:02d} - Some Artist - A Fairly Long Track Title.flac").touch()
+        (folder / "cover.jpg").touch()
+        for disc in range(SUBFOLDERS):
+            (folder / f"Disc {disc}").mkdir()
+
+
+def legacy_list_folders(base_path: Path, settings: Any) -> list[Any]:
+    """List the root's folders the way list_folders used to."""
+    from small_media.models import FolderItem
+    from small_media.services.filesystem import encode_path, is_audio_file
+
+    def folder_has_audio(folder_path: Path, allowed_extensions: set[str]) -> bool:
+        try:
+            for item in folder_path.iterdir():
+                if item.is_file() and is_audio_file(item.name, allowed_extensions):
+                    return True
+        except PermissionError:
+            pass
+        return False
+
+    def count_subfolders(folder_path: Path) -> int:
+        try:
+            return sum(1 for item in folder_path.iterdir() if item.is_dir())
+        except PermissionError:
+            return 0
+
+    folders = []
+    allowed_ext = settings.allowed_extensions_set
+    for item in sorted(base_path.iterdir(), key=lambda x: x.name.lower()):
+        if item.is_dir() and not item.name.startswith("."):
+            folders.append(
+                FolderItem(
+                    name=item.name,
+                    path=encode_path(str(item.relative_to(base_path))),
+                    has_audio=folder_has_audio(item, allowed_ext),
+                    subfolder_count=count_subfolders(item),
+                )
+            )
+    return folders
+
+
+@contextlib.contextmanager
+def count_calls(latency: float) -> Iterator[Counter[str]]:
+    """Count directory reads and stats, delaying each by ``latency`` seconds."""
+    counts: Counter[str] = Counter()
+    originals = {name: getattr(os, name) for name in ("scandir", "listdir", "stat", "lstat")}
+
+    def wrap(name: str, function: Callable[..., Any]) -> Callable[..., Any]:
+        kind = "stat" if name.endswith("stat") else "read"
+
+        def counted(*args: Any, **kwargs: Any) -> Any:
+            counts[kind] += 1
+            if latency:
+                time.sleep(latency)
+            return function(*args, **kwargs)
+
+        return counted
+
+    for name, function in originals.items():
+        setattr(os, name, wrap(name, function))
+    try:
+        yield counts
+    finally:
+        for name, function in originals.items():
+            setattr(os, name, function)
+
+
+def time_listing(
+    list_root: Callable[[], list[Any]], rounds: int, latency: float
+) -> tuple[float, Counter[str]]:
+    """Get the median time of a listing in milliseconds, and its call counts."""
+    list_root()  # Warm up
+    times = []
+    for _ in range(rounds):
+        with count_calls(latency) as counts:
+            started = time.perf_counter()
+            list_root()
+            times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000, counts
+
+
+def main(folders: int, rounds: int, latency: float) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        media = Path(tmpdir)
+        make_library(media, folders)
+
+        from small_media.config import Settings
+        from small_media.services.filesystem import list_folders
+
+        settings = Settings(media_path=media, cache_path=media / ".cache")
+        assert list_folders(media, "", settings) == legacy_list_folders(media, settings)
+
+        results = {
+            "two passes": time_listing(
+                lambda: legacy_list_folders(media, settings), rounds, latency
+            ),
+            "one pass": time_listing(lambda: list_folders(media, "", settings), rounds, latency),
+        }
+        print(f"{folders} folders, {latency * 1000:g} ms per call")
+        print(f"{'':>10} {'dir reads':>10} {'stats':>8} {'time':>12}")
+        for name, (elapsed, counts) in results.items():
+            print(f"{name:>10} {counts['read']:>10} {counts['stat']:>8} {elapsed:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folders", type=int, default=FOLDERS, help="Folders in the root")
+    parser.add_argument("--rounds", type=int, default=5, help="Listings timed per variant")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Milliseconds added to each read and stat"
+    )
+    args = parser.parse_args()
+    main(args.folders, args.rounds, args.latency / 1000)
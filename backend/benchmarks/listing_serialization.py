@@ -0,0 +1,130 @@
+"""Compare folder listing serialization against the response_model path.
+
+Builds a synthetic library of large folders, then times GET /api/folders/...
+through the real app (trusted dicts encoded once) and through an endpoint
+that builds validated models and returns them with ``response_model``, as
+the listing routes used to. Requests are sent straight to the ASGI app, so
+the numbers exclude the network and the HTTP server.
+
+Run from the backend directory:
+
+    PYTHONPATH=src python benchmarks/listing_serialization.py
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+FOLDER_SIZES = (2_000, 20_000)
+SUBFOLDERS = 50
+
+
+def make_library(base: Path, sizes: tuple[int, ...]) -> None:
+    """Create one folder per size, with that many audio files and some subfolders."""
+    for size in sizes:
+        folder = base / f"Folder {size}"
+        folder.mkdir()
+        for number in range(SUBFOLDERS):
+            (folder / f"Disc {number:02d}").mkdir()
+        for number in range(size):
+            (folder / f"{number:05d} - Some Artist - A Fairly Long Track Title.flac").touch()
+
+
+async def call(app, path: str) -> bytes:
+    """Send one GET to an ASGI app and return the response body."""
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [],
+        "root_path": "",
+        "scheme": "http",
+        "server": ("bench", 80),
+        "client": ("bench", 1),
+        "http_version": "1.1",
+    }
+    await app(scope, receive, send)
+    return b"".join(body)
+
+
+async def time_requests(app, path: str, rounds: int) -> float:
+    """Get the median time of a request in milliseconds."""
+    await call(app, path)  # Warm up
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await call(app, path)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+async def main(sizes: tuple[int, ...], rounds: int) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        media = Path(tmpdir) / "media"
+        media.mkdir()
+        make_library(media, sizes)
+        os.environ["MEDIA_PATH"] = str(media)
+        os.environ["CACHE_PATH"] = str(Path(tmpdir) / "cache")
+
+        from fastapi import FastAPI
+
+        from small_media.config import get_settings
+        from small_media.main import app
+        from small_media.models import AudioFile, FolderContents, FolderItem
+        from small_media.services.filesystem import get_folder_name
+        from small_media.services.library import get_library_index, iter_folder_contents
+
+        settings = get_settings()
+        get_library_index(settings).scan()
+
+        legacy = FastAPI()
+
+        @legacy.get("/api/folders/{path:path}", response_model=FolderContents)
+        async def get_folder(path: str) -> FolderContents:
+            folders = []
+            files = []
+            for kind, data in iter_folder_contents(settings.media_path, path, settings):
+                if kind == "folder":
+                    folders.append(FolderItem(**data))
+                else:
+                    files.append(AudioFile(**data))
+            return FolderContents(
+                path=path, name=get_folder_name(path), folders=folders, files=files
+            )
+
+        print(f"{'entries':>8} {'response_model':>15} {'trusted dicts':>14} {'speedup':>8}")
+        for size in sizes:
+            path = f"/api/folders/Folder%20{size}"
+            assert json.loads(await call(app, path)) == json.loads(await call(legacy, path))
+            before = await time_requests(legacy, path, rounds)
+            after = await time_requests(app, path, rounds)
+            print(
+                f"{size + SUBFOLDERS:>8} {before:>12.2f} ms {after:>11.2f} ms"
+                f" {before / after:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=list(FOLDER_SIZES), help="Files per folder"
+    )
+    parser.add_argument("--rounds", type=int, default=20, help="Requests timed per folder")
+    args = parser.parse_args()
+    asyncio.run(main(tuple(args.sizes), args.rounds))
@@ -2,6 +2,7 @@
 
 from functools import lru_cache
 from pathlib import Path
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -34,8 +35,41 @@ class Settings(BaseSettings):
     cache_path: Path = Path("/cache")
 
     # Audio settings
+    audio_codec: Literal["mp3", "opus"] = "mp3"  # Codec of transcoded output
     audio_quality: int = 2  # LAME VBR quality (0-9, lower = better)
-    audio_bitrate: int = 192  # CBR fallback bitrate in kbps
+    audio_bitrate: int = 192  # CBR fallback bitrate in kbps (Opus target bitrate)
+    default_profile: str = "standard"  # Output profile used when a request doesn't pick one
+
+    # Transcode cache
+    cache_max_size_mb: int = 0  # Evict least recently used files above this (0 = unlimited)
+    cache_index_ttl: float = 30.0  # Seconds to trust a source's size/mtime before re-checking
+
+    # Transcoding scheduler
+    transcode_concurrency: int = 2  # Maximum simultaneous FFmpeg encodes
+    transcode_threads: int = 1  # FFmpeg threads per encode (0 = auto)
+    transcode_nice: int = 10  # Niceness for FFmpeg processes (0 = unchanged)
+
+    # Prefetch of upcoming playlist tracks
+    prefetch_tracks: int = 2  # Tracks to transcode ahead of playback (0 = off)
+    prefetch_concurrency: int = 1  # Maximum prefetch encodes in flight
+
+    # Library index
+    library_index: bool = True  # Serve listings from an in-memory index of the library
+    library_rescan_interval: float = 600.0  # Seconds between fallback rescans (0 = never)
+    listing_concurrency: int = 8  # Threads reading subfolders of a listing off the index
+
+    # Library storage
+    storage_threads: int = 16  # Threads for blocking filesystem work on the library
+    storage_timeout: float = 10.0  # Seconds to wait for one library operation (0 = no limit)
+
+    # File streaming
+    stream_chunk_size: int = 64 * 1024  # Bytes read per chunk when streaming files
+
+    # Segmented (HLS) output
+    hls_segment_duration: int = 10  # Seconds of audio per segment
+
+    # Metadata probing
+    probe_concurrency: int = 4  # Maximum ffprobe processes per playlist request
 
     # Allowed extensions
     allowed_extensions: str = "wav,mp3,m4a,mp4,flac,ogg"
@@ -1,14 +1,27 @@
 """FastAPI application entry point."""
 
+import asyncio
 from pathlib import Path
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from .config import get_settings
-from .routes import folders_router, playlist_router, stream_router
-from .services.transcoder import ensure_cache_dir
+from .routes import (
+    folders_router,
+    playlist_router,
+    search_router,
+    status_router,
+    stream_router,
+)
+from .services.cache import load_cache_index
+from .services.hls import sweep_hls
+from .services.library import start_library_index, stop_library_index
+from .services.search import get_search_index
+from .services.storage import StorageTimeoutError
+from .services.transcoder import ensure_cache_dir, sweep_cache
 
 app = FastAPI(
     title="Small Media API",
@@ -25,10 +38,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Include API routers
-app.include_router(folders_router, prefix="/api")
+# Include API routers (playlist before folders, whose catch-all path would
+# otherwise swallow /folders/{path}/playlist)
 app.include_router(playlist_router, prefix="/api")
+app.include_router(folders_router, prefix="/api")
 app.include_router(stream_router, prefix="/api")
+app.include_router(search_router, prefix="/api")
+app.include_router(status_router, prefix="/api")
+
+
+@app.exception_handler(StorageTimeoutError)
+async def storage_timeout_handler(request: Request, exc: StorageTimeoutError) -> JSONResponse:
+    """Answer requests whose library storage stopped responding."""
+    return JSONResponse(status_code=503, content={"detail": "Storage is not responding"})
 
 
 @app.get("/api/health")
@@ -44,6 +66,17 @@ async def startup_event() -> None:
     
     # Ensure cache directory exists
     ensure_cache_dir(settings)
+
+    # Reconcile the cache index with the files on disk, then clear out
+    # anything left behind by encodes that were interrupted
+    await load_cache_index(settings)
+    await asyncio.to_thread(sweep_cache, settings)
+    await asyncio.to_thread(sweep_hls, settings)
+
+    # Index the library in the background; listings read the disk until it's ready
+    start_library_index(settings)
+    # Follow it with the search index from the first scan
+    get_search_index(settings)
     
     if settings.debug:
         print(f"Media path: {settings.media_path}")
@@ -64,3 +97,9 @@ async def startup_event() -> None:
             if settings.debug:
                 print(f"Serving static files from: {frontend_dist}")
             break
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    """Stop background work on shutdown."""
+    await stop_library_index(get_settings())
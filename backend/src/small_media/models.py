@@ -30,12 +30,31 @@ class FolderContents(BaseModel):
     name: str
     folders: list[FolderItem]
     files: list[AudioFile]
+    next_cursor: str | None = None  # Set when a limit cut the listing short
 
 
 class FolderListResponse(BaseModel):
     """Response for folder listing."""
 
     folders: list[FolderItem]
+    next_cursor: str | None = None  # Set when a limit cut the listing short
+
+
+class SearchResult(BaseModel):
+    """A folder or audio file matching a search."""
+
+    name: str
+    path: str  # URL-encoded relative path
+    folder: str  # URL-encoded path of the containing folder
+    is_folder: bool
+
+
+class SearchResponse(BaseModel):
+    """Response for a library search."""
+
+    query: str
+    results: list[SearchResult]
+    total: int  # Matches, including those beyond the limit
 
 
 class PlaylistTrack(BaseModel):
@@ -52,6 +71,7 @@ class Playlist(BaseModel):
 
     path: str
     tracks: list[PlaylistTrack]
+    next_cursor: str | None = None  # Set when a limit cut the playlist short
 
 
 class PlaylistTrackUpdate(BaseModel):
@@ -78,6 +98,34 @@ class AudioInfo(BaseModel):
     channels: int | None = None
 
 
+class TranscodeQueueStatus(BaseModel):
+    """Queue depth and wait times for one transcode priority class."""
+
+    priority: str
+    queued: int
+    started: int
+    average_wait: float  # Seconds
+    max_wait: float  # Seconds
+
+
+class TranscoderStatus(BaseModel):
+    """Transcode scheduler status."""
+
+    concurrency: int
+    active: int
+    queues: list[TranscodeQueueStatus]
+
+
+class CacheStatus(BaseModel):
+    """Transcode cache usage."""
+
+    entries: int
+    total_size: int  # Bytes
+    max_size: int  # Bytes, 0 = unlimited
+    hits: int
+    pinned: int  # Cache files this worker is serving
+
+
 class ErrorResponse(BaseModel):
     """Error response."""
 
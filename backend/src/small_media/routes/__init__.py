@@ -2,7 +2,15 @@
 
 from .folders import router as folders_router
 from .playlist import router as playlist_router
+from .search import router as search_router
+from .status import router as status_router
 from .stream import router as stream_router
 
-__all__ = ["folders_router", "playlist_router", "stream_router"]
+__all__ = [
+    "folders_router",
+    "playlist_router",
+    "search_router",
+    "status_router",
+    "stream_router",
+]
 
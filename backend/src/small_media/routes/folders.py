@@ -1,40 +1,150 @@
 """API routes for folder navigation."""
 
-from fastapi import APIRouter, HTTPException
+from itertools import takewhile
+from typing import Any
 
-from ..config import get_settings
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+
+from ..config import Settings, get_settings
 from ..models import ErrorResponse, FolderContents, FolderListResponse
-from ..services.filesystem import get_folder_contents, is_safe_path, list_folders
+from ..services.conditional import etag_matches, make_etag
+from ..services.filesystem import decode_path, get_folder_name, is_safe_path
+from ..services.library import iter_folder_contents, load_folder_signature
+from ..services.paging import (
+    NDJSON_MEDIA_TYPE,
+    encode_json,
+    iter_ndjson,
+    parse_cursor,
+    take_page,
+    wants_ndjson,
+)
+from ..services.storage import iterate_blocking, run_blocking
 
 router = APIRouter(prefix="/folders", tags=["Folders"])
 
 
+def read_root_folders(
+    settings: Settings, start: int = 0, limit: int | None = None
+) -> tuple[list[dict[str, Any]], str | None]:
+    """Read a page of the media root's subfolders, with the cursor for the rest (blocking)."""
+    items = iter_folder_contents(settings.media_path, "", settings, start) or ()
+    folders = takewhile(lambda item: item[0] == "folder", items)
+    page, next_cursor = take_page(folders, start, limit)
+    return [data for _, data in page], next_cursor
+
+
 @router.get(
     "",
     response_model=FolderListResponse,
-    responses={500: {"model": ErrorResponse}},
+    responses={
+        304: {"description": "Not modified"},
+        400: {"model": ErrorResponse},
+        500: {"model": ErrorResponse},
+    },
 )
-async def list_root_folders() -> FolderListResponse:
-    """List folders in the media root directory."""
+async def list_root_folders(
+    request: Request,
+    limit: int | None = Query(None, ge=1, description="Maximum number of folders"),
+    cursor: str | None = Query(None, description="Where to continue a previous listing"),
+) -> FolderListResponse | Response:
+    """List folders in the media root directory.
+
+    ``limit`` and ``cursor`` page through them like a folder's contents.
+    """
     settings = get_settings()
-    folders = list_folders(settings.media_path, "", settings)
-    return FolderListResponse(folders=folders)
+    try:
+        start = parse_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from None
+
+    try:
+        signature = await load_folder_signature(settings.media_path, settings)
+    except OSError:
+        return FolderListResponse(folders=[])
+    etag = make_etag("folders", signature, settings.allowed_extensions, start, limit)
+    # Revalidated on every use; an unchanged listing costs a 304
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    folders, next_cursor = await run_blocking(settings, read_root_folders, settings, start, limit)
+    body = {"folders": folders, "next_cursor": next_cursor}
+    return Response(encode_json(body), media_type="application/json", headers=headers)
 
 
 @router.get(
     "/{path:path}",
     response_model=FolderContents,
-    responses={404: {"model": ErrorResponse}},
+    responses={
+        200: {"content": {NDJSON_MEDIA_TYPE: {}}},
+        304: {"description": "Not modified"},
+        400: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+    },
 )
-async def get_folder(path: str) -> FolderContents:
-    """Get contents of a specific folder."""
+async def get_folder(
+    path: str,
+    request: Request,
+    limit: int | None = Query(None, ge=1, description="Maximum number of entries"),
+    cursor: str | None = Query(None, description="Where to continue a previous listing"),
+) -> FolderContents | Response:
+    """Get contents of a specific folder.
+
+    Served from the library index once it has loaded. The ETag follows the
+    folder's entries, so a client re-opening an unchanged folder gets a 304
+    without the listing being rebuilt.
+
+    Subfolders come first, then files; ``limit`` and ``cursor`` page
+    through both. With ``Accept: application/x-ndjson`` entries are
+    streamed as they are produced instead.
+    """
     settings = get_settings()
 
-    if not is_safe_path(settings.media_path, path):
+    if not await run_blocking(settings, is_safe_path, settings.media_path, path):
         raise HTTPException(status_code=404, detail="Folder not found")
+    try:
+        start = parse_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from None
+    ndjson = wants_ndjson(request.headers.get("accept"))
 
-    contents = get_folder_contents(settings.media_path, path, settings)
-    if contents is None:
+    folder_path = settings.media_path / decode_path(path) if path else settings.media_path
+    try:
+        signature = await load_folder_signature(folder_path, settings)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Folder not found") from None
+    etag = make_etag(
+        "folder", path, signature, settings.allowed_extensions, start, limit, ndjson
+    )
+    # Revalidated on every use; an unchanged listing costs a 304
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    items = await run_blocking(
+        settings, iter_folder_contents, settings.media_path, path, settings, start
+    )
+    if items is None:
         raise HTTPException(status_code=404, detail="Folder not found")
+    name = get_folder_name(path)
+
+    if ndjson:
+        return StreamingResponse(
+            iterate_blocking(
+                settings, iter_ndjson({"path": path, "name": name}, items, start, limit)
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers=headers,
+        )
 
-    return contents
+    # Entries read from disk are read as the page is taken
+    page, next_cursor = await run_blocking(settings, take_page, items, start, limit)
+    body = {
+        "path": path,
+        "name": name,
+        "folders": [data for kind, data in page if kind == "folder"],
+        "files": [data for kind, data in page if kind == "file"],
+        "next_cursor": next_cursor,
+    }
+    return Response(encode_json(body), media_type="application/json", headers=headers)
@@ -1,27 +1,113 @@
 """API routes for playlist management."""
 
-from fastapi import APIRouter, HTTPException
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Any
 
-from ..config import get_settings
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+
+from ..config import Settings, get_settings
 from ..models import ErrorResponse, Playlist, PlaylistUpdate
+from ..services.conditional import etag_matches, make_etag
 from ..services.filesystem import decode_path, is_safe_path
-from ..services.playlist import build_playlist, update_playlist
+from ..services.library import load_folder_signature
+from ..services.metadata import load_audio_durations
+from ..services.paging import (
+    NDJSON_MEDIA_TYPE,
+    encode_entry,
+    encode_json,
+    encode_line,
+    make_cursor,
+    parse_cursor,
+    wants_ndjson,
+)
+from ..services.playlist import (
+    get_playlist_order,
+    get_playlist_path,
+    make_tracks,
+    update_playlist,
+)
+from ..services.storage import run_blocking
 
 router = APIRouter(tags=["Playlist"])
 
+STREAM_BATCH_SIZE = 128  # Tracks sent (and their durations loaded) together while streaming
+
+
+async def fill_durations(
+    tracks: list[dict[str, Any]], folder_path: Path, settings: Settings
+) -> None:
+    """Fill in track durations from the metadata cache, probing uncached tracks."""
+    if not tracks:
+        return
+    file_paths = [folder_path / track["filename"] for track in tracks]
+    for track, duration in zip(
+        tracks, await load_audio_durations(file_paths, settings), strict=True
+    ):
+        track["duration"] = duration
+
+
+async def iter_playlist_lines(
+    path: str,
+    tracks: list[tuple[str, bool]],
+    next_cursor: str | None,
+    folder_path: Path,
+    durations: bool,
+    settings: Settings,
+) -> AsyncIterator[bytes]:
+    """Stream a page of a playlist as NDJSON, a batch of tracks at a time."""
+    yield encode_line({"path": path})
+    for batch_start in range(0, len(tracks), STREAM_BATCH_SIZE):
+        batch = make_tracks(
+            path, folder_path, tracks[batch_start : batch_start + STREAM_BATCH_SIZE], settings
+        )
+        if durations:
+            await fill_durations(batch, folder_path, settings)
+        yield b"".join(encode_entry("track", track) for track in batch)
+    if next_cursor is not None:
+        yield encode_line({"next_cursor": next_cursor})
+
 
 @router.get(
     "/folders/{path:path}/playlist",
     response_model=Playlist,
-    responses={404: {"model": ErrorResponse}},
+    responses={
+        200: {"content": {NDJSON_MEDIA_TYPE: {}}},
+        304: {"description": "Not modified"},
+        400: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+    },
 )
-async def get_playlist(path: str) -> Playlist:
-    """Get playlist for a folder with ordered tracks and skip flags."""
+async def get_playlist(
+    path: str,
+    request: Request,
+    durations: bool = Query(False, description="Include the duration of every track"),
+    limit: int | None = Query(None, ge=1, description="Maximum number of tracks"),
+    cursor: str | None = Query(None, description="Where to continue a previous listing"),
+) -> Playlist | Response:
+    """Get playlist for a folder with ordered tracks and skip flags.
+
+    With ``durations``, each track's duration is filled in from the metadata
+    cache, probing uncached tracks in parallel.
+
+    The ETag follows the folder's entries and the playlist YAML file, so an
+    unchanged playlist is answered with a 304 before it is built.
+
+    ``limit`` and ``cursor`` page through the tracks. With
+    ``Accept: application/x-ndjson`` tracks are streamed in batches instead,
+    so the first ones arrive before every duration has been probed.
+    """
     settings = get_settings()
 
     # Validate path
-    if path and not is_safe_path(settings.media_path, path):
+    if path and not await run_blocking(settings, is_safe_path, settings.media_path, path):
         raise HTTPException(status_code=404, detail="Folder not found")
+    try:
+        start = parse_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from None
+    ndjson = wants_ndjson(request.headers.get("accept"))
 
     # Check folder exists
     if path:
@@ -29,12 +115,52 @@ async def get_playlist(path: str) -> Playlist:
     else:
         folder_path = settings.media_path
 
-    if not folder_path.exists() or not folder_path.is_dir():
+    if not await run_blocking(settings, folder_path.is_dir):
         raise HTTPException(status_code=404, detail="Folder not found")
 
-    tracks = build_playlist(settings.media_path, path, settings)
-
-    return Playlist(path=path, tracks=tracks)
+    try:
+        signature = await load_folder_signature(folder_path, settings)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Folder not found") from None
+    # Stat the YAML file directly; the index may not have seen a save yet
+    try:
+        playlist_stat = await run_blocking(settings, get_playlist_path(folder_path).stat)
+        playlist_mtime = playlist_stat.st_mtime_ns
+    except FileNotFoundError:
+        playlist_mtime = None
+    etag = make_etag(
+        "playlist",
+        path,
+        signature,
+        playlist_mtime,
+        durations,
+        settings.allowed_extensions,
+        start,
+        limit,
+        ndjson,
+    )
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    order = await run_blocking(settings, get_playlist_order, folder_path, settings)
+    end = len(order) if limit is None else min(len(order), start + limit)
+    page = order[start:end]
+    next_cursor = make_cursor(end) if end < len(order) else None
+
+    if ndjson:
+        return StreamingResponse(
+            iter_playlist_lines(path, page, next_cursor, folder_path, durations, settings),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers=headers,
+        )
+
+    tracks = make_tracks(path, folder_path, page, settings)
+    if durations:
+        await fill_durations(tracks, folder_path, settings)
+
+    body = {"path": path, "tracks": tracks, "next_cursor": next_cursor}
+    return Response(encode_json(body), media_type="application/json", headers=headers)
 
 
 @router.put(
@@ -50,11 +176,13 @@ async def update_folder_playlist(path: str, data: PlaylistUpdate) -> Playlist:
     settings = get_settings()
 
     # Validate path
-    if path and not is_safe_path(settings.media_path, path):
+    if path and not await run_blocking(settings, is_safe_path, settings.media_path, path):
         raise HTTPException(status_code=404, detail="Folder not found")
 
     # Update playlist
-    tracks = update_playlist(settings.media_path, path, data.tracks, settings)
+    tracks = await run_blocking(
+        settings, update_playlist, settings.media_path, path, data.tracks, settings
+    )
 
     if tracks is None:
         raise HTTPException(status_code=404, detail="Folder not found")
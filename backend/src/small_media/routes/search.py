@@ -0,0 +1,37 @@
+"""API routes for searching the library."""
+
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Query
+
+from ..config import get_settings
+from ..models import ErrorResponse, SearchResponse
+from ..services.search import search_library
+
+router = APIRouter(prefix="/search", tags=["Search"])
+
+
+@router.get(
+    "",
+    response_model=SearchResponse,
+    responses={503: {"model": ErrorResponse}},
+)
+async def search(
+    q: str = Query(min_length=1, description="Words to find in folder and file names"),
+    limit: int = Query(50, ge=1, le=500),
+) -> SearchResponse:
+    """Find folders and audio files by name anywhere in the library.
+
+    Every word must appear somewhere in the name, ignoring case and
+    accents. Answered from the library index, so this is unavailable
+    until the first scan has finished.
+    """
+    settings = get_settings()
+
+    # Ranking a common word's matches takes a while on a large library
+    found = await asyncio.to_thread(search_library, q, limit, settings)
+    if found is None:
+        raise HTTPException(status_code=503, detail="Library is still being indexed")
+
+    results, total = found
+    return SearchResponse(query=q, results=results, total=total)
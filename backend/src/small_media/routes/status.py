@@ -0,0 +1,27 @@
+"""API routes for server status."""
+
+import asyncio
+
+from fastapi import APIRouter
+
+from ..config import get_settings
+from ..models import CacheStatus, TranscoderStatus
+from ..services.cache import get_cache_index
+from ..services.transcoder import get_scheduler
+
+router = APIRouter(prefix="/status", tags=["Status"])
+
+
+@router.get("/transcoder", response_model=TranscoderStatus)
+async def get_transcoder_status() -> TranscoderStatus:
+    """Get transcode scheduler load, queue depth and wait times."""
+    settings = get_settings()
+    return TranscoderStatus(**get_scheduler(settings).stats())
+
+
+@router.get("/cache", response_model=CacheStatus)
+async def get_cache_status() -> CacheStatus:
+    """Get transcode cache size and limit."""
+    settings = get_settings()
+    # Counting entries queries the index database
+    return CacheStatus(**await asyncio.to_thread(get_cache_index(settings).stats))
@@ -1,118 +1,208 @@
 """API routes for audio streaming."""
 
 import asyncio
+import os
 from pathlib import Path
+from typing import Any
+from urllib.parse import urlencode
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
 
-from ..config import get_settings
+from ..config import Settings, get_settings
 from ..models import AudioInfo, ErrorResponse
+from ..services.cache import CacheEntry, CacheIndex, get_cache_index, get_output_profile
+from ..services.conditional import etag_matches, make_etag
 from ..services.filesystem import decode_path, get_file_extension, is_safe_path
+from ..services.hls import (
+    PLAYLIST_NAME,
+    build_playlist,
+    get_segment_count,
+    load_hls_encode,
+    parse_segment_name,
+)
+from ..services.metadata import load_audio_info
+from ..services.prefetch import schedule_prefetch
+from ..services.profiles import get_profile_settings
+from ..services.storage import run_blocking
 from ..services.transcoder import (
-    get_audio_info,
+    SOURCE_MEDIA_TYPES,
     get_cached_path,
+    get_output_codec,
+    get_transcode_job,
     is_mp3_passthrough,
-    stream_transcoded,
-    transcode_to_cache,
+    is_native_passthrough,
+    stream_seek,
 )
 
 router = APIRouter(prefix="/stream", tags=["Stream"])
 
+PROFILE_HEADER = "X-Audio-Profile"
+# Whether a file is transcoded, and to what, depends on these request headers
+VARY = f"Accept, {PROFILE_HEADER}"
 
-def get_content_type(file_path: Path, is_passthrough: bool) -> str:
-    """Get MIME type for the audio response."""
-    if is_passthrough:
-        ext = file_path.suffix.lower()
-        mime_types = {
-            ".mp3": "audio/mpeg",
-            ".wav": "audio/wav",
-            ".flac": "audio/flac",
-            ".ogg": "audio/ogg",
-            ".m4a": "audio/mp4",
-            ".mp4": "audio/mp4",
-        }
-        return mime_types.get(ext, "audio/mpeg")
-    # Transcoded output is always MP3
-    return "audio/mpeg"
 
+class MediaFileResponse(FileResponse):
+    """FileResponse that reads the file in the configured chunk size.
 
-@router.get(
-    "/{path:path}",
-    responses={404: {"model": ErrorResponse}},
-)
-async def stream_audio(path: str):
-    """Stream audio file, transcoding if necessary.
-    
-    Uses FileResponse for cached files and MP3 passthrough to support
-    Range requests (seeking/resume). Falls back to StreamingResponse
-    for initial transcoding.
+    Starlette reads the file on worker threads, or leaves sending it to the
+    server where the server supports zero-copy ``pathsend``, so serving a
+    file never blocks the event loop.
     """
-    settings = get_settings()
 
-    # Validate path
-    if not is_safe_path(settings.media_path, path):
-        raise HTTPException(status_code=404, detail="File not found")
+    def __init__(self, path: Path, settings: Settings, **kwargs: Any) -> None:
+        super().__init__(path, **kwargs)
+        self.chunk_size = settings.stream_chunk_size
 
-    # Resolve full path
-    decoded_path = decode_path(path)
-    file_path = settings.media_path / decoded_path
 
-    if not file_path.exists() or not file_path.is_file():
-        raise HTTPException(status_code=404, detail="File not found")
+class PinnedFileResponse(MediaFileResponse):
+    """FileResponse for a cache entry that is released from its pin once sent."""
 
-    # Check if file extension is allowed
-    ext = get_file_extension(file_path.name)
-    if ext not in settings.allowed_extensions_set:
-        raise HTTPException(status_code=404, detail="File type not supported")
+    def __init__(
+        self, path: Path, index: CacheIndex, settings: Settings, **kwargs: Any
+    ) -> None:
+        super().__init__(path, settings, **kwargs)
+        self.index = index
 
-    # Determine if passthrough (original MP3)
-    is_passthrough = is_mp3_passthrough(file_path)
-    
-    # For MP3 passthrough, use FileResponse directly (supports Range requests)
-    if is_passthrough:
-        return FileResponse(
-            file_path,
-            media_type="audio/mpeg",
-            headers={"Cache-Control": "public, max-age=3600"},
-        )
-    
-    # Check for cached transcoded file
-    cached_path = get_cached_path(file_path, settings)
-    
-    if cached_path.exists():
-        # Cached file exists - use FileResponse (supports Range requests)
-        return FileResponse(
-            cached_path,
-            media_type="audio/mpeg",
-            headers={"Cache-Control": "public, max-age=3600"},
-        )
-    
-    # No cache - transcode first, then return FileResponse
-    # This ensures the file is complete before serving (for Range support)
-    success = await asyncio.get_event_loop().run_in_executor(
-        None, transcode_to_cache, file_path, cached_path, settings
-    )
-    
-    if success and cached_path.exists():
-        return FileResponse(
-            cached_path,
-            media_type="audio/mpeg",
-            headers={"Cache-Control": "public, max-age=3600"},
-        )
-    
-    # Fallback: stream original file if transcoding failed
-    content_type = get_content_type(file_path, True)
-    return StreamingResponse(
-        stream_transcoded(file_path, settings),
-        media_type=content_type,
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await release_pin(self.index, Path(self.path))
+
+
+class PinnedStreamingResponse(StreamingResponse):
+    """StreamingResponse reading a pinned cache entry, released from its pin once sent."""
+
+    def __init__(self, content: Any, path: Path, index: CacheIndex, **kwargs: Any) -> None:
+        super().__init__(content, **kwargs)
+        self.path = path
+        self.index = index
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await release_pin(self.index, self.path)
+
+
+async def release_pin(index: CacheIndex, path: Path) -> None:
+    """Unpin a cache file once its response is over."""
+    # Shielded so the pin is still released when the client disconnects
+    await asyncio.shield(asyncio.to_thread(index.unpin, path))
+
+
+def get_stream_etag(source: str | Path, mtime: float, size: int, profile: str | None) -> str:
+    """Get the ETag of a source file served in an output profile, or as-is with None.
+
+    The cache entry a transcode is served from is identified by its source
+    and profile, so the ETag is the same while it is encoding and once it
+    is cached.
+    """
+    return make_etag(source, mtime, size, profile or "source")
+
+
+def pin_cache_entry(index: CacheIndex, entry: CacheEntry) -> os.stat_result | None:
+    """Pin an entry's file and record the hit, or drop the entry if its file is damaged.
+
+    Returns the file's stat, or None if it is missing or has the wrong size
+    (blocking).
+    """
+    cached_path = index.path_of(entry)
+
+    # Pinned before it's checked, so no worker can evict it before it's sent
+    stat_result = index.pin(cached_path)
+    if stat_result is None or stat_result.st_size != entry.size:
+        if stat_result is not None:
+            index.unpin(cached_path)
+        index.discard(entry)
+        return None
+
+    index.touch(entry)
+    return stat_result
+
+
+async def cached_file_response(
+    index: CacheIndex, entry: CacheEntry, settings: Settings
+) -> FileResponse | None:
+    """Serve a cache entry with Range support, or None if its file is missing or damaged."""
+    stat_result = await asyncio.to_thread(pin_cache_entry, index, entry)
+    if stat_result is None:
+        return None
+
+    return PinnedFileResponse(
+        index.path_of(entry),
+        index,
+        settings,
+        stat_result=stat_result,
+        media_type=get_output_codec(settings).media_type,
         headers={
-            "Accept-Ranges": "none",  # No Range support for fallback
             "Cache-Control": "public, max-age=3600",
+            "Vary": VARY,
+            "ETag": get_stream_etag(
+                entry.source, entry.source_mtime, entry.source_size, entry.profile
+            ),
         },
     )
 
 
+def get_request_settings(settings: Settings, profile: str | None) -> Settings:
+    """Get the settings for the output profile a request asked for."""
+    try:
+        return get_profile_settings(settings, profile or settings.default_profile)
+    except KeyError:
+        raise HTTPException(status_code=400, detail="Unknown profile") from None
+
+
+def get_client_formats(formats: str | None, accept: str | None) -> set[str]:
+    """Get the source formats a client can play as they are.
+
+    The frontend lists them in ``formats`` as extensions; other clients can
+    name them as audio media types in the Accept header. Wildcards such as
+    ``audio/*`` say nothing about which codecs the client has and are ignored.
+    """
+    if formats:
+        return {ext.strip().lower().lstrip(".") for ext in formats.split(",") if ext.strip()}
+    if not accept:
+        return set()
+
+    accepted = set()
+    for item in accept.split(","):
+        media_type, *params = (part.strip() for part in item.split(";"))
+        quality = next((param[2:] for param in params if param.startswith("q=")), "1")
+        try:
+            if float(quality) <= 0:
+                continue  # q=0 means "not acceptable"
+        except ValueError:
+            continue
+        accepted.add(media_type.lower())
+    return {ext for ext, media_type in SOURCE_MEDIA_TYPES.items() if media_type in accepted}
+
+
+def get_content_type(file_path: Path) -> str:
+    """Get MIME type for serving a source file as it is."""
+    return SOURCE_MEDIA_TYPES.get(get_file_extension(file_path.name), "audio/mpeg")
+
+
+def is_playback_start(request: Request) -> bool:
+    """Check whether a request starts a track rather than seeking within it."""
+    range_header = request.headers.get("range")
+    return range_header is None or range_header.replace(" ", "").startswith("bytes=0-")
+
+
+def find_library_file(path: str, settings: Settings) -> Path | None:
+    """Get the file a stream path points at, or None if it isn't a file in the library.
+
+    Blocking; resolving the path and checking the file both touch the disk.
+    """
+    if not is_safe_path(settings.media_path, path):
+        return None
+    file_path = settings.media_path / decode_path(path)
+    return file_path if file_path.is_file() else None
+
+
+# Registered before the catch-all stream route, which would otherwise match it
 @router.get(
     "/{path:path}/info",
     response_model=AudioInfo,
@@ -122,20 +212,15 @@ async def get_audio_metadata(path: str) -> AudioInfo:
     """Get metadata for an audio file."""
     settings = get_settings()
 
-    # Validate path
-    if not is_safe_path(settings.media_path, path):
+    file_path = await run_blocking(settings, find_library_file, path, settings)
+    if file_path is None:
         raise HTTPException(status_code=404, detail="File not found")
 
-    # Resolve full path
-    decoded_path = decode_path(path)
-    file_path = settings.media_path / decoded_path
+    # Probed once per file version, then served from the metadata cache
+    info = await load_audio_info(file_path, settings)
+    if info is None:
+        info = {"duration": 0, "bitrate": None, "sample_rate": None, "channels": None}
 
-    if not file_path.exists() or not file_path.is_file():
-        raise HTTPException(status_code=404, detail="File not found")
-
-    # Get audio info
-    info = get_audio_info(file_path)
-    
     return AudioInfo(
         filename=file_path.name,
         duration=info["duration"],
@@ -144,3 +229,263 @@ async def get_audio_metadata(path: str) -> AudioInfo:
         sample_rate=info["sample_rate"],
         channels=info["channels"],
     )
+
+
+async def resolve_audio_file(path: str, settings: Settings) -> Path:
+    """Resolve a stream path to an allowed audio file, or raise 404."""
+    file_path = await run_blocking(settings, find_library_file, path, settings)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if get_file_extension(file_path.name) not in settings.allowed_extensions_set:
+        raise HTTPException(status_code=404, detail="File type not supported")
+    return file_path
+
+
+@router.get(
+    "/{path:path}/hls/" + PLAYLIST_NAME,
+    responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}},
+)
+async def get_hls_playlist(
+    path: str,
+    profile: str | None = Query(None, description="Output profile: low, standard or high"),
+    x_audio_profile: str | None = Header(None),
+) -> Response:
+    """Get the HLS playlist of a track.
+
+    Every segment is listed straight away; segments are encoded when first
+    requested, starting from wherever the player asks for. Segment URIs
+    carry the requested profile, since players don't repeat the header.
+    """
+    profile = profile or x_audio_profile
+    settings = get_request_settings(get_settings(), profile)
+    file_path = await resolve_audio_file(path, settings)
+
+    info = await load_audio_info(file_path, settings)
+    if info is None or not info["duration"]:
+        raise HTTPException(status_code=404, detail="Duration unknown")
+
+    query = "?" + urlencode({"profile": profile}) if profile else ""
+    return Response(
+        build_playlist(info["duration"], settings.hls_segment_duration, query),
+        media_type="application/vnd.apple.mpegurl",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get(
+    "/{path:path}/hls/{segment}",
+    responses={
+        400: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+        503: {"model": ErrorResponse},
+    },
+)
+async def get_hls_segment(
+    path: str,
+    segment: str,
+    profile: str | None = Query(None, description="Output profile: low, standard or high"),
+    x_audio_profile: str | None = Header(None),
+) -> FileResponse:
+    """Get one MPEG-TS segment of a track, waiting for it to be encoded."""
+    settings = get_request_settings(get_settings(), profile or x_audio_profile)
+    file_path = await resolve_audio_file(path, settings)
+
+    index = parse_segment_name(segment)
+    info = await load_audio_info(file_path, settings)
+    if index is None or info is None or not info["duration"]:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    if index >= get_segment_count(info["duration"], settings.hls_segment_duration):
+        raise HTTPException(status_code=404, detail="Segment not found")
+
+    encode = await load_hls_encode(file_path, info["duration"], settings)
+    cache_index = get_cache_index(settings)
+    # Segments are evictable; one evicted before it could be pinned is encoded again
+    for _ in range(2):
+        segment_path = await encode.segment(index)
+        if segment_path is None:
+            raise HTTPException(status_code=503, detail="Transcoding failed")
+        stat_result = await asyncio.to_thread(cache_index.pin, segment_path)
+        if stat_result is not None:
+            return PinnedFileResponse(
+                segment_path,
+                cache_index,
+                settings,
+                stat_result=stat_result,
+                media_type="video/mp2t",
+                headers={"Cache-Control": "public, max-age=3600"},
+            )
+    raise HTTPException(status_code=503, detail="Segment evicted")
+
+
+@router.get(
+    "/{path:path}",
+    responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}},
+)
+async def stream_audio(
+    path: str,
+    request: Request,
+    t: float | None = Query(None, ge=0, description="Start playback this many seconds in"),
+    profile: str | None = Query(None, description="Output profile: low, standard or high"),
+    formats: str | None = Query(
+        None, description="Comma-separated source formats the client plays natively, e.g. flac,ogg"
+    ),
+    x_audio_profile: str | None = Header(None),
+    accept: str | None = Header(None),
+) -> Response:
+    """Stream audio file, transcoding if necessary.
+    
+    Uses FileResponse for cached files and MP3 passthrough to support
+    Range requests (seeking/resume). On a cache miss, FFmpeg output is
+    streamed to the client while it is written to the cache. Starting a
+    track also queues background transcodes of the tracks that follow it.
+
+    With ``t``, the response starts ``t`` seconds into the track, encoded
+    on the fly; use it to seek where Range requests aren't available yet.
+
+    ``profile`` (or the X-Audio-Profile header) picks the output codec and
+    bitrate; each profile is cached separately. MP3 files, and files in a
+    format listed in ``formats`` (or the Accept header), are passed through
+    whatever the profile.
+    """
+    settings = get_request_settings(get_settings(), profile or x_audio_profile)
+    codec = get_output_codec(settings)
+    client_formats = get_client_formats(formats, accept)
+
+    # Validate path
+    if not await run_blocking(settings, is_safe_path, settings.media_path, path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # Resolve full path
+    file_path = settings.media_path / decode_path(path)
+
+    # Determine if passthrough (original MP3, or a format the client plays)
+    is_passthrough = is_native_passthrough(file_path, client_formats)
+
+    # A recently verified cache entry is served without touching the source
+    index = get_cache_index(settings)
+    output_profile = get_output_profile(settings)
+    entry = (
+        None
+        if is_passthrough
+        else await run_blocking(settings, index.lookup, file_path, output_profile)
+    )
+
+    if entry is None:
+        if not await run_blocking(settings, file_path.is_file):
+            raise HTTPException(status_code=404, detail="File not found")
+
+        # Check if file extension is allowed
+        ext = get_file_extension(file_path.name)
+        if ext not in settings.allowed_extensions_set:
+            raise HTTPException(status_code=404, detail="File type not supported")
+
+    # Warm the cache for the next tracks so switching songs doesn't stall
+    if not t and is_playback_start(request):
+        schedule_prefetch(file_path, settings, client_formats)
+
+    if t:
+        # Seek: copy from the cached file if there is one, otherwise encode
+        # from the offset while the full encode fills the cache. The cached
+        # file is pinned until the response ends, so eviction can't delete it
+        # while FFmpeg is reading it.
+        pinned = (
+            entry is not None
+            and await asyncio.to_thread(pin_cache_entry, index, entry) is not None
+        )
+        if entry is not None and pinned:
+            source, cache_path = index.path_of(entry), None
+        elif is_passthrough:
+            source, cache_path = file_path, None
+        else:
+            source = file_path
+            cache_path = await run_blocking(settings, get_cached_path, file_path, settings)
+        content = stream_seek(source, settings, t, cache_path=cache_path)
+        seek_kwargs: dict[str, Any] = {
+            # MP3 input is copied rather than re-encoded
+            "media_type": "audio/mpeg" if is_mp3_passthrough(source) else codec.media_type,
+            "headers": {
+                "Accept-Ranges": "none",
+                "Cache-Control": "no-store",  # Partial output; don't cache as the track
+            },
+        }
+        if pinned:
+            return PinnedStreamingResponse(content, source, index, **seek_kwargs)
+        return StreamingResponse(content, **seek_kwargs)
+
+    # Answer revalidations before opening anything or starting an encode
+    if entry is not None:
+        etag = get_stream_etag(entry.source, entry.source_mtime, entry.source_size, entry.profile)
+    else:
+        source_stat = await run_blocking(settings, file_path.stat)
+        etag = get_stream_etag(
+            file_path,
+            source_stat.st_mtime,
+            source_stat.st_size,
+            None if is_passthrough else output_profile,
+        )
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=304,
+            headers={"Cache-Control": "public, max-age=3600", "Vary": VARY, "ETag": etag},
+        )
+
+    # For passthrough, use FileResponse directly (supports Range requests)
+    if is_passthrough:
+        return MediaFileResponse(
+            file_path,
+            settings,
+            stat_result=source_stat,
+            media_type=get_content_type(file_path),
+            headers={"Cache-Control": "public, max-age=3600", "Vary": VARY, "ETag": etag},
+        )
+    
+    # Check for cached transcoded file
+    if entry is not None:
+        # Cached file exists - use FileResponse (supports Range requests)
+        response = await cached_file_response(index, entry, settings)
+        if response is not None:
+            return response
+        cached_path = index.path_of(entry)
+    else:
+        cached_path = await run_blocking(settings, get_cached_path, file_path, settings)
+    
+    # No cache - stream FFmpeg output and fill the cache at the same time.
+    # Concurrent requests for the same file share one encode, and Range
+    # requests work once it has finished and been cached.
+    job = get_transcode_job(file_path, cached_path, settings)
+    await job.started.wait()
+
+    if job.finished.is_set() and job.succeeded:
+        # Another worker had just finished it
+        entry = await run_blocking(settings, index.lookup, file_path, output_profile)
+        response = (
+            await cached_file_response(index, entry, settings) if entry is not None else None
+        )
+        if response is not None:
+            return response
+
+    if not job.spawn_failed:
+        return StreamingResponse(
+            job.stream(),
+            media_type=codec.media_type,
+            headers={
+                "Accept-Ranges": "none",  # No Range support while transcoding
+                "Cache-Control": "public, max-age=3600",
+                "Vary": VARY,
+                "ETag": etag,
+            },
+        )
+    
+    # Fallback: serve the original file if FFmpeg could not be started
+    source_stat = await run_blocking(settings, file_path.stat)
+    return MediaFileResponse(
+        file_path,
+        settings,
+        stat_result=source_stat,
+        media_type=get_content_type(file_path),
+        headers={
+            "Cache-Control": "public, max-age=3600",
+            "Vary": VARY,
+            "ETag": get_stream_etag(file_path, source_stat.st_mtime, source_stat.st_size, None),
+        },
+    )
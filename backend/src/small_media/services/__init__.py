@@ -5,7 +5,6 @@ from .transcoder import (
     ensure_cache_dir,
     get_audio_info,
     get_cached_path,
-    stream_transcoded,
 )
 
 __all__ = [
@@ -15,6 +14,5 @@ __all__ = [
     "ensure_cache_dir",
     "get_audio_info",
     "get_cached_path",
-    "stream_transcoded",
 ]
 
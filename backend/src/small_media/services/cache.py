@@ -0,0 +1,467 @@
+"""Transcode cache index, accounting and eviction."""
+
+import asyncio
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from ..config import Settings
+
+INDEX_FILENAME = "cache-index.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    source TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    source_size INTEGER NOT NULL,
+    source_mtime REAL NOT NULL,
+    cache_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    exit_status INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (source, profile)
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE INDEX IF NOT EXISTS entries_cache_name ON entries (cache_name);
+"""
+
+# Column order matching the CacheEntry fields
+ENTRY_COLUMNS = (
+    "source, profile, source_size, source_mtime, cache_name, size, last_access, hits, exit_status"
+)
+
+
+@dataclass
+class CacheEntry:
+    """A transcoded file in the cache and the source it was made from.
+
+    ``size`` and ``exit_status`` form the entry's integrity manifest: only
+    clean encoder exits are recorded, and a file whose size no longer
+    matches is treated as corrupt.
+    """
+
+    source: str
+    profile: str
+    source_size: int
+    source_mtime: float
+    cache_name: str
+    size: int
+    last_access: float
+    hits: int = 0
+    exit_status: int = 0
+    checked_at: float = 0.0  # Monotonic time the source was last verified
+
+
+def pin_file(cache_path: Path) -> tuple[int, os.stat_result] | None:
+    """Take a shared lock on a cache file, protecting it from every worker's eviction.
+
+    Returns the descriptor holding the lock and the file's stat, or None if
+    the file is missing or being deleted. Locks on the file itself are seen
+    by all worker processes and go away with a process that dies.
+    """
+    try:
+        fd = os.open(cache_path, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        stat = os.fstat(fd)
+        # Make sure the file wasn't unlinked or replaced before we locked it
+        if os.stat(cache_path).st_ino == stat.st_ino:
+            return fd, stat
+    except (BlockingIOError, FileNotFoundError):
+        pass
+    os.close(fd)
+    return None
+
+
+def remove_unpinned(cache_path: Path, inode: int | None = None) -> bool:
+    """Delete a cache file unless a worker has it pinned.
+
+    With ``inode``, only that version of the file is deleted. Returns False
+    if the file was kept, True if it was deleted or is already gone.
+    """
+    try:
+        fd = os.open(cache_path, os.O_RDONLY)
+    except FileNotFoundError:
+        return True
+    try:
+        if inode is not None and os.fstat(fd).st_ino != inode:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            if os.stat(cache_path).st_ino != os.fstat(fd).st_ino:
+                return False  # Replaced since we opened it
+            os.unlink(cache_path)
+        except FileNotFoundError:
+            pass
+        return True
+    finally:
+        os.close(fd)
+
+
+class CacheIndex:
+    """Persistent index of cache entries keyed by source file and output profile.
+
+    Rows live in SQLite inside the cache directory, so they survive restarts
+    and are shared by worker processes. Entries looked up recently are kept
+    in memory and trusted for ``ttl`` seconds without touching the source
+    file. The running total size drives least-recently-used eviction, which
+    skips files pinned by any worker while they are being served.
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int = 0, ttl: float = 30.0) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size  # Bytes, 0 = unlimited
+        self.ttl = ttl
+        self.total_size = 0
+        self._memory: dict[tuple[str, str], CacheEntry] = {}
+        self._pins: dict[str, list[int]] = {}  # Lock descriptors of pinned files by name
+        # Eviction runs on a worker thread
+        self._lock = threading.RLock()
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            cache_dir / INDEX_FILENAME, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(entries)")}
+        if "exit_status" not in columns:
+            # Index created before the integrity manifest was added
+            self._db.execute(
+                "ALTER TABLE entries ADD COLUMN exit_status INTEGER NOT NULL DEFAULT 0"
+            )
+        self._sync_total()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._db.close()
+
+    def load(self) -> None:
+        """Drop rows whose cache files are gone and total up the rest."""
+        with self._lock:
+            rows = self._db.execute("SELECT source, profile, cache_name FROM entries").fetchall()
+            missing = [
+                (source, profile)
+                for source, profile, cache_name in rows
+                if not (self.cache_dir / cache_name).exists()
+            ]
+            self._db.executemany(
+                "DELETE FROM entries WHERE source = ? AND profile = ?", missing
+            )
+            self._memory.clear()
+            self._sync_total()
+
+    def cache_names(self) -> set[str]:
+        """Names of every indexed cache file."""
+        with self._lock:
+            return {name for (name,) in self._db.execute("SELECT cache_name FROM entries")}
+
+    def name_of(self, cache_path: Path) -> str:
+        """Get the name a cache file is indexed under, its path within the cache."""
+        return cache_path.relative_to(self.cache_dir).as_posix()
+
+    def has_file(self, cache_path: Path) -> bool:
+        """Check whether a cache file has an index entry."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM entries WHERE cache_name = ? LIMIT 1", (self.name_of(cache_path),)
+            ).fetchone()
+        return row is not None
+
+    def _sync_total(self) -> None:
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        self.total_size = total
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return int(count)
+
+    def path_of(self, entry: CacheEntry) -> Path:
+        """Get the cache file of an entry."""
+        return self.cache_dir / entry.cache_name
+
+    def lookup(self, file_path: Path, profile: str) -> CacheEntry | None:
+        """Find the cache entry for a source file, or None on a miss.
+
+        Entries verified within the last ``ttl`` seconds are returned from
+        memory. Otherwise the source is stat'ed once and compared with the
+        size and mtime the entry was made from; stale entries are removed.
+        """
+        key = (str(file_path), profile)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry.checked_at < self.ttl:
+                return entry
+
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+
+        with self._lock:
+            if entry is None:
+                row = self._db.execute(
+                    f"SELECT {ENTRY_COLUMNS} FROM entries WHERE source = ? AND profile = ?", key
+                ).fetchone()
+                if row is None:
+                    return None
+                entry = CacheEntry(*row)
+
+            if entry.source_size != stat.st_size or entry.source_mtime != stat.st_mtime:
+                # Source changed since it was transcoded
+                self._remove(entry)
+                return None
+
+            entry.checked_at = now
+            self._memory[key] = entry
+            return entry
+
+    def record(
+        self,
+        file_path: Path,
+        profile: str,
+        cache_path: Path,
+        source_stat: os.stat_result | None = None,
+        exit_status: int = 0,
+        expected_size: int | None = None,
+    ) -> CacheEntry | None:
+        """Add or replace the entry for a freshly written cache file.
+
+        Files from a failed encode, or that don't have the size the encoder
+        produced, are deleted instead of being recorded.
+        """
+        try:
+            size = cache_path.stat().st_size
+            stat = source_stat or file_path.stat()
+        except OSError:
+            return None
+
+        if exit_status != 0 or (expected_size is not None and size != expected_size):
+            cache_path.unlink(missing_ok=True)
+            return None
+
+        entry = CacheEntry(
+            source=str(file_path),
+            profile=profile,
+            source_size=stat.st_size,
+            source_mtime=stat.st_mtime,
+            cache_name=self.name_of(cache_path),
+            size=size,
+            last_access=time.time(),
+            exit_status=exit_status,
+            checked_at=time.monotonic(),
+        )
+        with self._lock:
+            previous = self._db.execute(
+                "SELECT size, cache_name FROM entries WHERE source = ? AND profile = ?",
+                (entry.source, profile),
+            ).fetchone()
+            self._db.execute(
+                f"INSERT OR REPLACE INTO entries ({ENTRY_COLUMNS}) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    entry.source,
+                    profile,
+                    entry.source_size,
+                    entry.source_mtime,
+                    entry.cache_name,
+                    entry.size,
+                    entry.last_access,
+                    entry.hits,
+                    entry.exit_status,
+                ),
+            )
+            self.total_size += size - (previous[0] if previous else 0)
+            self._memory[(entry.source, profile)] = entry
+        if previous and previous[1] != entry.cache_name:
+            # Made from an older version of the source
+            remove_unpinned(self.cache_dir / previous[1])
+        return entry
+
+    def touch(self, entry: CacheEntry) -> None:
+        """Record a cache hit."""
+        entry.last_access = time.time()
+        entry.hits += 1
+        with self._lock:
+            self._db.execute(
+                "UPDATE entries SET last_access = ?, hits = hits + 1 "
+                "WHERE source = ? AND profile = ?",
+                (entry.last_access, entry.source, entry.profile),
+            )
+
+    def discard(self, entry: CacheEntry) -> None:
+        """Remove an entry and its cache file."""
+        with self._lock:
+            self._remove(entry)
+
+    def _remove(self, entry: CacheEntry) -> None:
+        deleted = self._db.execute(
+            "DELETE FROM entries WHERE source = ? AND profile = ?",
+            (entry.source, entry.profile),
+        ).rowcount
+        if deleted:
+            self.total_size -= entry.size
+        self._memory.pop((entry.source, entry.profile), None)
+        # A pinned file outlives its row; the last unpin() deletes it
+        remove_unpinned(self.path_of(entry))
+
+    def clear(self) -> None:
+        """Forget every entry."""
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._memory.clear()
+            self.total_size = 0
+
+    def pin(self, cache_path: Path) -> os.stat_result | None:
+        """Protect a cache file from deletion by any worker while it is being served.
+
+        Returns the file's stat, or None (and takes no pin) if it is gone.
+        """
+        pinned = pin_file(cache_path)
+        if pinned is None:
+            return None
+        fd, stat = pinned
+        with self._lock:
+            self._pins.setdefault(self.name_of(cache_path), []).append(fd)
+        return stat
+
+    def unpin(self, cache_path: Path) -> None:
+        """Release a pin taken with pin().
+
+        A file whose entry was removed while it was pinned is deleted once
+        no worker has it pinned any more.
+        """
+        name = self.name_of(cache_path)
+        with self._lock:
+            fds = self._pins[name]
+            fd = fds.pop()
+            if not fds:
+                del self._pins[name]
+            inode = os.fstat(fd).st_ino
+            os.close(fd)
+            if fds or self.has_file(cache_path):
+                return
+        remove_unpinned(cache_path, inode)
+
+    def over_limit(self) -> bool:
+        """Check whether the cache has grown past its size limit."""
+        return 0 < self.max_size < self.total_size
+
+    def evict(self) -> list[Path]:
+        """Delete least recently used entries until the cache fits its limit.
+
+        Returns the cache files that were removed.
+        """
+        removed = []
+        with self._lock:
+            # Other worker processes add entries too
+            self._sync_total()
+            rows = self._db.execute(
+                f"SELECT {ENTRY_COLUMNS} FROM entries ORDER BY last_access"
+            ).fetchall()
+            for row in rows:
+                if not self.over_limit():
+                    break
+                entry = CacheEntry(*row)
+                if not remove_unpinned(self.path_of(entry)):
+                    continue  # Being served
+                self._remove(entry)
+                removed.append(self.path_of(entry))
+        return removed
+
+    def stats(self) -> dict[str, Any]:
+        """Current cache size, limit and hit count."""
+        with self._lock:
+            count, hits = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM entries"
+            ).fetchone()
+            return {
+                "entries": count,
+                "total_size": self.total_size,
+                "max_size": self.max_size,
+                "hits": hits,
+                "pinned": len(self._pins),  # In this process only
+            }
+
+
+_indexes: dict[Path, CacheIndex] = {}
+_eviction: asyncio.Task[list[Path]] | None = None
+
+
+def get_cache_index(settings: Settings) -> CacheIndex:
+    """Get the process-wide index for the configured cache directory."""
+    index = _indexes.get(settings.cache_path)
+    if index is None:
+        index = CacheIndex(
+            settings.cache_path,
+            max_size=settings.cache_max_size_mb * 1024 * 1024,
+            ttl=settings.cache_index_ttl,
+        )
+        _indexes[settings.cache_path] = index
+    return index
+
+
+def get_output_profile(settings: Settings) -> str:
+    """Identify the encoder settings a cache entry was made with."""
+    if settings.audio_codec == "opus":
+        return f"opus-{settings.audio_bitrate}k"
+    return f"mp3-q{settings.audio_quality}-{settings.audio_bitrate}k"
+
+
+def schedule_eviction(settings: Settings) -> None:
+    """Start a background eviction pass if the cache is over its limit."""
+    global _eviction
+    index = get_cache_index(settings)
+    if not index.over_limit() or (_eviction is not None and not _eviction.done()):
+        return
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # Called from a worker thread: evict in place
+        index.evict()
+        return
+    _eviction = asyncio.create_task(asyncio.to_thread(index.evict))
+
+
+def record_cache_entry(
+    file_path: Path,
+    cache_path: Path,
+    settings: Settings,
+    exit_status: int = 0,
+    expected_size: int | None = None,
+) -> bool:
+    """Index a newly written cache file and evict if needed.
+
+    Returns False if the file failed its integrity check and was removed.
+    """
+    entry = get_cache_index(settings).record(
+        file_path,
+        get_output_profile(settings),
+        cache_path,
+        exit_status=exit_status,
+        expected_size=expected_size,
+    )
+    schedule_eviction(settings)
+    return entry is not None
+
+
+async def load_cache_index(settings: Settings) -> None:
+    """Reconcile the index with the cache at startup, then evict if over the limit."""
+    await asyncio.to_thread(get_cache_index(settings).load)
+    schedule_eviction(settings)
@@ -0,0 +1,50 @@
+"""Validators for conditional GET requests."""
+
+import hashlib
+import os
+from collections.abc import Iterable
+from pathlib import Path
+
+
+def make_etag(*parts: object) -> str:
+    """Build a strong ETag from the values a response is derived from."""
+    key_data = ":".join(str(part) for part in parts)
+    return f'"{hashlib.sha256(key_data.encode()).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Check an If-None-Match header against the current ETag.
+
+    If-None-Match uses weak comparison, so a ``W/`` prefix is ignored.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in tags
+
+
+def hash_folder_entries(mtime_ns: int, entries: Iterable[tuple[str, int, int]]) -> str:
+    """Hash a folder's mtime and the (name, mtime, size) of each of its entries."""
+    parts = sorted(f"{name}/{entry_mtime_ns}/{size}" for name, entry_mtime_ns, size in entries)
+    return hashlib.sha256("\n".join([str(mtime_ns), *parts]).encode()).hexdigest()
+
+
+def get_folder_signature(folder_path: Path) -> str:
+    """Summarize a folder's entries for deriving ETags (blocking).
+
+    Covers the folder's own mtime and the name, mtime and size of each
+    entry. A subfolder's mtime changes when entries are added to or removed
+    from it, so this also tracks what a listing says about subfolders
+    without reading them. Raises OSError if the folder can't be read.
+    """
+    entries = []
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # Broken symlink
+            entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+    return hash_folder_entries(folder_path.stat().st_mtime_ns, entries)
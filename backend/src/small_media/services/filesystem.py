@@ -1,11 +1,20 @@
 """File system operations for media library."""
 
+import os
 import urllib.parse
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any
 
 from ..config import Settings
 from ..models import AudioFile, FolderContents, FolderItem
 
+LISTING_BATCH_SIZE = 64  # Subfolders summarized at a time while iterating a listing
+
+# A listing entry: "folder" or "file", with a dict shaped like FolderItem or AudioFile
+ListingEntry = tuple[str, dict[str, Any]]
+
 
 def is_safe_path(base_path: Path, requested_path: str) -> bool:
     """Check if the requested path is safe (no directory traversal)."""
@@ -26,7 +35,11 @@ def is_safe_path(base_path: Path, requested_path: str) -> bool:
 
 def get_file_extension(filename: str) -> str:
     """Get lowercase file extension without the dot."""
-    return Path(filename).suffix.lower().lstrip(".")
+    # Same rules as Path.suffix, without building a path for every name listed
+    dot = filename.rfind(".")
+    if 0 < dot < len(filename) - 1:
+        return filename[dot + 1 :].lower()
+    return ""
 
 
 def is_audio_file(filename: str, allowed_extensions: set[str]) -> bool:
@@ -44,54 +57,131 @@ def decode_path(encoded_path: str) -> str:
     return urllib.parse.unquote(encoded_path)
 
 
-def folder_has_audio(folder_path: Path, allowed_extensions: set[str]) -> bool:
-    """Check if a folder contains any audio files (non-recursive)."""
+def get_path_prefix(relative_dir: Path) -> str:
+    """Get the URL-encoded prefix of paths in a folder, given relative to the media root.
+
+    Encoding the folder once and each name on its own gives the same path
+    as encoding the joined path, for a fraction of the cost in big listings.
+    """
+    if relative_dir == Path("."):
+        return ""
+    return encode_path(f"{relative_dir}/")
+
+
+def get_folder_name(relative_path: str) -> str:
+    """Get the display name of a folder from its URL-encoded relative path."""
+    if not relative_path:
+        return "Root"
+    return Path(decode_path(relative_path)).name
+
+
+def folder_entry(name: str, path: str, has_audio: bool, subfolder_count: int) -> ListingEntry:
+    """Build the listing entry for a subfolder.
+
+    Entries are built from names we listed ourselves, so they are plain
+    dicts sent as they are rather than models validated field by field.
+    """
+    return "folder", {
+        "name": name,
+        "path": path,
+        "has_audio": has_audio,
+        "subfolder_count": subfolder_count,
+    }
+
+
+def file_entry(filename: str, path: str, size: int) -> ListingEntry:
+    """Build the listing entry for an audio file."""
+    return "file", {
+        "filename": filename,
+        "path": path,
+        "format": get_file_extension(filename),
+        "size": size,
+    }
+
+
+def summarize_folder(folder_path: str, allowed_extensions: set[str]) -> tuple[bool, int]:
+    """Check a folder for audio files and count its subfolders in one pass.
+
+    Entry types come from the directory listing itself, so only symlinks
+    (and filesystems that don't report types) cost a stat.
+    """
+    has_audio = False
+    subfolder_count = 0
     try:
-        for item in folder_path.iterdir():
-            if item.is_file() and is_audio_file(item.name, allowed_extensions):
-                return True
-    except PermissionError:
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        subfolder_count += 1
+                    elif (
+                        not has_audio
+                        and is_audio_file(entry.name, allowed_extensions)
+                        and entry.is_file()
+                    ):
+                        has_audio = True
+                except OSError:
+                    continue
+    except OSError:
         pass
-    return False
+    return has_audio, subfolder_count
 
 
-def count_subfolders(folder_path: Path) -> int:
-    """Count immediate subfolders."""
-    try:
-        return sum(1 for item in folder_path.iterdir() if item.is_dir())
-    except PermissionError:
-        return 0
+_listing_pool: ThreadPoolExecutor | None = None
+
+
+def get_listing_pool(settings: Settings) -> ThreadPoolExecutor:
+    """Get the thread pool subfolders of a listing are read on."""
+    global _listing_pool
+    if _listing_pool is None:
+        _listing_pool = ThreadPoolExecutor(
+            max_workers=max(1, settings.listing_concurrency),
+            thread_name_prefix="listing",
+        )
+    return _listing_pool
 
 
 def list_folders(base_path: Path, relative_path: str, settings: Settings) -> list[FolderItem]:
-    """List folders in a directory."""
+    """List folders in a directory.
+
+    Subfolders are read in parallel, each in a single pass, which matters
+    on network mounts where every directory read is a round trip.
+    """
     if relative_path:
         full_path = base_path / decode_path(relative_path)
     else:
         full_path = base_path
 
-    if not full_path.exists() or not full_path.is_dir():
+    try:
+        with os.scandir(full_path) as entries:
+            children = [
+                entry
+                for entry in entries
+                if not entry.name.startswith(".") and entry.is_dir()
+            ]
+    except OSError:
         return []
+    children.sort(key=lambda entry: entry.name.lower())
 
-    folders = []
     allowed_ext = settings.allowed_extensions_set
+    if len(children) > 1:
+        summaries = list(
+            get_listing_pool(settings).map(
+                lambda entry: summarize_folder(entry.path, allowed_ext), children
+            )
+        )
+    else:
+        summaries = [summarize_folder(entry.path, allowed_ext) for entry in children]
 
-    try:
-        for item in sorted(full_path.iterdir(), key=lambda x: x.name.lower()):
-            if item.is_dir() and not item.name.startswith("."):
-                rel_path = str(item.relative_to(base_path))
-                folders.append(
-                    FolderItem(
-                        name=item.name,
-                        path=encode_path(rel_path),
-                        has_audio=folder_has_audio(item, allowed_ext),
-                        subfolder_count=count_subfolders(item),
-                    )
-                )
-    except PermissionError:
-        pass
-
-    return folders
+    rel_dir = full_path.relative_to(base_path)
+    return [
+        FolderItem(
+            name=entry.name,
+            path=encode_path(str(rel_dir / entry.name)),
+            has_audio=has_audio,
+            subfolder_count=subfolder_count,
+        )
+        for entry, (has_audio, subfolder_count) in zip(children, summaries, strict=True)
+    ]
 
 
 def list_audio_files(base_path: Path, relative_path: str, settings: Settings) -> list[AudioFile]:
@@ -101,30 +191,87 @@ def list_audio_files(base_path: Path, relative_path: str, settings: Settings) ->
     else:
         full_path = base_path
 
-    if not full_path.exists() or not full_path.is_dir():
-        return []
-
     files = []
     allowed_ext = settings.allowed_extensions_set
+    rel_dir = full_path.relative_to(base_path)
 
     try:
-        for item in sorted(full_path.iterdir(), key=lambda x: x.name.lower()):
-            if item.is_file() and is_audio_file(item.name, allowed_ext):
-                rel_path = str(item.relative_to(base_path))
+        with os.scandir(full_path) as entries:
+            for entry in entries:
+                # Check the name first; only audio files need a stat for their size
+                if not is_audio_file(entry.name, allowed_ext):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    size = entry.stat().st_size
+                except OSError:
+                    continue
                 files.append(
                     AudioFile(
-                        filename=item.name,
-                        path=encode_path(rel_path),
-                        format=get_file_extension(item.name),
-                        size=item.stat().st_size,
+                        filename=entry.name,
+                        path=encode_path(str(rel_dir / entry.name)),
+                        format=get_file_extension(entry.name),
+                        size=size,
                     )
                 )
-    except PermissionError:
-        pass
+    except OSError:
+        return []
 
+    files.sort(key=lambda file: file.filename.lower())
     return files
 
 
+def iter_folder_contents(
+    base_path: Path, relative_path: str, settings: Settings, start: int = 0
+) -> Iterator[ListingEntry]:
+    """Yield a folder's subfolders and then its audio files, from position ``start``.
+
+    The folder is listed in one pass up front, but subfolders are read
+    and files stat'ed only as entries are consumed, so a page or a stream
+    costs in proportion to what is sent.
+    """
+    full_path = base_path / decode_path(relative_path) if relative_path else base_path
+
+    allowed_ext = settings.allowed_extensions_set
+    children = []
+    audio = []
+    try:
+        with os.scandir(full_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if not entry.name.startswith("."):
+                            children.append(entry)
+                    elif is_audio_file(entry.name, allowed_ext) and entry.is_file():
+                        audio.append(entry)
+                except OSError:
+                    continue
+    except OSError:
+        return
+    children.sort(key=lambda entry: entry.name.lower())
+    audio.sort(key=lambda entry: entry.name.lower())
+    audio = audio[max(0, start - len(children)) :]
+    children = children[start:]
+
+    prefix = get_path_prefix(full_path.relative_to(base_path))
+    pool = get_listing_pool(settings)
+    for batch_start in range(0, len(children), LISTING_BATCH_SIZE):
+        batch = children[batch_start : batch_start + LISTING_BATCH_SIZE]
+        summaries = pool.map(lambda entry: summarize_folder(entry.path, allowed_ext), batch)
+        for entry, (has_audio, subfolder_count) in zip(batch, summaries, strict=True):
+            yield folder_entry(
+                entry.name, prefix + encode_path(entry.name), has_audio, subfolder_count
+            )
+
+    for entry in audio:
+        try:
+            size = entry.stat().st_size
+        except OSError:
+            continue
+        yield file_entry(entry.name, prefix + encode_path(entry.name), size)
+
+
 def get_folder_contents(
     base_path: Path, relative_path: str, settings: Settings
 ) -> FolderContents | None:
@@ -132,19 +279,21 @@ def get_folder_contents(
     if relative_path and not is_safe_path(base_path, relative_path):
         return None
 
-    if relative_path:
-        full_path = base_path / decode_path(relative_path)
-        name = full_path.name
-    else:
-        full_path = base_path
-        name = "Root"
-
+    full_path = base_path / decode_path(relative_path) if relative_path else base_path
     if not full_path.exists() or not full_path.is_dir():
         return None
 
+    folders = []
+    files = []
+    for kind, data in iter_folder_contents(base_path, relative_path, settings):
+        if kind == "folder":
+            folders.append(FolderItem(**data))
+        else:
+            files.append(AudioFile(**data))
+
     return FolderContents(
         path=relative_path,
-        name=name,
-        folders=list_folders(base_path, relative_path, settings),
-        files=list_audio_files(base_path, relative_path, settings),
+        name=get_folder_name(relative_path),
+        folders=folders,
+        files=files,
     )
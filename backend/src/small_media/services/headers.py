@@ -0,0 +1,275 @@
+"""Read audio metadata straight from container headers.
+
+Covers the formats that make up most libraries (MP3, FLAC, WAV, Ogg
+Vorbis/Opus) so they don't need an ffprobe process each. Every reader
+returns the same dict as ``transcoder.get_audio_info``, or None when the
+file isn't something it understands, in which case callers fall back to
+ffprobe.
+"""
+
+import os
+import struct
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, BinaryIO
+
+HEADER_READ_SIZE = 64 * 1024  # Enough for the headers of every supported format
+OGG_TAIL_SIZE = 64 * 1024  # Last page of an Ogg stream is well within this
+
+# MPEG audio header tables, indexed by version id (0 = 2.5, 2 = 2, 3 = 1)
+MPEG_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+# Bitrates in kbps by (is_mpeg1, layer)
+MPEG_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+
+def _info(
+    duration: float, file_size: int, sample_rate: int | None, channels: int | None
+) -> dict[str, Any]:
+    """Build the metadata dict; bitrate is the overall one, like ffprobe's."""
+    bitrate = int(file_size * 8 / duration) // 1000 if duration > 0 else None
+    return {
+        "duration": duration,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "channels": channels,
+    }
+
+
+def skip_id3v2(f: BinaryIO) -> int:
+    """Position the file after a leading ID3v2 tag, returning that offset."""
+    f.seek(0)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        f.seek(0)
+        return 0
+    # Synchsafe integer: 7 bits per byte
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    offset = 10 + size + (10 if header[5] & 0x10 else 0)  # Footer present
+    f.seek(offset)
+    return offset
+
+
+class MpegFrame:
+    """A parsed MPEG audio frame header."""
+
+    def __init__(self, header: int) -> None:
+        if header >> 21 != 0x7FF:
+            raise ValueError("no frame sync")
+        self.version = (header >> 19) & 0x3
+        layer_bits = (header >> 17) & 0x3
+        bitrate_index = (header >> 12) & 0xF
+        rate_index = (header >> 10) & 0x3
+        if self.version == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+            raise ValueError("invalid frame header")
+
+        self.layer = 4 - layer_bits
+        self.is_mpeg1 = self.version == 3
+        self.bitrate = MPEG_BITRATES[(self.is_mpeg1, self.layer)][bitrate_index] * 1000
+        self.sample_rate = MPEG_SAMPLE_RATES[self.version][rate_index]
+        self.padding = (header >> 9) & 0x1
+        self.channels = 1 if (header >> 6) & 0x3 == 3 else 2
+
+    @property
+    def samples(self) -> int:
+        """Samples per channel in one frame."""
+        if self.layer == 1:
+            return 384
+        if self.layer == 3 and not self.is_mpeg1:
+            return 576
+        return 1152
+
+    @property
+    def length(self) -> int:
+        """Frame size in bytes, including the header."""
+        if self.layer == 1:
+            return (12 * self.bitrate // self.sample_rate + self.padding) * 4
+        return self.samples // 8 * self.bitrate // self.sample_rate + self.padding
+
+    @property
+    def side_info_size(self) -> int:
+        """Size of the Layer III side information after the header."""
+        if self.is_mpeg1:
+            return 17 if self.channels == 1 else 32
+        return 9 if self.channels == 1 else 17
+
+
+def find_mpeg_frame(data: bytes, start: int = 0) -> tuple[int, MpegFrame] | None:
+    """Find the first frame header in ``data`` that is followed by another.
+
+    Checking the next header too rules out sync patterns inside tags or
+    album art.
+    """
+    position = data.find(b"\xff", start)
+    while 0 <= position <= len(data) - 4:
+        try:
+            frame = MpegFrame(struct.unpack_from(">I", data, position)[0])
+        except ValueError:
+            position = data.find(b"\xff", position + 1)
+            continue
+        following = position + frame.length
+        if following + 4 > len(data):
+            return position, frame  # Can't check past the buffer; trust it
+        try:
+            MpegFrame(struct.unpack_from(">I", data, following)[0])
+        except ValueError:
+            position = data.find(b"\xff", position + 1)
+            continue
+        return position, frame
+    return None
+
+
+def read_mp3_info(f: BinaryIO, file_size: int) -> dict[str, Any] | None:
+    """Read an MP3's duration from its Xing/Info or VBRI header.
+
+    Files with neither are assumed to be constant bitrate, and the duration
+    is worked out from the size of the audio data and the first frame's
+    bitrate.
+    """
+    audio_start = skip_id3v2(f)
+    data = f.read(HEADER_READ_SIZE)
+    found = find_mpeg_frame(data)
+    if found is None:
+        return None
+    position, frame = found
+    audio_start += position
+
+    frames = None
+    xing_offset = position + 4 + frame.side_info_size
+    if data[xing_offset : xing_offset + 4] in (b"Xing", b"Info"):
+        (flags,) = struct.unpack_from(">I", data, xing_offset + 4)
+        if flags & 0x1:
+            (frames,) = struct.unpack_from(">I", data, xing_offset + 8)
+    elif data[position + 36 : position + 40] == b"VBRI":
+        (frames,) = struct.unpack_from(">I", data, position + 36 + 14)
+
+    if frames:
+        duration = frames * frame.samples / frame.sample_rate
+    else:
+        audio_end = file_size
+        f.seek(max(0, file_size - 128))
+        if f.read(3) == b"TAG":
+            audio_end -= 128  # ID3v1 tag
+        duration = (audio_end - audio_start) * 8 / frame.bitrate
+
+    return _info(duration, file_size, frame.sample_rate, frame.channels)
+
+
+def read_flac_info(f: BinaryIO, file_size: int) -> dict[str, Any] | None:
+    """Read a FLAC file's STREAMINFO block."""
+    skip_id3v2(f)
+    data = f.read(4 + 4 + 34)
+    if len(data) < 42 or data[:4] != b"fLaC" or data[4] & 0x7F != 0:
+        return None
+
+    streaminfo = data[8:]
+    # 20 bits sample rate, 3 bits channels - 1, 5 bits bits per sample - 1,
+    # 36 bits total samples
+    (packed,) = struct.unpack_from(">Q", streaminfo, 10)
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    if sample_rate == 0 or total_samples == 0:
+        return None  # Unknown length; let ffprobe work it out
+
+    return _info(total_samples / sample_rate, file_size, sample_rate, channels)
+
+
+def read_wav_info(f: BinaryIO, file_size: int) -> dict[str, Any] | None:
+    """Read a WAV file's fmt and data chunks."""
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+
+    fmt = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk)
+        if chunk_id == b"fmt ":
+            fmt = f.read(chunk_size)
+            if len(fmt) < 16:
+                return None
+            f.seek(chunk_size & 1, os.SEEK_CUR)
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            remaining = file_size - f.tell()
+            # Streamed WAVs may carry a placeholder size; trust the file
+            data_size = chunk_size if 0 < chunk_size <= remaining else remaining
+            break
+        else:
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+    _, channels, sample_rate, byte_rate = struct.unpack_from("<HHII", fmt)
+    if byte_rate == 0:
+        return None
+    return _info(data_size / byte_rate, file_size, sample_rate, channels)
+
+
+def read_ogg_info(f: BinaryIO, file_size: int) -> dict[str, Any] | None:
+    """Read an Ogg Vorbis or Opus file's duration from its last granule position."""
+    page = f.read(HEADER_READ_SIZE)
+    if len(page) < 28 or page[:4] != b"OggS":
+        return None
+    segments = page[26]
+    packet = page[27 + segments :]
+
+    if packet[:7] == b"\x01vorbis":
+        channels = packet[11]
+        (sample_rate,) = struct.unpack_from("<I", packet, 12)
+        granule_rate, pre_skip = sample_rate, 0
+    elif packet[:8] == b"OpusHead":
+        channels = packet[9]
+        (pre_skip, sample_rate) = struct.unpack_from("<HI", packet, 10)
+        granule_rate = 48000  # Opus granules always count 48 kHz samples
+    else:
+        return None
+    (serial,) = struct.unpack_from("<I", page, 14)
+
+    f.seek(max(0, file_size - OGG_TAIL_SIZE))
+    tail = f.read()
+    position = tail.rfind(b"OggS")
+    while position >= 0:
+        if len(tail) >= position + 27:
+            granule, page_serial = struct.unpack_from("<qI", tail, position + 6)
+            if page_serial == serial and granule > 0:
+                duration = max(0, granule - pre_skip) / granule_rate
+                return _info(duration, file_size, sample_rate or None, channels)
+        position = tail.rfind(b"OggS", 0, position)
+    return None
+
+
+HEADER_READERS: dict[str, Callable[[BinaryIO, int], dict[str, Any] | None]] = {
+    ".mp3": read_mp3_info,
+    ".flac": read_flac_info,
+    ".wav": read_wav_info,
+    ".ogg": read_ogg_info,
+}
+
+
+def read_audio_info(file_path: Path) -> dict[str, Any] | None:
+    """Read audio metadata from a file's headers.
+
+    Returns None for formats without a reader (m4a, mp4) and for files that
+    don't parse.
+    """
+    reader = HEADER_READERS.get(file_path.suffix.lower())
+    if reader is None:
+        return None
+    try:
+        with open(file_path, "rb") as f:
+            return reader(f, os.fstat(f.fileno()).st_size)
+    except (OSError, struct.error, ValueError, IndexError, KeyError):
+        return None
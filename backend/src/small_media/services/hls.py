@@ -0,0 +1,457 @@
+"""Segmented (HLS) transcoding for long tracks.
+
+Each track is encoded, at the requested output profile's bitrate, into
+fixed-duration MPEG-TS segments under ``cache_path/hls/<cache key>/``. The
+playlist is built up front from the track's duration, so players can seek
+anywhere straight away. Segments are encoded in short batches just ahead
+of the one a player last asked for, so an encode only holds a scheduler
+slot while someone is listening. Finished segments are recorded in the
+cache index like whole-file transcodes, and count towards its size limit;
+an evicted segment is encoded again when it is next asked for.
+"""
+
+import asyncio
+import contextlib
+import math
+import re
+import time
+from pathlib import Path
+
+from ..config import Settings
+from .cache import get_cache_index, get_output_profile, schedule_eviction
+from .storage import run_blocking
+from .transcoder import (
+    HLS_DIRNAME,
+    LOCK_POLL_INTERVAL,
+    TranscodePriority,
+    get_cache_key,
+    get_encoder_args,
+    get_scheduler,
+    lock_cache_entry,
+    lower_priority,
+    stop_process,
+    unlock_cache_entry,
+)
+
+PLAYLIST_NAME = "index.m3u8"
+PARTIAL_DIRNAME = "partial"  # Segments FFmpeg is still writing
+SEGMENT_NAME = re.compile(r"seg(\d{5})\.ts")
+SEGMENT_POLL_INTERVAL = 0.1  # Seconds between checks for finished segments
+SEGMENTS_AHEAD = 3  # Segments kept encoded past the one a player asked for
+LISTENER_TIMEOUT_SEGMENTS = 2  # Segment lengths without a request before encoding stops
+
+
+def get_hls_dir(file_path: Path, settings: Settings) -> Path:
+    """Get the directory a track's segments are stored in."""
+    return settings.cache_path / HLS_DIRNAME / get_cache_key(file_path, settings)
+
+
+def segment_name(index: int) -> str:
+    """File name of a segment."""
+    return f"seg{index:05d}.ts"
+
+
+def parse_segment_name(name: str) -> int | None:
+    """Get the index of a segment from its file name, or None if it isn't one."""
+    match = SEGMENT_NAME.fullmatch(name)
+    return int(match.group(1)) if match else None
+
+
+def get_segment_encoder_args(settings: Settings) -> list[str]:
+    """Get the FFmpeg arguments that encode audio for segments.
+
+    HLS players (Safari, hls.js) don't play Opus from MPEG-TS, so profiles
+    that use it get AAC at the same bitrate instead.
+    """
+    if settings.audio_codec == "opus":
+        return ["-codec:a", "aac", "-b:a", f"{settings.audio_bitrate}k"]
+    return get_encoder_args(settings)
+
+
+def get_segment_profile(settings: Settings, index: int) -> str:
+    """Identify a segment in the cache index, alongside its track's whole-file entry."""
+    if settings.audio_codec == "opus":
+        profile = f"aac-{settings.audio_bitrate}k"
+    else:
+        profile = get_output_profile(settings)
+    return f"{profile}/{HLS_DIRNAME}/{index:05d}"
+
+
+def get_segment_cuts(count: int, segment_duration: int) -> list[int]:
+    """Get where a run of ``count`` segments is cut, in seconds from its start."""
+    return [segment_duration * n for n in range(1, count)]
+
+
+def get_segment_count(duration: float, segment_duration: int) -> int:
+    """Number of segments a track of ``duration`` seconds is split into."""
+    return max(1, math.ceil(duration / segment_duration))
+
+
+def build_playlist(duration: float, segment_duration: int, query: str = "") -> str:
+    """Build the VOD playlist listing every segment of a track.
+
+    ``query`` is appended to each segment's URI, so segment requests carry
+    the same output profile as the playlist request.
+    """
+    count = get_segment_count(duration, segment_duration)
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{segment_duration}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ]
+    for index in range(count):
+        length = min(segment_duration, duration - index * segment_duration)
+        lines += [f"#EXTINF:{length:.3f},", segment_name(index) + query]
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def build_segment_command(
+    file_path: Path, out_dir: Path, settings: Settings, first: int, count: int
+) -> list[str]:
+    """Build the FFmpeg command that encodes ``count`` segments from ``first`` on.
+
+    Segments are written to the ``partial`` subdirectory and moved into
+    ``out_dir`` once complete; the segment muxer won't take a ``.part`` name.
+    The muxer cuts at the given times from the start of the run, and only
+    then shifts timestamps by ``-initial_offset`` to follow on from earlier
+    segments; shifting them before the cut would move the cut points.
+    """
+    segment_duration = settings.hls_segment_duration
+    start = first * segment_duration
+    seek = ["-ss", str(start)] if start else []
+    cuts = get_segment_cuts(count, segment_duration)
+    # A single segment still needs a length, or the muxer cuts every 2 seconds
+    split = (
+        ["-segment_times", ",".join(map(str, cuts))]
+        if cuts
+        else ["-segment_time", str(segment_duration)]
+    )
+    return [
+        "ffmpeg",
+        "-nostdin",
+        "-y",
+        "-threads", str(settings.transcode_threads),
+        *seek,
+        "-i", str(file_path),
+        "-t", str(count * segment_duration),
+        "-vn",
+        *get_segment_encoder_args(settings),
+        "-f", "segment",
+        *split,
+        # Keep timestamps continuous with segments from other runs
+        "-initial_offset", str(start),
+        "-segment_start_number", str(first),
+        "-segment_format", "mpegts",
+        str(out_dir / PARTIAL_DIRNAME / "seg%05d.ts"),
+    ]
+
+
+async def start_segment_process(
+    file_path: Path, out_dir: Path, settings: Settings, first: int, count: int
+) -> asyncio.subprocess.Process:
+    """Start FFmpeg writing a range of segments.
+
+    Raises OSError if FFmpeg cannot be started.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *build_segment_command(file_path, out_dir, settings, first, count),
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    lower_priority(process, settings)
+    return process
+
+
+class HlsEncode:
+    """Produces the segments of one track in one profile, shared by all its listeners.
+
+    Every request makes sure the segments from the one asked for to
+    SEGMENTS_AHEAD past it exist. The process holding the track's lock runs
+    FFmpeg over the first missing stretch, a batch at a time, each batch in
+    its own scheduler slot: interactive when a request is waiting for a
+    segment, otherwise prefetch and preemptible. A batch is cut short when a
+    request seeks outside it, or when nobody has asked for a segment for a
+    while. Other processes wait for the files to appear. Files are only
+    touched from worker threads.
+    """
+
+    def __init__(self, file_path: Path, out_dir: Path, settings: Settings, count: int) -> None:
+        self.file_path = file_path
+        self.out_dir = out_dir
+        self.settings = settings
+        self.count = count
+        self.failed = False
+        self.wanted = 0  # Segment the latest request asked for
+        self.waiters = 0  # Requests waiting for a segment to be encoded
+        self.last_request = time.monotonic()
+        self.batch = range(0)  # Segments the current batch is encoding
+        self._progress = asyncio.Event()
+        self._stop = asyncio.Event()  # Ends the current batch early
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def partial_dir(self) -> Path:
+        """Directory FFmpeg writes segments to."""
+        return self.out_dir / PARTIAL_DIRNAME
+
+    def segment_path(self, index: int) -> Path:
+        """Path of a finished segment."""
+        return self.out_dir / segment_name(index)
+
+    @property
+    def idle(self) -> bool:
+        """Whether nobody is waiting and no segment has been asked for in a while."""
+        timeout = self.settings.hls_segment_duration * LISTENER_TIMEOUT_SEGMENTS
+        return not self.waiters and time.monotonic() - self.last_request > timeout
+
+    def next_batch(self) -> range | None:
+        """Get the next segments to encode, or None if there's nothing to do (blocking).
+
+        That's the first missing stretch of the SEGMENTS_AHEAD segments after
+        the wanted one, up to SEGMENTS_AHEAD + 1 long and ending before the
+        next segment that already exists.
+        """
+        if self.idle:
+            return None
+        window = range(self.wanted, min(self.wanted + SEGMENTS_AHEAD + 1, self.count))
+        first = next((i for i in window if not self.segment_path(i).exists()), None)
+        if first is None:
+            return None
+        stop = min(first + SEGMENTS_AHEAD + 1, self.count)
+        end = next((i for i in range(first + 1, stop) if self.segment_path(i).exists()), stop)
+        return range(first, end)
+
+    async def segment(self, index: int) -> Path | None:
+        """Wait for a segment to be encoded. Returns None if encoding failed."""
+        self.wanted = index
+        self.last_request = time.monotonic()
+        path = self.segment_path(index)
+        scheduler = get_scheduler(self.settings)
+        started = restarted = False
+
+        self.waiters += 1
+        try:
+            while not await asyncio.to_thread(path.exists):
+                if self._task is None or self._task.done():
+                    if started and self.failed:
+                        return None
+                    self.wanted = index
+                    self._start()
+                    started = True
+                elif index in self.batch:
+                    # Someone is listening for this batch now
+                    scheduler.promote(self.out_dir, TranscodePriority.INTERACTIVE)
+                    scheduler.unmark_preemptible(self.out_dir)
+                elif self.batch and not restarted:
+                    # Far from where the encoder is: start again from here
+                    self.wanted = index
+                    self._stop.set()
+                    restarted = True
+                # Segments written by another process don't set the event; poll too
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(self._progress.wait(), LOCK_POLL_INTERVAL)
+        finally:
+            self.waiters -= 1
+
+        if self._task is None or self._task.done():
+            # Keep the next segments coming
+            self._start()
+        return path
+
+    def _start(self) -> None:
+        self.failed = False
+        _encodes.setdefault(self.out_dir, self)
+        self._task = asyncio.create_task(self._run())
+
+    def _notify(self) -> None:
+        waiter, self._progress = self._progress, asyncio.Event()
+        waiter.set()
+
+    async def _run(self) -> None:
+        try:
+            if await asyncio.to_thread(self.next_batch) is None:
+                return
+            await asyncio.to_thread(self.partial_dir.mkdir, parents=True, exist_ok=True)
+            while (lock_fd := await asyncio.to_thread(lock_cache_entry, self.out_dir)) is None:
+                # Another process is encoding this track; wait for its files
+                if await asyncio.to_thread(self.segment_path(self.wanted).exists):
+                    return
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+            try:
+                # Left over from a process that died mid-encode
+                await asyncio.to_thread(self._discard_parts)
+                while True:
+                    self._stop.clear()
+                    batch = await asyncio.to_thread(self.next_batch)
+                    if batch is None:
+                        return
+                    self.batch = batch
+                    if not await self._encode(batch):
+                        self.failed = True
+                        return
+            finally:
+                self.batch = range(0)
+                await asyncio.to_thread(unlock_cache_entry, self.out_dir, lock_fd)
+        finally:
+            self._notify()
+            if not self.waiters and _encodes.get(self.out_dir) is self:
+                del _encodes[self.out_dir]
+
+    async def _encode(self, batch: range) -> bool:
+        """Run FFmpeg over a batch of segments in a scheduler slot.
+
+        Returns False if it failed. A batch that was cut short counts as
+        success; the next one is worked out from what is still missing.
+        """
+        scheduler = get_scheduler(self.settings)
+        priority = TranscodePriority.INTERACTIVE if self.waiters else TranscodePriority.PREFETCH
+        async with scheduler.slot(priority, key=self.out_dir):
+            if self._stop.is_set():
+                return True  # Superseded while it was queued
+            if not self.waiters:
+                # Encoding ahead of the player; urgent encodes may take the slot
+                scheduler.mark_preemptible(self.out_dir, self._stop.set)
+            try:
+                return await self._segment(batch)
+            finally:
+                scheduler.unmark_preemptible(self.out_dir)
+
+    async def _segment(self, batch: range) -> bool:
+        try:
+            process = await start_segment_process(
+                self.file_path, self.out_dir, self.settings, batch.start, len(batch)
+            )
+        except OSError:
+            return False
+
+        wait = asyncio.ensure_future(process.wait())
+        try:
+            while not wait.done():
+                stop = asyncio.ensure_future(self._stop.wait())
+                await asyncio.wait(
+                    {wait, stop},
+                    timeout=SEGMENT_POLL_INTERVAL,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                stop.cancel()
+                await self._publish(complete=False)
+                if self.idle:
+                    # The listeners have gone
+                    self._stop.set()
+                if self._stop.is_set():
+                    # The segment being written is cut short; drop it
+                    await stop_process(process)
+                    await asyncio.to_thread(self._discard_parts)
+                    return True
+        finally:
+            await stop_process(process)
+            if not wait.done():
+                wait.cancel()
+
+        if process.returncode != 0:
+            await asyncio.to_thread(self._discard_parts)
+            return False
+        await self._publish(complete=True)
+        # A clean exit that wrote nothing would otherwise be retried forever
+        return await asyncio.to_thread(self.segment_path(batch.start).exists)
+
+    async def _publish(self, complete: bool) -> None:
+        """Publish finished segments, then wake their readers and make room for them."""
+        if await asyncio.to_thread(self._publish_parts, complete):
+            self._notify()
+            schedule_eviction(self.settings)
+
+    def _publish_parts(self, complete: bool) -> int:
+        """Rename finished segments into place and index them (blocking).
+
+        A segment is finished once FFmpeg has started the one after it, or
+        when FFmpeg has exited cleanly. Returns how many were published.
+        """
+        parts = sorted(
+            index
+            for part in self.partial_dir.iterdir()
+            if (index := parse_segment_name(part.name)) is not None
+        )
+        finished = parts if complete else parts[:-1]
+        cache_index = get_cache_index(self.settings)
+        for index in finished:
+            path = self.segment_path(index)
+            (self.partial_dir / segment_name(index)).replace(path)
+            cache_index.record(self.file_path, get_segment_profile(self.settings, index), path)
+        return len(finished)
+
+    def _discard_parts(self) -> None:
+        for part in self.partial_dir.iterdir():
+            part.unlink(missing_ok=True)
+
+
+def sweep_hls(settings: Settings) -> int:
+    """Remove leftovers of interrupted segment encodes.
+
+    Deletes partial and unindexed segments of tracks no live process is
+    encoding, and directories left empty. Returns the number of files removed.
+    """
+    hls_dir = settings.cache_path / HLS_DIRNAME
+    if not hls_dir.is_dir():
+        return 0
+
+    indexed = get_cache_index(settings).cache_names()
+    removed = 0
+    # Lock files left by a crash are removed when their lock is released
+    out_dirs = {
+        path.with_suffix("") if path.suffix == ".lock" else path for path in hls_dir.iterdir()
+    }
+    for out_dir in out_dirs:
+        lock_fd = lock_cache_entry(out_dir)
+        if lock_fd is None:
+            continue  # Still being encoded
+        try:
+            if not out_dir.is_dir():
+                continue
+            partial_dir = out_dir / PARTIAL_DIRNAME
+            leftovers = list(partial_dir.iterdir()) if partial_dir.is_dir() else []
+            leftovers += [
+                path
+                for path in out_dir.glob("*.ts")
+                if path.relative_to(settings.cache_path).as_posix() not in indexed
+            ]
+            for path in leftovers:
+                path.unlink(missing_ok=True)
+                removed += 1
+            with contextlib.suppress(OSError):
+                # Only succeeds once they're empty
+                if partial_dir.is_dir():
+                    partial_dir.rmdir()
+                out_dir.rmdir()
+        finally:
+            unlock_cache_entry(out_dir, lock_fd)
+    return removed
+
+
+# Segment encodes in this process, keyed by output directory
+_encodes: dict[Path, HlsEncode] = {}
+
+
+def get_hls_encode(file_path: Path, duration: float, settings: Settings) -> HlsEncode:
+    """Get the segment encoder for a track, creating one if needed."""
+    return _get_encode(file_path, get_hls_dir(file_path, settings), duration, settings)
+
+
+async def load_hls_encode(file_path: Path, duration: float, settings: Settings) -> HlsEncode:
+    """Get the segment encoder for a track, stat'ing the track on the storage pool."""
+    out_dir = await run_blocking(settings, get_hls_dir, file_path, settings)
+    return _get_encode(file_path, out_dir, duration, settings)
+
+
+def _get_encode(file_path: Path, out_dir: Path, duration: float, settings: Settings) -> HlsEncode:
+    encode = _encodes.get(out_dir)
+    if encode is None:
+        count = get_segment_count(duration, settings.hls_segment_duration)
+        encode = HlsEncode(file_path, out_dir, settings, count)
+        _encodes[out_dir] = encode
+    return encode
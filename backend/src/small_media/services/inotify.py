@@ -0,0 +1,78 @@
+"""Minimal inotify bindings for following changes to the media library.
+
+Uses libc through ctypes so no extra dependency is needed. Only available
+on Linux; elsewhere ``Inotify()`` raises OSError and callers fall back to
+rescanning.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from pathlib import Path
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+# Changes to a directory's entries, which is all a listing depends on
+FOLDER_EVENTS = (
+    IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+READ_SIZE = 64 * 1024
+
+
+class Inotify:
+    """A non-blocking inotify instance."""
+
+    def __init__(self) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.fd: int = fd
+
+    def add_watch(self, path: Path, mask: int = FOLDER_EVENTS | IN_ONLYDIR) -> int:
+        """Watch a directory, returning its watch descriptor.
+
+        Watching a directory that is already watched returns the same
+        descriptor. Raises OSError, e.g. ENOSPC once the watch limit is hit.
+        """
+        wd: int = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), str(path))
+        return wd
+
+    def read(self) -> list[tuple[int, int, str]]:
+        """Read the pending events as (watch descriptor, mask, name) tuples."""
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self) -> None:
+        """Release the instance and all of its watches."""
+        os.close(self.fd)
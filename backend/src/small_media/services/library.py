@@ -0,0 +1,656 @@
+"""In-memory index of the media library tree.
+
+The library is scanned once in the background at startup, then kept up to
+date by rescanning just the folders inotify reports as changed. Full
+rescans are the fallback: straight away when the event queue overflows,
+and periodically while inotify isn't available or some folders couldn't
+be watched (e.g. the watch limit was hit). Folder listings and playlists are served
+from the index; until it has loaded, and for folders it doesn't cover
+(hidden folders, symlink loops), they fall back to reading the disk.
+
+The tree is saved to a snapshot in the cache directory. At startup the
+snapshot is served straight away while a background pass re-reads only
+the folders whose mtime has changed.
+"""
+
+import asyncio
+import contextlib
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from ..config import Settings
+from ..models import AudioFile, FolderContents, FolderItem
+from . import filesystem
+from .conditional import get_folder_signature, hash_folder_entries
+from .filesystem import (
+    ListingEntry,
+    decode_path,
+    encode_path,
+    file_entry,
+    folder_entry,
+    get_path_prefix,
+    is_audio_file,
+)
+from .inotify import IN_IGNORED, IN_Q_OVERFLOW, Inotify
+from .storage import run_blocking
+
+WATCH_DEBOUNCE = 0.5  # Seconds to gather related events before rescanning
+SNAPSHOT_FILENAME = "library-snapshot.json.gz"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_INTERVAL = 60.0  # Minimum seconds between saves after incremental updates
+
+
+@dataclass(slots=True)
+class LibraryFile:
+    """An audio file in the index."""
+
+    size: int
+    mtime_ns: int
+
+
+@dataclass(slots=True)
+class LibraryFolder:
+    """A folder in the index.
+
+    Nodes are never changed in place once published: an update builds a
+    new node and swaps it into its parent, so readers never see a
+    half-updated folder. A folder that wasn't read (hidden, or already
+    visited through a symlink) is a stub with ``complete`` False.
+    """
+
+    mtime_ns: int
+    signature: str = ""  # Hash of every entry's name, mtime and size
+    folders: dict[str, "LibraryFolder"] = field(default_factory=dict)
+    files: dict[str, LibraryFile] = field(default_factory=dict)  # Audio files only
+    complete: bool = True
+    # Cache of visible subfolder and file names in listing order, derived on first use
+    sorted_names: tuple[list[str], list[str]] | None = field(
+        default=None, compare=False, repr=False
+    )
+    # Cache of URL-encoded names, filled in as entries are listed
+    encoded_names: dict[str, str] | None = field(default=None, compare=False, repr=False)
+
+    def get_sorted_names(self) -> tuple[list[str], list[str]]:
+        """Get the visible subfolder names and audio filenames in listing order."""
+        if self.sorted_names is None:
+            folders = sorted(
+                (name for name in self.folders if not name.startswith(".")), key=str.lower
+            )
+            self.sorted_names = (folders, sorted(self.files, key=str.lower))
+        return self.sorted_names
+
+    def encode_name(self, name: str) -> str:
+        """Get the URL-encoded form of a subfolder or file name.
+
+        Encoding dominates the cost of building a large listing, so each
+        name is encoded once for the life of the node.
+        """
+        if self.encoded_names is None:
+            self.encoded_names = {}
+        encoded = self.encoded_names.get(name)
+        if encoded is None:
+            encoded = self.encoded_names[name] = encode_path(name)
+        return encoded
+
+
+class LibraryIndex:
+    """Tree of the folders and audio files under the media root."""
+
+    def __init__(
+        self, root: Path, allowed_extensions: set[str], snapshot_path: Path | None = None
+    ) -> None:
+        self.root = root
+        self.allowed_extensions = allowed_extensions
+        self.snapshot_path = snapshot_path
+        self._root: LibraryFolder | None = None
+        self._lock = threading.Lock()  # Serializes writers; readers don't lock
+        # Called with each folder read and its path relative to the root
+        self.on_folder: Callable[[Path, str], None] | None = None
+        self._listeners: list[Callable[[LibraryFolder | None, LibraryFolder], None]] = []
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the first scan has finished."""
+        return self._root is not None
+
+    def subscribe(self, listener: Callable[[LibraryFolder | None, LibraryFolder], None]) -> None:
+        """Call ``listener`` with the old and new tree each time the tree is replaced.
+
+        Listeners run on the thread that updated the index, while other
+        updates wait. If the index has already loaded, the listener is
+        called straight away with no old tree.
+        """
+        with self._lock:
+            if self._root is not None:
+                listener(None, self._root)
+            self._listeners.append(listener)
+
+    def _publish(self, tree: LibraryFolder) -> None:
+        """Replace the tree and notify listeners (call with the lock held)."""
+        previous, self._root = self._root, tree
+        for listener in self._listeners:
+            listener(previous, tree)
+
+    def _read_folder(
+        self,
+        path: Path,
+        relative: str,
+        previous: LibraryFolder | None,
+        visited: set[tuple[int, int]],
+        revalidate: bool = False,
+    ) -> LibraryFolder:
+        """Read a folder, reusing ``previous`` subfolders that haven't changed.
+
+        A subfolder whose mtime moved (entries added, removed or renamed) is
+        re-read the same way; new ones are scanned. With ``revalidate``,
+        ``previous`` is a tree loaded from a snapshot: every folder in it
+        is stat'ed, but only those whose mtime moved are listed again.
+        Raises OSError if the folder itself can't be read.
+        """
+        stat = path.stat()
+        if (stat.st_dev, stat.st_ino) in visited:
+            return LibraryFolder(mtime_ns=stat.st_mtime_ns, complete=False)
+        visited.add((stat.st_dev, stat.st_ino))
+        if self.on_folder is not None:
+            self.on_folder(path, relative)
+
+        if (
+            revalidate
+            and previous is not None
+            and previous.complete
+            and previous.mtime_ns == stat.st_mtime_ns
+        ):
+            # Same entries as when the snapshot was taken
+            signature, files = previous.signature, previous.files
+            subfolders = [(name, child.mtime_ns) for name, child in previous.folders.items()]
+        else:
+            signature, files, subfolders = self._list_entries(path, stat.st_mtime_ns)
+
+        folders = {}
+        for name, mtime_ns in subfolders:
+            child_relative = f"{relative}/{name}" if relative else name
+            reused = previous.folders.get(name) if previous is not None else None
+            if name.startswith("."):
+                # Hidden folders aren't listed; don't pay for reading them
+                folders[name] = LibraryFolder(mtime_ns=mtime_ns, complete=False)
+            elif (
+                not revalidate
+                and reused is not None
+                and reused.complete
+                and reused.mtime_ns == mtime_ns
+            ):
+                # Changes to files inside arrive through the subfolder's own events
+                folders[name] = reused
+            else:
+                try:
+                    folders[name] = self._read_folder(
+                        path / name, child_relative, reused, visited, revalidate
+                    )
+                except OSError:
+                    folders[name] = LibraryFolder(mtime_ns=mtime_ns, complete=False)
+
+        return LibraryFolder(
+            mtime_ns=stat.st_mtime_ns, signature=signature, folders=folders, files=files
+        )
+
+    def _list_entries(
+        self, path: Path, mtime_ns: int
+    ) -> tuple[str, dict[str, LibraryFile], list[tuple[str, int]]]:
+        """List a folder's entries: its signature, audio files and subfolders."""
+        entries = []
+        subfolders = []
+        files = {}
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    entry_stat = entry.stat()
+                    is_dir = entry.is_dir()
+                    is_file = entry.is_file()
+                except OSError:
+                    continue  # Broken symlink
+                entries.append((entry.name, entry_stat.st_mtime_ns, entry_stat.st_size))
+                if is_dir:
+                    subfolders.append((entry.name, entry_stat.st_mtime_ns))
+                elif is_file and is_audio_file(entry.name, self.allowed_extensions):
+                    files[entry.name] = LibraryFile(entry_stat.st_size, entry_stat.st_mtime_ns)
+        return hash_folder_entries(mtime_ns, entries), files, subfolders
+
+    def scan(self) -> None:
+        """Read the whole library and replace the tree (blocking)."""
+        try:
+            tree = self._read_folder(self.root, "", None, set())
+        except OSError:
+            return
+        with self._lock:
+            self._publish(tree)
+
+    def reconcile(self) -> None:
+        """Bring a tree loaded from a snapshot up to date (blocking).
+
+        Only folders whose mtime changed are listed again, so this costs a
+        stat per folder rather than per file. Changes that don't touch a
+        folder's mtime, like a file rewritten in place, wait for the next
+        full scan. Without a loaded tree this is a full scan.
+        """
+        snapshot = self._root
+        if snapshot is None:
+            self.scan()
+            return
+        try:
+            tree = self._read_folder(self.root, "", snapshot, set(), revalidate=True)
+        except OSError:
+            return
+        with self._lock:
+            self._publish(tree)
+
+    def load_snapshot(self) -> bool:
+        """Load the tree from the snapshot file, if there is a usable one (blocking)."""
+        if self.snapshot_path is None:
+            return False
+        try:
+            with gzip.open(self.snapshot_path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            if (
+                data["version"] != SNAPSHOT_VERSION
+                or data["root"] != str(self.root)
+                or set(data["extensions"]) != self.allowed_extensions
+            ):
+                return False
+            tree = decode_folder(data["tree"])
+        except (
+            OSError,
+            EOFError,
+            zlib.error,  # Damaged compressed data
+            ValueError,
+            KeyError,
+            IndexError,
+            TypeError,
+            AttributeError,
+        ):
+            return False
+        with self._lock:
+            if self._root is None:
+                self._publish(tree)
+        return True
+
+    def save_snapshot(self) -> None:
+        """Write the tree to the snapshot file, replacing it atomically (blocking)."""
+        tree = self._root
+        if self.snapshot_path is None or tree is None:
+            return
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "root": str(self.root),
+            "extensions": sorted(self.allowed_extensions),
+            "tree": encode_folder(tree),
+        }
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            # A temp file of its own, since every worker process saves snapshots
+            fd, temp_name = tempfile.mkstemp(
+                prefix=f".{self.snapshot_path.name}.", suffix=".tmp", dir=self.snapshot_path.parent
+            )
+        except OSError:
+            return
+        temp_path = Path(temp_name)
+        try:
+            with (
+                os.fdopen(fd, "wb") as raw,
+                gzip.open(raw, "wt", encoding="utf-8", compresslevel=1) as f,
+            ):
+                json.dump(data, f, separators=(",", ":"))
+            temp_path.replace(self.snapshot_path)
+        except OSError:
+            temp_path.unlink(missing_ok=True)
+
+    def refresh(self, relative: str) -> None:
+        """Re-read one folder after its entries changed (blocking).
+
+        Subfolders that are indexed and unchanged are kept; others are
+        scanned. Folders that have gone, or whose parent isn't indexed,
+        are left for their parent's own refresh.
+        """
+        with self._lock:
+            if self._root is None:
+                return
+            parts = [part for part in relative.split("/") if part]
+            parents = [self._root]
+            for part in parts[:-1]:
+                child = parents[-1].folders.get(part)
+                if child is None or not child.complete:
+                    return
+                parents.append(child)
+            previous = parents[-1].folders.get(parts[-1]) if parts else self._root
+            if previous is None:
+                return
+
+            try:
+                node = self._read_folder(self.root / relative, relative, previous, set())
+            except OSError:
+                return
+
+            # Copy the path down from the root so readers see old or new, never both
+            for parent, part in zip(reversed(parents), reversed(parts), strict=True):
+                node = LibraryFolder(
+                    mtime_ns=parent.mtime_ns,
+                    signature=parent.signature,
+                    folders={**parent.folders, part: node},
+                    files=parent.files,
+                )
+            self._publish(node)
+
+    def lookup(self, folder_path: Path) -> LibraryFolder | None:
+        """Get the indexed folder at an absolute path, or None if it isn't indexed."""
+        node = self._root
+        if node is None:
+            return None
+        try:
+            relative = folder_path.relative_to(self.root)
+        except ValueError:
+            return None
+        for part in relative.parts:
+            node = node.folders.get(part)
+            if node is None:
+                return None
+        return node if node.complete else None
+
+    def signature(self, folder_path: Path) -> str | None:
+        """Summarize what a folder's listing depends on, or None if it isn't indexed.
+
+        Covers the folder's entries and those of its subfolders, whose
+        audio files and subfolders the listing reports.
+        """
+        node = self.lookup(folder_path)
+        if node is None:
+            return None
+        parts = [node.signature, *(node.folders[name].signature for name in sorted(node.folders))]
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def list_folders(self, folder_path: Path) -> list[FolderItem] | None:
+        """List a folder's visible subfolders, or None if it isn't indexed."""
+        items = self.iter_folder_contents(folder_path)
+        if items is None:
+            return None
+        return [FolderItem(**data) for kind, data in items if kind == "folder"]
+
+    def list_audio_files(self, folder_path: Path) -> list[AudioFile] | None:
+        """List a folder's audio files, or None if it isn't indexed."""
+        node = self.lookup(folder_path)
+        if node is None:
+            return None
+        return [AudioFile(**data) for _, data in self._iter_files(node, folder_path, 0)]
+
+    def iter_folder_contents(
+        self, folder_path: Path, start: int = 0
+    ) -> Iterator[ListingEntry] | None:
+        """Iterate a folder's subfolders then audio files from position ``start``.
+
+        Returns None if the folder or one of its visible subfolders isn't
+        indexed. Entries come from the tree as it was when called, and
+        are built only as they are consumed.
+        """
+        node = self.lookup(folder_path)
+        if node is None:
+            return None
+        folder_names, _ = node.get_sorted_names()
+        if not all(node.folders[name].complete for name in folder_names):
+            return None
+        prefix = get_path_prefix(folder_path.relative_to(self.root))
+
+        folders = (
+            folder_entry(
+                name,
+                prefix + node.encode_name(name),
+                bool(node.folders[name].files),
+                len(node.folders[name].folders),
+            )
+            for name in folder_names[start:]
+        )
+        return itertools.chain(
+            folders, self._iter_files(node, folder_path, max(0, start - len(folder_names)))
+        )
+
+    def _iter_files(
+        self, node: LibraryFolder, folder_path: Path, start: int
+    ) -> Iterator[ListingEntry]:
+        prefix = get_path_prefix(folder_path.relative_to(self.root))
+        _, file_names = node.get_sorted_names()
+        files = node.files
+        for name in file_names[start:]:
+            yield file_entry(name, prefix + node.encode_name(name), files[name].size)
+
+    def audio_filenames(self, folder_path: Path) -> list[str] | None:
+        """Get a folder's audio filenames sorted naturally, or None if it isn't indexed."""
+        node = self.lookup(folder_path)
+        if node is None:
+            return None
+        return list(node.get_sorted_names()[1])
+
+    def encode_names(self, folder_path: Path, names: list[str]) -> list[str]:
+        """URL-encode names in a folder, using the folder's cache if it is indexed."""
+        node = self.lookup(folder_path)
+        if node is None:
+            return [encode_path(name) for name in names]
+        return [node.encode_name(name) for name in names]
+
+
+def encode_folder(node: LibraryFolder) -> list[Any]:
+    """Convert a folder to nested lists for the snapshot."""
+    return [
+        node.mtime_ns,
+        node.signature,
+        node.complete,
+        {name: encode_folder(child) for name, child in node.folders.items()},
+        {name: [file.size, file.mtime_ns] for name, file in node.files.items()},
+    ]
+
+
+def decode_folder(data: list[Any]) -> LibraryFolder:
+    """Rebuild a folder from its snapshot form."""
+    mtime_ns, signature, complete, folders, files = data
+    return LibraryFolder(
+        mtime_ns=mtime_ns,
+        signature=signature,
+        folders={name: decode_folder(child) for name, child in folders.items()},
+        files={name: LibraryFile(size, file_mtime_ns) for name, (size, file_mtime_ns) in files.items()},
+        complete=complete,
+    )
+
+
+class LibraryWatcher:
+    """Keeps an index current from inotify events, rescanning where they fall short."""
+
+    def __init__(self, index: LibraryIndex, rescan_interval: float) -> None:
+        self.index = index
+        self.rescan_interval = rescan_interval
+        self._inotify: Inotify | None = None
+        self._folders: dict[int, str] = {}  # Watch descriptor -> relative path
+        self._dirty: set[str] = set()
+        self._overflowed = False
+        self._watch_failed = False  # Some folder is read but not watched
+        self._changed = asyncio.Event()
+        self._saved_at = 0.0  # Monotonic time of the last snapshot
+
+    def _watch(self, path: Path, relative: str) -> None:
+        """Add an inotify watch for a folder being read (called on scan threads)."""
+        if self._inotify is None:
+            return
+        try:
+            self._folders[self._inotify.add_watch(path)] = relative
+        except OSError:
+            # Out of watches (ENOSPC); fall back to periodic rescans
+            self._watch_failed = True
+
+    @property
+    def needs_rescans(self) -> bool:
+        """Whether events can't be relied on to report every change."""
+        return self._inotify is None or self._watch_failed
+
+    def _on_events(self) -> None:
+        assert self._inotify is not None
+        for wd, mask, _name in self._inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                self._overflowed = True
+            elif mask & IN_IGNORED:
+                self._folders.pop(wd, None)
+            elif wd in self._folders:
+                self._dirty.add(self._folders[wd])
+        self._changed.set()
+
+    def _refresh(self, dirty: set[str]) -> None:
+        # Parents first, so new subfolders exist before their own refresh
+        for relative in sorted(dirty, key=lambda path: path.count("/")):
+            self.index.refresh(relative)
+        if time.monotonic() - self._saved_at >= SNAPSHOT_INTERVAL:
+            self._save()
+
+    def _scan(self) -> None:
+        # A full scan watches every folder again
+        self._watch_failed = False
+        self.index.scan()
+        self._save()
+
+    def _reconcile(self) -> None:
+        self.index.reconcile()
+        self._save()
+
+    def _save(self) -> None:
+        self.index.save_snapshot()
+        self._saved_at = time.monotonic()
+
+    async def run(self) -> None:
+        """Load or scan the library, then follow its changes until cancelled."""
+        loop = asyncio.get_running_loop()
+        try:
+            self._inotify = Inotify()
+        except OSError:
+            self._inotify = None
+        else:
+            self.index.on_folder = self._watch
+            loop.add_reader(self._inotify.fd, self._on_events)
+
+        try:
+            # Serve the snapshot while checking it against the disk
+            await asyncio.to_thread(self.index.load_snapshot)
+            await asyncio.to_thread(self._reconcile)
+            while True:
+                rescan = self.rescan_interval > 0 and self.needs_rescans
+                timeout = self.rescan_interval if rescan else None
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+                except TimeoutError:
+                    await asyncio.to_thread(self._scan)
+                    continue
+
+                # Let a burst of events (a copied album) settle first
+                await asyncio.sleep(WATCH_DEBOUNCE)
+                self._changed.clear()
+                dirty, self._dirty = self._dirty, set()
+                if self._overflowed:
+                    self._overflowed = False
+                    await asyncio.to_thread(self._scan)
+                else:
+                    await asyncio.to_thread(self._refresh, dirty)
+        finally:
+            if self._inotify is not None:
+                loop.remove_reader(self._inotify.fd)
+                self._inotify.close()
+                self.index.on_folder = None
+
+
+_indexes: dict[Path, LibraryIndex] = {}
+_watchers: dict[Path, asyncio.Task[None]] = {}
+
+
+def get_library_index(settings: Settings) -> LibraryIndex:
+    """Get the process-wide index for the configured media root."""
+    index = _indexes.get(settings.media_path)
+    if index is None:
+        index = LibraryIndex(
+            settings.media_path,
+            settings.allowed_extensions_set,
+            snapshot_path=settings.cache_path / SNAPSHOT_FILENAME,
+        )
+        _indexes[settings.media_path] = index
+    return index
+
+
+def start_library_index(settings: Settings) -> None:
+    """Start scanning the library in the background and following its changes."""
+    if not settings.library_index or settings.media_path in _watchers:
+        return
+    watcher = LibraryWatcher(get_library_index(settings), settings.library_rescan_interval)
+    _watchers[settings.media_path] = asyncio.create_task(watcher.run())
+
+
+async def stop_library_index(settings: Settings) -> None:
+    """Stop following changes to the library."""
+    task = _watchers.pop(settings.media_path, None)
+    if task is not None:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+async def load_folder_signature(folder_path: Path, settings: Settings) -> str:
+    """Get a folder's signature for ETags from the index, or else from disk.
+
+    Raises OSError if the folder isn't indexed and can't be read, or
+    StorageTimeoutError if reading it takes too long.
+    """
+    signature = get_library_index(settings).signature(folder_path)
+    if signature is None:
+        signature = await run_blocking(settings, get_folder_signature, folder_path)
+    return signature
+
+
+def iter_folder_contents(
+    base_path: Path, relative_path: str, settings: Settings, start: int = 0
+) -> Iterator[ListingEntry] | None:
+    """Iterate a folder's subfolders then audio files, from the index where possible.
+
+    Returns None if the folder doesn't exist.
+    """
+    if relative_path and not filesystem.is_safe_path(base_path, relative_path):
+        return None
+
+    full_path = base_path / decode_path(relative_path) if relative_path else base_path
+    items = get_library_index(settings).iter_folder_contents(full_path, start)
+    if items is None:
+        if not full_path.is_dir():
+            return None
+        items = filesystem.iter_folder_contents(base_path, relative_path, settings, start)
+    return items
+
+
+def get_folder_contents(
+    base_path: Path, relative_path: str, settings: Settings
+) -> FolderContents | None:
+    """Get complete folder contents, from the index where possible."""
+    if relative_path and not filesystem.is_safe_path(base_path, relative_path):
+        return None
+
+    full_path = base_path / decode_path(relative_path) if relative_path else base_path
+    index = get_library_index(settings)
+    folders = index.list_folders(full_path)
+    files = index.list_audio_files(full_path)
+    if folders is None or files is None:
+        return filesystem.get_folder_contents(base_path, relative_path, settings)
+
+    return FolderContents(
+        path=relative_path,
+        name=full_path.name if relative_path else "Root",
+        folders=folders,
+        files=files,
+    )
@@ -0,0 +1,204 @@
+"""Persistent cache of probed audio metadata."""
+
+import asyncio
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from ..config import Settings
+from .storage import run_blocking
+from .transcoder import probe_audio_info
+
+METADATA_FILENAME = "metadata.sqlite3"
+MEMORY_ENTRIES = 4096  # Probe results kept in memory
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    duration REAL NOT NULL,
+    bitrate INTEGER,
+    sample_rate INTEGER,
+    channels INTEGER
+);
+"""
+
+INFO_FIELDS = ("duration", "bitrate", "sample_rate", "channels")
+
+# (path, size, mtime) identifies one version of a file
+MetadataKey = tuple[str, int, float]
+
+
+def metadata_key(file_path: Path, stat: os.stat_result) -> MetadataKey:
+    """Build the key a file's metadata is stored under."""
+    return (str(file_path), stat.st_size, stat.st_mtime)
+
+
+class MetadataStore:
+    """Probe results keyed by path, size and mtime.
+
+    Rows live in SQLite inside the cache directory so they survive restarts;
+    the most recently used ones are also kept in memory. A file that changes
+    size or mtime gets probed again and its row is replaced.
+    """
+
+    def __init__(self, db_path: Path, memory_entries: int = MEMORY_ENTRIES) -> None:
+        self.memory_entries = memory_entries
+        self._memory: OrderedDict[MetadataKey, dict[str, Any]] = OrderedDict()
+        # Lookups from the event loop, probes on worker threads
+        self._lock = threading.RLock()
+
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._db.close()
+
+    def get_memory(self, key: MetadataKey) -> dict[str, Any] | None:
+        """Look a file up in memory only."""
+        with self._lock:
+            info = self._memory.get(key)
+            if info is not None:
+                self._memory.move_to_end(key)
+            return info
+
+    def get(self, key: MetadataKey) -> dict[str, Any] | None:
+        """Look a file up in memory, then in the database."""
+        info = self.get_memory(key)
+        if info is not None:
+            return info
+
+        path, size, mtime = key
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(INFO_FIELDS)} FROM metadata "
+                "WHERE path = ? AND size = ? AND mtime = ?",
+                (path, size, mtime),
+            ).fetchone()
+            if row is None:
+                return None
+            info = dict(zip(INFO_FIELDS, row, strict=True))
+            self._remember(key, info)
+        return info
+
+    def put(self, key: MetadataKey, info: dict[str, Any]) -> None:
+        """Store the probe result for a file, replacing older versions."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO metadata "
+                f"(path, size, mtime, {', '.join(INFO_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*key, *(info[field] for field in INFO_FIELDS)),
+            )
+            self._remember(key, info)
+
+    def _remember(self, key: MetadataKey, info: dict[str, Any]) -> None:
+        self._memory[key] = info
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM metadata").fetchone()
+        return int(count)
+
+
+_stores: dict[Path, MetadataStore] = {}
+
+
+def get_metadata_store(settings: Settings) -> MetadataStore:
+    """Get the process-wide metadata store for the configured cache directory."""
+    store = _stores.get(settings.cache_path)
+    if store is None:
+        store = MetadataStore(settings.cache_path / METADATA_FILENAME)
+        _stores[settings.cache_path] = store
+    return store
+
+
+async def _probe_and_store(
+    file_path: Path, key: MetadataKey, store: MetadataStore, settings: Settings
+) -> dict[str, Any] | None:
+    """Probe a file and remember the result if there is one."""
+    info = await probe_audio_info(file_path, settings)
+    if info is not None:
+        await asyncio.to_thread(store.put, key, info)
+    return info
+
+
+async def load_audio_info(file_path: Path, settings: Settings) -> dict[str, Any] | None:
+    """Get a file's metadata, probing it only if it isn't stored yet.
+
+    Hits in memory are answered directly; database lookups run on a worker
+    thread and probes don't block the event loop. Returns None if the file
+    is missing or can't be probed.
+    """
+    try:
+        stat = await run_blocking(settings, file_path.stat)
+    except OSError:
+        return None
+
+    store = get_metadata_store(settings)
+    key = metadata_key(file_path, stat)
+    info = store.get_memory(key)
+    if info is None:
+        info = await asyncio.to_thread(store.get, key)
+    if info is None:
+        info = await _probe_and_store(file_path, key, store, settings)
+    return info
+
+
+async def load_audio_duration(file_path: Path, settings: Settings) -> float | None:
+    """Get a file's duration in seconds from the metadata cache."""
+    info = await load_audio_info(file_path, settings)
+    return info["duration"] if info is not None else None
+
+
+async def load_audio_durations(
+    file_paths: list[Path], settings: Settings
+) -> list[float | None]:
+    """Get the durations of many files, probing the unknown ones in parallel.
+
+    Files are stat'ed and stored results read in one pass on the storage
+    pool. Misses are then
+    probed concurrently, at most ``probe_concurrency`` at a time, so a cold
+    folder costs about as long as its slowest probes rather than all of them.
+    """
+    store = get_metadata_store(settings)
+
+    def lookup_all() -> list[tuple[MetadataKey | None, dict[str, Any] | None]]:
+        results: list[tuple[MetadataKey | None, dict[str, Any] | None]] = []
+        for file_path in file_paths:
+            try:
+                key = metadata_key(file_path, file_path.stat())
+            except OSError:
+                results.append((None, None))
+                continue
+            results.append((key, store.get(key)))
+        return results
+
+    lookups = await run_blocking(settings, lookup_all)
+    infos = [info for _, info in lookups]
+
+    semaphore = asyncio.Semaphore(max(1, settings.probe_concurrency))
+
+    async def probe(file_path: Path, key: MetadataKey) -> dict[str, Any] | None:
+        async with semaphore:
+            return await _probe_and_store(file_path, key, store, settings)
+
+    missing = [
+        (i, key) for i, (key, info) in enumerate(lookups) if key is not None and info is None
+    ]
+    probed = await asyncio.gather(*(probe(file_paths[i], key) for i, key in missing))
+    for (i, _), info in zip(missing, probed, strict=True):
+        infos[i] = info
+
+    return [info["duration"] if info is not None else None for info in infos]
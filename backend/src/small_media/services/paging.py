@@ -0,0 +1,106 @@
+"""Cursor pagination and NDJSON streaming for large listings.
+
+A cursor is an opaque token for the position of the next entry. Listings
+are ordered the same way on every request, so a cursor stays valid while
+the folder is unchanged; if entries are added or removed between pages,
+the next page may repeat or miss some.
+
+In NDJSON mode a listing is sent one line at a time: first its own fields
+(path and name), then one object per entry keyed by the entry's type, and
+last ``{"next_cursor": ...}`` if a limit cut the listing short.
+"""
+
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from typing import Any, TypeVar
+
+from pydantic_core import to_json
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_BATCH_SIZE = 128  # Entries sent per chunk; each chunk is one write to the client
+
+T = TypeVar("T")
+
+
+def parse_cursor(cursor: str | None) -> int:
+    """Get the position a cursor points at. Raises ValueError if it is malformed."""
+    if not cursor:
+        return 0
+    if not cursor.isdigit():
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return int(cursor)
+
+
+def make_cursor(position: int) -> str:
+    """Make the cursor for a position in a listing."""
+    return str(position)
+
+
+def wants_ndjson(accept: str | None) -> bool:
+    """Check whether the client asked for a streamed NDJSON listing."""
+    if not accept:
+        return False
+    return any(
+        part.split(";")[0].strip().lower() == NDJSON_MEDIA_TYPE for part in accept.split(",")
+    )
+
+
+def take_page(items: Iterable[T], start: int, limit: int | None) -> tuple[list[T], str | None]:
+    """Take up to ``limit`` items, with the cursor for the rest if there are any.
+
+    ``items`` starts at position ``start``; only one item past the page is
+    consumed to find out whether there are more.
+    """
+    if limit is None:
+        return list(items), None
+    page = list(islice(items, limit + 1))
+    if len(page) > limit:
+        return page[:limit], make_cursor(start + limit)
+    return page, None
+
+
+def encode_json(data: Any) -> bytes:
+    """Encode a response body.
+
+    Listings are built as plain dicts from trusted data, so they go
+    straight to pydantic-core's encoder instead of being validated against
+    their response model first.
+    """
+    return to_json(data)
+
+
+def encode_line(data: dict[str, Any]) -> bytes:
+    """Encode one NDJSON line."""
+    return to_json(data) + b"\n"
+
+
+def encode_entry(kind: str, entry: dict[str, Any]) -> bytes:
+    """Encode one listing entry as an NDJSON line keyed by its type."""
+    return b'{"%s":%s}\n' % (kind.encode(), to_json(entry))
+
+
+def iter_ndjson(
+    header: dict[str, Any],
+    entries: Iterable[tuple[str, dict[str, Any]]],
+    start: int,
+    limit: int | None,
+) -> Iterator[bytes]:
+    """Stream a listing as NDJSON, encoding entries as they are produced.
+
+    The header goes out on its own, then entries in chunks of
+    ``NDJSON_BATCH_SIZE`` lines.
+    """
+    yield encode_line(header)
+    position = start
+    lines = []
+    for kind, entry in entries:
+        if limit is not None and position - start >= limit:
+            lines.append(encode_line({"next_cursor": make_cursor(position)}))
+            break
+        lines.append(encode_entry(kind, entry))
+        position += 1
+        if len(lines) >= NDJSON_BATCH_SIZE:
+            yield b"".join(lines)
+            lines = []
+    if lines:
+        yield b"".join(lines)
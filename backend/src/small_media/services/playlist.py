@@ -8,6 +8,7 @@ import yaml
 from ..config import Settings
 from ..models import PlaylistTrack, PlaylistTrackUpdate
 from .filesystem import decode_path, encode_path, get_file_extension, is_audio_file
+from .library import get_library_index
 
 PLAYLIST_FILENAME = ".small-media-playlist.yaml"
 
@@ -46,6 +47,10 @@ def save_playlist_file(folder_path: Path, data: dict[str, Any]) -> bool:
 
 def get_audio_files_in_folder(folder_path: Path, settings: Settings) -> list[str]:
     """Get list of audio filenames in a folder, sorted naturally."""
+    filenames = get_library_index(settings).audio_filenames(folder_path)
+    if filenames is not None:
+        return filenames
+
     if not folder_path.exists() or not folder_path.is_dir():
         return []
 
@@ -59,21 +64,12 @@ def get_audio_files_in_folder(folder_path: Path, settings: Settings) -> list[str
     return files
 
 
-def build_playlist(
-    base_path: Path,
-    relative_path: str,
-    settings: Settings,
-) -> list[PlaylistTrack]:
-    """Build playlist for a folder.
+def get_playlist_order(folder_path: Path, settings: Settings) -> list[tuple[str, bool]]:
+    """Get a folder's audio filenames in playlist order, with their skip flags.
 
     Tracks listed in the playlist file come first in specified order.
     Remaining tracks appear after in natural sort order.
     """
-    if relative_path:
-        folder_path = base_path / decode_path(relative_path)
-    else:
-        folder_path = base_path
-
     # Get all audio files in folder
     all_files = set(get_audio_files_in_folder(folder_path, settings))
     if not all_files:
@@ -83,7 +79,7 @@ def build_playlist(
     playlist_data = load_playlist_file(folder_path)
 
     # Build ordered list
-    tracks = []
+    order = []
     seen_files: set[str] = set()
 
     # Process files from playlist first
@@ -96,33 +92,45 @@ def build_playlist(
             if not filename or filename not in all_files:
                 continue
 
-            skip = bool(track_data.get("skip", False))
-            rel_file_path = f"{relative_path}/{filename}" if relative_path else filename
-
-            tracks.append(
-                PlaylistTrack(
-                    filename=filename,
-                    path=encode_path(rel_file_path),
-                    skip=skip,
-                    duration=None,
-                )
-            )
+            order.append((filename, bool(track_data.get("skip", False))))
             seen_files.add(filename)
 
     # Add remaining files not in playlist
     remaining = sorted(all_files - seen_files, key=str.lower)
-    for filename in remaining:
-        rel_file_path = f"{relative_path}/{filename}" if relative_path else filename
-        tracks.append(
-            PlaylistTrack(
-                filename=filename,
-                path=encode_path(rel_file_path),
-                skip=False,
-                duration=None,
-            )
-        )
-
-    return tracks
+    order.extend((filename, False) for filename in remaining)
+    return order
+
+
+def make_tracks(
+    relative_path: str, folder_path: Path, order: list[tuple[str, bool]], settings: Settings
+) -> list[dict[str, Any]]:
+    """Build the playlist entries for files in the folder at ``relative_path``.
+
+    Entries are plain dicts shaped like PlaylistTrack, so routes can send
+    them without validating them again.
+    """
+    prefix = encode_path(f"{relative_path}/") if relative_path else ""
+    filenames = [filename for filename, _ in order]
+    encoded = get_library_index(settings).encode_names(folder_path, filenames)
+    return [
+        {"filename": filename, "path": prefix + name, "skip": skip, "duration": None}
+        for (filename, skip), name in zip(order, encoded, strict=True)
+    ]
+
+
+def build_playlist(
+    base_path: Path,
+    relative_path: str,
+    settings: Settings,
+) -> list[PlaylistTrack]:
+    """Build playlist for a folder, in the order given by get_playlist_order."""
+    if relative_path:
+        folder_path = base_path / decode_path(relative_path)
+    else:
+        folder_path = base_path
+
+    order = get_playlist_order(folder_path, settings)
+    return [PlaylistTrack(**track) for track in make_tracks(relative_path, folder_path, order, settings)]
 
 
 def update_playlist(
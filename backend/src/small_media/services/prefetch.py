@@ -0,0 +1,95 @@
+"""Prefetch transcoding of upcoming playlist tracks."""
+
+import asyncio
+from collections.abc import Collection
+from pathlib import Path
+
+from ..config import Settings
+from .playlist import get_playlist_order
+from .storage import StorageTimeoutError, run_blocking
+from .transcoder import (
+    TranscodePriority,
+    get_cached_path,
+    get_transcode_job,
+    is_native_passthrough,
+)
+
+# Cache paths with a prefetch queued or running, and the tasks doing it
+_pending: set[Path] = set()
+_tasks: set[asyncio.Task[None]] = set()
+_semaphore: asyncio.Semaphore | None = None
+
+
+def get_upcoming_tracks(file_path: Path, settings: Settings, count: int) -> list[Path]:
+    """Get the next ``count`` non-skipped tracks after a file in its playlist."""
+    order = get_playlist_order(file_path.parent, settings)
+    filenames = [filename for filename, _ in order]
+    if file_path.name not in filenames:
+        return []
+
+    upcoming = order[filenames.index(file_path.name) + 1 :]
+    return [file_path.parent / filename for filename, skip in upcoming if not skip][:count]
+
+
+async def _prefetch(file_path: Path, cache_path: Path, settings: Settings) -> None:
+    """Transcode one track into the cache at prefetch priority."""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max(1, settings.prefetch_concurrency))
+
+    try:
+        async with _semaphore:
+            if not await asyncio.to_thread(cache_path.exists):
+                job = get_transcode_job(file_path, cache_path, settings, TranscodePriority.PREFETCH)
+                await job.wait()
+    finally:
+        _pending.discard(cache_path)
+
+
+async def prefetch_upcoming(
+    file_path: Path, settings: Settings, formats: Collection[str] = ()
+) -> None:
+    """Queue background transcodes of the tracks that follow a library file.
+
+    Tracks in one of ``formats``, which the client plays as they are, are
+    left alone.
+    """
+    if settings.prefetch_tracks <= 0:
+        return
+
+    # Building the playlist reads the folder and its YAML file
+    try:
+        upcoming = await run_blocking(
+            settings,
+            get_upcoming_tracks,
+            file_path,
+            settings,
+            settings.prefetch_tracks,
+        )
+    except (OSError, StorageTimeoutError):
+        return
+
+    for track_path in upcoming:
+        if is_native_passthrough(track_path, formats):
+            continue
+        try:
+            cache_path = await run_blocking(settings, get_cached_path, track_path, settings)
+        except (OSError, StorageTimeoutError):
+            continue
+        # _pending is checked after the await, as another request may have queued it since
+        if await asyncio.to_thread(cache_path.exists) or cache_path in _pending:
+            continue
+
+        _pending.add(cache_path)
+        task = asyncio.create_task(_prefetch(track_path, cache_path, settings))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+
+def schedule_prefetch(
+    file_path: Path, settings: Settings, formats: Collection[str] = ()
+) -> None:
+    """Start prefetching the tracks after a file without waiting for it."""
+    task = asyncio.create_task(prefetch_upcoming(file_path, settings, formats))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
@@ -0,0 +1,25 @@
+"""Named output profiles a request can choose between."""
+
+from typing import Any
+
+from ..config import Settings
+
+# Settings each profile overrides; "standard" is the configured output
+OUTPUT_PROFILES: dict[str, dict[str, Any]] = {
+    "low": {"audio_codec": "opus", "audio_bitrate": 64},
+    "standard": {},
+    "high": {"audio_codec": "mp3", "audio_quality": 0, "audio_bitrate": 320},
+}
+
+
+def get_profile_settings(settings: Settings, name: str) -> Settings:
+    """Get the settings to transcode with for a profile.
+
+    Everything that depends on the output (cache key, cache index profile,
+    FFmpeg command) is derived from these, so each profile is cached
+    separately. Raises KeyError for an unknown profile.
+    """
+    overrides = OUTPUT_PROFILES[name]
+    if not overrides:
+        return settings
+    return settings.model_copy(update=overrides)
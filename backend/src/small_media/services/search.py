@@ -0,0 +1,275 @@
+"""Name search over the media library.
+
+Folder and file names are normalized (case folded, accents stripped) and
+indexed by every substring of up to three characters. A query term is
+looked up as the intersection of the postings for its trigrams (or for
+the whole term, if it is shorter), then checked as a substring of each
+candidate, so any part of a name matches without scanning the library.
+
+The index follows the library index: each new tree is diffed against the
+previous one, skipping the subtrees the two share, so an inotify refresh
+only touches the names that changed.
+"""
+
+import heapq
+import threading
+import unicodedata
+from array import array
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import partial
+from operator import attrgetter
+from pathlib import Path
+
+from ..config import Settings
+from ..models import SearchResult
+from .filesystem import encode_path
+from .library import LibraryFolder, get_library_index
+
+GRAM_SIZE = 3
+
+EMPTY_FOLDER = LibraryFolder(mtime_ns=0)
+
+get_order = attrgetter("order")
+
+
+def normalize(text: str) -> str:
+    """Fold a name or query for matching: lowercase, without accents."""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def get_grams(text: str) -> set[str]:
+    """Get every substring of a normalized name up to the gram size, for indexing."""
+    return {
+        text[i : i + size]
+        for size in range(1, GRAM_SIZE + 1)
+        for i in range(len(text) - size + 1)
+    }
+
+
+def get_query_grams(term: str) -> set[str]:
+    """Get the grams whose postings must all contain a name matching ``term``."""
+    if len(term) <= GRAM_SIZE:
+        return {term}
+    return {term[i : i + GRAM_SIZE] for i in range(len(term) - GRAM_SIZE + 1)}
+
+
+@dataclass(slots=True)
+class SearchEntry:
+    """A folder or audio file in the search index."""
+
+    path: str  # Relative to the media root
+    name: str
+    key: str  # Normalized name
+    is_folder: bool
+    order: str  # Sort key between equally good matches: folders first, then by path
+
+
+def new_postings() -> defaultdict[str, "array[int]"]:
+    """Create an empty map of gram to entry IDs."""
+    return defaultdict(partial(array, "i"))
+
+
+def join_path(relative: str, name: str) -> str:
+    """Join a name onto a path relative to the media root."""
+    return f"{relative}/{name}" if relative else name
+
+
+def walk_entries(
+    node: LibraryFolder, relative: str, out: list[tuple[str, str, bool]]
+) -> None:
+    """Collect (path, name, is folder) for everything below a folder."""
+    for name in node.files:
+        out.append((join_path(relative, name), name, False))
+    for name, child in node.folders.items():
+        if name.startswith("."):
+            continue  # Hidden folders aren't listed, so aren't searched
+        path = join_path(relative, name)
+        out.append((path, name, True))
+        walk_entries(child, path, out)
+
+
+def diff_entries(
+    old: LibraryFolder,
+    new: LibraryFolder,
+    relative: str,
+    added: list[tuple[str, str, bool]],
+    removed: list[tuple[str, str, bool]],
+) -> None:
+    """Collect the entries added and removed between two versions of a folder."""
+    if old is new:
+        return  # Shared subtree, nothing changed below here
+    for name in old.files.keys() - new.files.keys():
+        removed.append((join_path(relative, name), name, False))
+    for name in new.files.keys() - old.files.keys():
+        added.append((join_path(relative, name), name, False))
+
+    for name, child in old.folders.items():
+        if name not in new.folders and not name.startswith("."):
+            path = join_path(relative, name)
+            removed.append((path, name, True))
+            walk_entries(child, path, removed)
+    for name, child in new.folders.items():
+        if name.startswith("."):
+            continue
+        path = join_path(relative, name)
+        previous = old.folders.get(name)
+        if previous is None:
+            added.append((path, name, True))
+            walk_entries(child, path, added)
+        else:
+            diff_entries(previous, child, path, added, removed)
+
+
+class SearchIndex:
+    """N-gram index of folder and file names in the library.
+
+    Postings are append-only arrays of entry IDs, which take a fraction of
+    the memory of sets. Removed entries are dropped from ``_entries`` and
+    skipped when found in postings; once they outnumber the live entries,
+    the postings are rebuilt.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[int, SearchEntry] = {}
+        self._ids: dict[str, int] = {}  # Path -> entry ID
+        self._postings = new_postings()  # Gram -> entry IDs
+        self._next_id = 0
+        self._stale = 0  # Removed entries still in postings
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def update(self, previous: LibraryFolder | None, tree: LibraryFolder) -> None:
+        """Apply the difference between two library trees (blocking).
+
+        The diff is worked out before taking the lock, so searches only
+        wait while the changed entries are applied.
+        """
+        added: list[tuple[str, str, bool]] = []
+        removed: list[tuple[str, str, bool]] = []
+        diff_entries(previous or EMPTY_FOLDER, tree, "", added, removed)
+        with self._lock:
+            for path, _name, _is_folder in removed:
+                self._remove(path)
+            for path, name, is_folder in added:
+                self._add(path, name, is_folder)
+            self.loaded = True
+
+        if self._stale > len(self._entries):
+            # Only this thread changes entries, so they can be read unlocked
+            postings = self._build_postings(self._entries)
+            with self._lock:
+                self._postings = postings
+                self._stale = 0
+
+    def _add(self, path: str, name: str, is_folder: bool) -> None:
+        if path in self._ids:
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        entry = SearchEntry(
+            path=path,
+            name=name,
+            key=normalize(name),
+            is_folder=is_folder,
+            order=("1" if not is_folder else "0") + path.casefold(),
+        )
+        self._entries[entry_id] = entry
+        self._ids[path] = entry_id
+        postings = self._postings
+        for gram in get_grams(entry.key):
+            postings[gram].append(entry_id)
+
+    def _remove(self, path: str) -> None:
+        entry_id = self._ids.pop(path, None)
+        if entry_id is not None:
+            del self._entries[entry_id]
+            self._stale += 1
+
+    @staticmethod
+    def _build_postings(entries: dict[int, SearchEntry]) -> defaultdict[str, "array[int]"]:
+        postings = new_postings()
+        for entry_id, entry in entries.items():
+            for gram in get_grams(entry.key):
+                postings[gram].append(entry_id)
+        return postings
+
+    def search(self, query: str, limit: int) -> tuple[list[SearchEntry], int]:
+        """Find entries whose name contains every term of the query.
+
+        Returns the best ``limit`` matches and the total number of matches.
+        Exact names rank first, then names starting with the first term,
+        then folders before files.
+        """
+        terms = normalize(query).split()
+        if not terms:
+            return [], 0
+
+        grams = set().union(*(get_query_grams(term) for term in terms))
+        with self._lock:
+            postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+            ids = set(postings[0])
+            for other in postings[1:]:
+                if not ids:
+                    break
+                ids.intersection_update(other)
+            entries = self._entries
+            candidates = [entries[i] for i in ids if i in entries]
+        if len(terms) == 1 and len(terms[0]) <= GRAM_SIZE:
+            matches = candidates  # The postings were for the whole term
+        else:
+            matches = [entry for entry in candidates if all(term in entry.key for term in terms)]
+
+        # Rank in tiers, so each is sorted on the cheap ``order`` key alone
+        whole = " ".join(terms)
+        first = terms[0]
+        tiers: tuple[list[SearchEntry], ...] = ([], [], [])  # Exact, prefix, other
+        for entry in matches:
+            key = entry.key
+            tiers[0 if key == whole else 1 if key.startswith(first) else 2].append(entry)
+        best: list[SearchEntry] = []
+        for tier in tiers:
+            if len(best) >= limit:
+                break
+            best += heapq.nsmallest(limit - len(best), tier, key=get_order)
+        return best, len(matches)
+
+
+_indexes: dict[Path, SearchIndex] = {}
+
+
+def get_search_index(settings: Settings) -> SearchIndex:
+    """Get the process-wide search index, following the library index."""
+    index = _indexes.get(settings.media_path)
+    if index is None:
+        index = SearchIndex()
+        _indexes[settings.media_path] = index
+        get_library_index(settings).subscribe(index.update)
+    return index
+
+
+def search_library(
+    query: str, limit: int, settings: Settings
+) -> tuple[list[SearchResult], int] | None:
+    """Search folder and file names, or None until the library has been indexed (blocking)."""
+    index = get_search_index(settings)
+    if not index.loaded:
+        return None
+
+    entries, total = index.search(query, limit)
+    results = [
+        SearchResult(
+            name=entry.name,
+            path=encode_path(entry.path),
+            folder=encode_path(entry.path.rpartition("/")[0]),
+            is_folder=entry.is_folder,
+        )
+        for entry in entries
+    ]
+    return results, total
@@ -0,0 +1,131 @@
+"""Blocking work on the media library, run off the event loop.
+
+Reads of the library (stats, directory listings, playlist files) take as
+long as the filesystem under them, which on a network share has no upper
+bound. Routes run them on a dedicated thread pool, apart from the default
+executor used for the cache and databases, and wait for each at most
+``STORAGE_TIMEOUT`` seconds. A request whose storage stops answering fails
+with 503 while requests for the rest of the library carry on.
+
+A timed-out call can't be interrupted, so its thread stays busy until the
+filesystem answers; ``STORAGE_THREADS`` leaves room for a few of those.
+Calls that time out before starting are dropped rather than run late, and
+once every thread is stuck new calls fail straight away instead of
+queueing behind them.
+"""
+
+import asyncio
+import threading
+from collections.abc import AsyncIterator, Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from ..config import Settings
+
+T = TypeVar("T")
+
+_DONE = object()  # Returned by next() once an iterator is exhausted
+
+
+class StorageTimeoutError(Exception):
+    """A library filesystem operation didn't finish within its timeout."""
+
+
+_storage_pool: ThreadPoolExecutor | None = None
+_storage_threads = 0  # Size of the pool
+_stuck = 0  # Timed-out calls still holding a storage thread
+_stuck_lock = threading.Lock()
+
+
+class StorageCall:
+    """A call on the storage pool, counted as stuck if it outlives its timeout."""
+
+    def __init__(self, func: Callable[..., Any], args: tuple[object, ...]) -> None:
+        self.func = func
+        self.args = args
+        self.started = False
+        self.finished = False
+        self.abandoned = False
+
+    def __call__(self) -> Any:
+        with _stuck_lock:
+            if self.abandoned:
+                # Timed out while queued; nobody is waiting for the result
+                raise StorageTimeoutError(f"{self.name} timed out")
+            self.started = True
+        try:
+            return self.func(*self.args)
+        finally:
+            self._finish()
+
+    @property
+    def name(self) -> str:
+        """Name of the function, for error messages."""
+        return getattr(self.func, "__name__", repr(self.func))
+
+    def abandon(self) -> None:
+        """Give up on the call; if it's running, its thread counts as stuck until it returns."""
+        global _stuck
+        with _stuck_lock:
+            self.abandoned = True
+            if self.started and not self.finished:
+                _stuck += 1
+
+    def _finish(self) -> None:
+        global _stuck
+        with _stuck_lock:
+            self.finished = True
+            if self.abandoned:
+                _stuck -= 1
+
+
+def get_stuck_threads() -> int:
+    """Number of storage threads held by calls that have timed out."""
+    return _stuck
+
+
+def get_storage_pool(settings: Settings) -> ThreadPoolExecutor:
+    """Get the thread pool blocking library operations run on."""
+    global _storage_pool, _storage_threads
+    if _storage_pool is None:
+        _storage_threads = max(1, settings.storage_threads)
+        _storage_pool = ThreadPoolExecutor(
+            max_workers=_storage_threads,
+            thread_name_prefix="storage",
+        )
+    return _storage_pool
+
+
+async def run_blocking(
+    settings: Settings, func: Callable[..., T], *args: object, timeout: float | None = None
+) -> T:
+    """Run a blocking library operation on the storage pool.
+
+    Waits at most ``timeout`` seconds, or ``STORAGE_TIMEOUT`` if not
+    given (0 waits indefinitely), then raises StorageTimeoutError. Also
+    raises it without waiting while every storage thread is stuck.
+    """
+    if timeout is None:
+        timeout = settings.storage_timeout
+    call = StorageCall(func, args)
+    pool = get_storage_pool(settings)
+    if _stuck >= _storage_threads:
+        raise StorageTimeoutError(f"{call.name}: every storage thread is stuck")
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(pool, call)
+    try:
+        result: T = await asyncio.wait_for(future, timeout or None)
+    except TimeoutError:
+        call.abandon()
+        raise StorageTimeoutError(f"{call.name} timed out") from None
+    return result
+
+
+async def iterate_blocking(settings: Settings, iterator: Iterator[T]) -> AsyncIterator[T]:
+    """Consume a blocking iterator on the storage pool, one item at a time."""
+    while True:
+        item = await run_blocking(settings, next, iterator, _DONE)
+        if item is _DONE:
+            return
+        yield item
@@ -1,25 +1,81 @@
 """Audio transcoding service using FFmpeg."""
 
 import asyncio
+import contextlib
+import fcntl
 import hashlib
-import subprocess
+import heapq
+import itertools
+import json
+import os
+import shutil
+import time
+from collections.abc import Callable, Collection, Hashable
+from dataclasses import dataclass
+from enum import IntEnum
 from pathlib import Path
-from typing import AsyncIterator
+from typing import Any, AsyncIterator, BinaryIO
 
 from ..config import Settings
+from .cache import get_cache_index, get_output_profile, schedule_eviction
+from .headers import read_audio_info
+from .storage import StorageTimeoutError, run_blocking
+
+LOCK_POLL_INTERVAL = 0.25  # Seconds between checks on another process's encode
+FFPROBE_TIMEOUT = 10  # Seconds before a probe is killed
+DEMOTED_NICE = 19  # Niceness of encodes whose listeners have gone
+HLS_DIRNAME = "hls"  # Cache subdirectory holding segmented output
+
+
+@dataclass(frozen=True)
+class OutputCodec:
+    """File format of transcoded output."""
+
+    extension: str
+    media_type: str
+    muxer: str  # FFmpeg output format
+
+
+OUTPUT_CODECS = {
+    "mp3": OutputCodec(".mp3", "audio/mpeg", "mp3"),
+    "opus": OutputCodec(".opus", "audio/ogg", "ogg"),
+}
+
+
+# Media types of source formats, for serving files as they are
+SOURCE_MEDIA_TYPES = {
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "flac": "audio/flac",
+    "ogg": "audio/ogg",
+    "m4a": "audio/mp4",
+    "mp4": "audio/mp4",
+}
+
+
+def get_output_codec(settings: Settings) -> OutputCodec:
+    """Get the format files are transcoded to."""
+    return OUTPUT_CODECS[settings.audio_codec]
 
 
 def get_cache_key(file_path: Path, settings: Settings) -> str:
     """Generate a cache key based on file path, mtime, and output settings."""
     stat = file_path.stat()
     key_data = f"{file_path}:{stat.st_mtime}:{settings.audio_quality}:{settings.audio_bitrate}"
+    if settings.audio_codec != "mp3":
+        # MP3 keys predate the codec setting and stay as they were
+        key_data += f":{settings.audio_codec}"
     return hashlib.sha256(key_data.encode()).hexdigest()[:16]
 
 
 def get_cached_path(file_path: Path, settings: Settings) -> Path:
-    """Get the path where the cached transcoded file would be stored."""
+    """Get the path where the cached transcoded file would be stored.
+
+    Each output profile has its own key and extension, so profiles are
+    cached side by side.
+    """
     cache_key = get_cache_key(file_path, settings)
-    return settings.cache_path / f"{cache_key}.mp3"
+    return settings.cache_path / f"{cache_key}{get_output_codec(settings).extension}"
 
 
 def is_mp3_passthrough(file_path: Path) -> bool:
@@ -27,132 +83,682 @@ def is_mp3_passthrough(file_path: Path) -> bool:
     return file_path.suffix.lower() == ".mp3"
 
 
-def get_audio_duration(file_path: Path) -> float | None:
-    """Get audio duration using ffprobe."""
+def is_native_passthrough(file_path: Path, formats: Collection[str]) -> bool:
+    """Check if a file can be served as-is to a client that plays ``formats``.
+
+    ``formats`` holds lowercase extensions without the dot. MP3 is played
+    everywhere and is always passed through.
+    """
+    return is_mp3_passthrough(file_path) or file_path.suffix.lower().lstrip(".") in formats
+
+
+async def stop_process(process: asyncio.subprocess.Process) -> None:
+    """Kill a child process if it is still running and reap it.
+
+    The wait is shielded so the process is reaped even when the caller is
+    being cancelled.
+    """
+    if process.returncode is None:
+        with contextlib.suppress(ProcessLookupError):
+            process.kill()
+    with contextlib.suppress(asyncio.CancelledError):
+        await asyncio.shield(process.wait())
+
+
+def set_niceness(pid: int, niceness: int) -> None:
+    """Change the CPU priority of a child process, if it is still running."""
+    with contextlib.suppress(OSError):
+        os.setpriority(os.PRIO_PROCESS, pid, niceness)
+
+
+async def run_ffprobe(file_path: Path, entries: str, output_format: str) -> str | None:
+    """Run ffprobe on a file and return its output, or None if it failed.
+
+    The process is killed if it runs past FFPROBE_TIMEOUT or the caller is
+    cancelled.
+    """
     try:
-        result = subprocess.run(
-            [
-                "ffprobe",
-                "-v", "quiet",
-                "-show_entries", "format=duration",
-                "-of", "default=noprint_wrappers=1:nokey=1",
-                str(file_path),
-            ],
-            capture_output=True,
-            text=True,
-            timeout=10,
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe",
+            "-v", "quiet",
+            "-show_entries", entries,
+            "-of", output_format,
+            str(file_path),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
         )
-        if result.returncode == 0 and result.stdout.strip():
-            return float(result.stdout.strip())
-    except (subprocess.TimeoutExpired, ValueError, FileNotFoundError):
-        pass
-    return None
+    except OSError:
+        return None
 
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), FFPROBE_TIMEOUT)
+    except TimeoutError:
+        return None
+    finally:
+        await stop_process(process)
+    if process.returncode != 0:
+        return None
+    return stdout.decode(errors="replace")
+
+
+async def read_headers(file_path: Path, settings: Settings | None) -> dict[str, Any] | None:
+    """Read a file's audio info from its headers off the event loop.
+
+    With ``settings`` the read runs on the storage pool, under its timeout;
+    without, on the default executor.
+    """
+    if settings is None:
+        return await asyncio.to_thread(read_audio_info, file_path)
+    return await run_blocking(settings, read_audio_info, file_path)
 
-def get_audio_info(file_path: Path) -> dict:
-    """Get audio metadata using ffprobe."""
+
+async def probe_audio_info(
+    file_path: Path, settings: Settings | None = None
+) -> dict[str, Any] | None:
+    """Get audio metadata, or None if the file can't be probed.
+
+    Common formats are read from their headers on a worker thread (the
+    storage pool, given ``settings``); ffprobe is only spawned for the rest
+    and for files the header readers can't parse.
+    """
+    info = await read_headers(file_path, settings)
+    if info is not None:
+        return info
+
+    output = await run_ffprobe(
+        file_path, "format=duration,bit_rate:stream=sample_rate,channels", "json"
+    )
+    if output is None:
+        return None
     try:
-        result = subprocess.run(
-            [
-                "ffprobe",
-                "-v", "quiet",
-                "-show_entries", "format=duration,bit_rate:stream=sample_rate,channels",
-                "-of", "json",
-                str(file_path),
-            ],
-            capture_output=True,
-            text=True,
-            timeout=10,
-        )
-        if result.returncode == 0:
-            import json
-            data = json.loads(result.stdout)
-            format_info = data.get("format", {})
-            stream_info = data.get("streams", [{}])[0] if data.get("streams") else {}
-            
-            return {
-                "duration": float(format_info.get("duration", 0)),
-                "bitrate": int(format_info.get("bit_rate", 0)) // 1000 if format_info.get("bit_rate") else None,
-                "sample_rate": int(stream_info.get("sample_rate", 0)) if stream_info.get("sample_rate") else None,
-                "channels": stream_info.get("channels"),
-            }
-    except (subprocess.TimeoutExpired, ValueError, FileNotFoundError):
-        pass
-    return {"duration": 0, "bitrate": None, "sample_rate": None, "channels": None}
-
-
-def transcode_to_cache(file_path: Path, cache_path: Path, settings: Settings) -> bool:
-    """Transcode a file to MP3 and save to cache."""
-    cache_path.parent.mkdir(parents=True, exist_ok=True)
-    
+        data = json.loads(output)
+        format_info = data.get("format", {})
+        stream_info = data.get("streams", [{}])[0] if data.get("streams") else {}
+
+        return {
+            "duration": float(format_info.get("duration", 0)),
+            "bitrate": int(format_info.get("bit_rate", 0)) // 1000 if format_info.get("bit_rate") else None,
+            "sample_rate": int(stream_info.get("sample_rate", 0)) if stream_info.get("sample_rate") else None,
+            "channels": stream_info.get("channels"),
+        }
+    except ValueError:
+        return None
+
+
+async def get_audio_info(file_path: Path, settings: Settings | None = None) -> dict[str, Any]:
+    """Get audio metadata from the file's headers, or using ffprobe."""
+    info = await probe_audio_info(file_path, settings)
+    if info is None:
+        return {"duration": 0, "bitrate": None, "sample_rate": None, "channels": None}
+    return info
+
+
+def get_encoder_args(settings: Settings) -> list[str]:
+    """Get the FFmpeg arguments that encode audio in the configured codec."""
+    if settings.audio_codec == "opus":
+        return ["-codec:a", "libopus", "-b:a", f"{settings.audio_bitrate}k"]
     # Use VBR by default, fall back to CBR
-    cmd = [
+    return ["-codec:a", "libmp3lame", "-q:a", str(settings.audio_quality)]
+
+
+def build_transcode_command(
+    file_path: Path, output: str, settings: Settings, start: float = 0.0
+) -> list[str]:
+    """Build the FFmpeg command that encodes a file in the configured codec.
+
+    ``output`` is either a file path or ``pipe:1`` for streaming to stdout.
+    A non-zero ``start`` skips that many seconds of input. MP3 input is
+    copied rather than re-encoded.
+    """
+    # Seek on the input side so FFmpeg doesn't decode the skipped audio
+    seek = ["-ss", f"{start:.3f}"] if start > 0 else []
+
+    muxer = get_output_codec(settings).muxer
+    if is_mp3_passthrough(file_path):
+        codec = ["-codec:a", "copy"]
+        muxer = "mp3"
+    else:
+        codec = get_encoder_args(settings)
+
+    return [
         "ffmpeg",
+        "-nostdin",
         "-y",  # Overwrite output
+        "-threads", str(settings.transcode_threads),
+        *seek,
         "-i", str(file_path),
         "-vn",  # No video
-        "-codec:a", "libmp3lame",
-        "-q:a", str(settings.audio_quality),  # VBR quality
-        str(cache_path),
+        *codec,
+        "-f", muxer,
+        output,
     ]
-    
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            timeout=300,  # 5 minute timeout
+
+
+def get_temp_path(cache_path: Path) -> Path:
+    """Get the temporary path an in-progress encode writes to before promotion."""
+    return cache_path.with_name(f"{cache_path.name}.part")
+
+
+def get_lock_path(cache_path: Path) -> Path:
+    """Get the lock file guarding encodes of a cache entry across processes."""
+    return cache_path.with_name(f"{cache_path.name}.lock")
+
+
+def lock_cache_entry(cache_path: Path, blocking: bool = False) -> int | None:
+    """Take the cross-process lock for a cache entry.
+
+    Returns the lock file descriptor, or None if another process holds the
+    lock and ``blocking`` is False.
+    """
+    lock_path = get_lock_path(cache_path)
+    flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+    while True:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        # The previous holder unlinks the lock file on release; make sure we
+        # locked the file that is still in place and not an orphaned inode.
+        try:
+            if os.stat(lock_path).st_ino == os.fstat(fd).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+
+def unlock_cache_entry(cache_path: Path, fd: int) -> None:
+    """Release a lock taken with lock_cache_entry."""
+    get_lock_path(cache_path).unlink(missing_ok=True)
+    os.close(fd)
+
+
+def lower_priority(process: asyncio.subprocess.Process, settings: Settings) -> None:
+    """Run a freshly started encoder at reduced CPU priority.
+
+    Encodes shouldn't starve request handling. The niceness is set after
+    the spawn rather than by running FFmpeg under ``nice``, so a missing
+    FFmpeg fails to start instead of showing up later as nice's exit status.
+    """
+    if settings.transcode_nice:
+        set_niceness(process.pid, settings.transcode_nice)
+
+
+async def start_transcode_process(
+    file_path: Path, settings: Settings, start: float = 0.0
+) -> asyncio.subprocess.Process:
+    """Launch FFmpeg encoding a file on stdout.
+
+    Raises OSError if FFmpeg cannot be started.
+    """
+    cmd = build_transcode_command(file_path, "pipe:1", settings, start=start)
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    lower_priority(process, settings)
+    return process
+
+
+class TranscodePriority(IntEnum):
+    """Scheduling class of an encode; lower values run first."""
+
+    INTERACTIVE = 0  # A listener is waiting now
+    PREFETCH = 1  # Likely to be played soon
+    BACKGROUND = 2  # Cache warmup
+
+
+# A waiter in the scheduler's heap: priority, arrival order, the future that
+# is given the slot (and the priority it ran at) and the key it was queued under
+QueueEntry = tuple[TranscodePriority, int, asyncio.Future[TranscodePriority], Hashable]
+
+
+@dataclass
+class QueueStats:
+    """Wait-time counters for one priority class."""
+
+    started: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+
+class TranscodeScheduler:
+    """Admits FFmpeg encodes up to a concurrency limit, highest priority first.
+
+    Callers wrap each encode in ``slot()``. Waiters of the same priority are
+    served in arrival order, and a queued encode can be promoted when a more
+    urgent request starts waiting on it. Running encodes nobody is waiting
+    for can be marked preemptible; they are stopped when a more urgent
+    encode would otherwise have to queue behind them.
+    """
+
+    def __init__(self, concurrency: int) -> None:
+        self.concurrency = max(1, concurrency)
+        self.active = 0
+        self._queue: list[QueueEntry] = []
+        self._seq = itertools.count()
+        self._stats = {priority: QueueStats() for priority in TranscodePriority}
+        self._preemptible: dict[Hashable, Callable[[], object]] = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(
+        self, priority: TranscodePriority, key: Hashable = None
+    ) -> AsyncIterator[None]:
+        """Wait for a free encode slot and hold it for the duration of the block."""
+        queued_at = time.monotonic()
+        if self.active < self.concurrency and not self.queued():
+            self.active += 1
+        else:
+            future: asyncio.Future[TranscodePriority] = (
+                asyncio.get_running_loop().create_future()
+            )
+            heapq.heappush(self._queue, (priority, next(self._seq), future, key))
+            if priority < TranscodePriority.BACKGROUND and self._preemptible:
+                # Make room by stopping an encode nobody is waiting for
+                _, stop = self._preemptible.popitem()
+                stop()
+            try:
+                # Promotion may have changed the priority while queued
+                priority = await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as we were cancelled
+                    self._release()
+                raise
+
+        stats = self._stats[priority]
+        wait = time.monotonic() - queued_at
+        stats.started += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        """Hand a finished slot to the next waiter, or free it."""
+        while self._queue:
+            priority, _, future, _ = heapq.heappop(self._queue)
+            if not future.done():
+                future.set_result(priority)
+                return
+        self.active -= 1
+
+    def promote(self, key: Hashable, priority: TranscodePriority) -> None:
+        """Raise the priority of queued encodes registered under ``key``."""
+        changed = False
+        for i, (entry_priority, seq, future, entry_key) in enumerate(self._queue):
+            if entry_key == key and entry_priority > priority:
+                self._queue[i] = (priority, seq, future, entry_key)
+                changed = True
+        if changed:
+            heapq.heapify(self._queue)
+
+    def mark_preemptible(self, key: Hashable, stop: Callable[[], object]) -> None:
+        """Let a running encode be stopped, by calling ``stop``, to free its slot."""
+        self._preemptible[key] = stop
+
+    def unmark_preemptible(self, key: Hashable) -> None:
+        """Undo mark_preemptible()."""
+        self._preemptible.pop(key, None)
+
+    def queued(self, priority: TranscodePriority | None = None) -> int:
+        """Number of encodes waiting for a slot, optionally for one priority."""
+        return sum(
+            1
+            for entry_priority, _, future, _ in self._queue
+            if not future.done() and priority in (None, entry_priority)
         )
-        return result.returncode == 0
-    except subprocess.TimeoutExpired:
-        # Clean up partial file
-        if cache_path.exists():
-            cache_path.unlink()
+
+    def stats(self) -> dict[str, Any]:
+        """Current queue depth and wait times per priority class."""
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "queues": [
+                {
+                    "priority": priority.name.lower(),
+                    "queued": self.queued(priority),
+                    "started": stats.started,
+                    "average_wait": stats.total_wait / stats.started if stats.started else 0.0,
+                    "max_wait": stats.max_wait,
+                }
+                for priority, stats in self._stats.items()
+            ],
+        }
+
+
+_scheduler: TranscodeScheduler | None = None
+
+
+def get_scheduler(settings: Settings) -> TranscodeScheduler:
+    """Get the process-wide transcode scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = TranscodeScheduler(settings.transcode_concurrency)
+    return _scheduler
+
+
+class TranscodeJob:
+    """A single in-flight encode of one cache entry, shared by all its readers.
+
+    The first job for an entry in any worker process takes the entry's lock
+    file and runs FFmpeg, writing output to a temporary file that is renamed
+    into place on a clean exit. A job created while another process holds
+    the lock follows that encode instead. Either way, readers stream the
+    temporary file as it grows, so late arrivals attach to the progress made
+    so far rather than starting another encode.
+    """
+
+    def __init__(
+        self,
+        file_path: Path,
+        cache_path: Path,
+        settings: Settings,
+        priority: TranscodePriority = TranscodePriority.INTERACTIVE,
+    ) -> None:
+        self.file_path = file_path
+        self.cache_path = cache_path
+        self.settings = settings
+        self.priority = priority
+        # Background work runs to completion even with nobody listening
+        self.keep_alive = priority != TranscodePriority.INTERACTIVE
+        self.temp_path = get_temp_path(cache_path)
+        self.readers = 0
+        self.owner = False
+        self.spawn_failed = False
+        self.succeeded = False
+        self.demoted = False
+        self.started = asyncio.Event()
+        self.finished = asyncio.Event()
+        self._progress = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._process: asyncio.subprocess.Process | None = None
+
+    def start(self) -> None:
+        """Start encoding (or following another process's encode)."""
+        self._task = asyncio.create_task(self._run())
+
+    async def wait(self) -> bool:
+        """Wait for the job to finish. Returns True if the entry was cached."""
+        await self.finished.wait()
+        return self.succeeded
+
+    def promote(self, priority: TranscodePriority) -> None:
+        """Raise the job's priority if it is still waiting for a slot.
+
+        A demoted encode that gets a listener again is no longer preemptible.
+        """
+        if self.demoted and priority < TranscodePriority.BACKGROUND:
+            self.demoted = False
+            self.keep_alive = priority != TranscodePriority.INTERACTIVE
+            get_scheduler(self.settings).unmark_preemptible(self.cache_path)
+            # Restoring the niceness needs privileges we usually don't have
+            self._renice(self.settings.transcode_nice)
+        if priority < self.priority:
+            self.priority = priority
+            get_scheduler(self.settings).promote(self.cache_path, priority)
+
+    def _renice(self, niceness: int) -> None:
+        """Change the CPU priority of the running FFmpeg process."""
+        if self._process is not None and self._process.returncode is None:
+            set_niceness(self._process.pid, niceness)
+
+    def abandon(self) -> None:
+        """Handle the last reader leaving before the encode finished.
+
+        An encode that is still queued, or that is holding up other queued
+        encodes, is stopped. Otherwise it keeps going at the lowest CPU
+        priority, so the work done so far isn't wasted, until a more urgent
+        encode needs its slot.
+        """
+        if self._task is None or self.finished.is_set():
+            return
+        scheduler = get_scheduler(self.settings)
+        if self._process is None or scheduler.queued():
+            self._task.cancel()
+            return
+
+        self.demoted = True
+        self.keep_alive = True
+        self.priority = TranscodePriority.BACKGROUND
+        self._renice(DEMOTED_NICE)
+        scheduler.mark_preemptible(self.cache_path, self._task.cancel)
+
+    def _notify(self) -> None:
+        """Wake every reader waiting for more output."""
+        waiter, self._progress = self._progress, asyncio.Event()
+        waiter.set()
+
+    def _lock(self) -> int | None:
+        """Take the entry's lock, or None if another process holds it (blocking)."""
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        return lock_cache_entry(self.cache_path)
+
+    def _claim(self) -> bool:
+        """Check whether the entry is cached, else clear the way for an encode (blocking)."""
+        if get_cache_index(self.settings).has_file(self.cache_path):
+            return True
+        # Anything already here has no manifest entry to vouch for it
+        self.cache_path.unlink(missing_ok=True)
         return False
 
+    def _publish(self, written: int) -> bool:
+        """Move the finished output into place and index it (blocking).
 
-async def stream_file(file_path: Path) -> AsyncIterator[bytes]:
-    """Stream a file in chunks."""
-    chunk_size = 64 * 1024  # 64KB chunks
-    
-    with open(file_path, "rb") as f:
-        while chunk := f.read(chunk_size):
-            yield chunk
-            # Allow other tasks to run
-            await asyncio.sleep(0)
+        Indexing stats the source, so this runs on the storage pool.
+        """
+        self.temp_path.replace(self.cache_path)
+        entry = get_cache_index(self.settings).record(
+            self.file_path,
+            get_output_profile(self.settings),
+            self.cache_path,
+            expected_size=written,
+        )
+        return entry is not None
 
+    async def _run(self) -> None:
+        try:
+            # The cache and its index are only touched from worker threads
+            lock_fd = await asyncio.to_thread(self._lock)
+            if lock_fd is None:
+                await self._follow()
+                return
 
-async def stream_transcoded(file_path: Path, settings: Settings) -> AsyncIterator[bytes]:
-    """Stream a transcoded audio file.
-    
-    If cached, stream from cache. Otherwise, transcode on-the-fly and cache.
+            self.owner = True
+            try:
+                if await asyncio.to_thread(self._claim):
+                    # Another process finished just before we took the lock
+                    self.succeeded = True
+                else:
+                    scheduler = get_scheduler(self.settings)
+                    try:
+                        async with scheduler.slot(self.priority, key=self.cache_path):
+                            await self._encode()
+                    finally:
+                        scheduler.unmark_preemptible(self.cache_path)
+            finally:
+                await asyncio.to_thread(unlock_cache_entry, self.cache_path, lock_fd)
+        finally:
+            if not self.owner:
+                index = get_cache_index(self.settings)
+                self.succeeded = await asyncio.to_thread(index.has_file, self.cache_path)
+            self.started.set()
+            self.finished.set()
+            self._notify()
+            if _jobs.get(self.cache_path) is self:
+                del _jobs[self.cache_path]
+
+    async def _encode(self) -> None:
+        try:
+            process = await start_transcode_process(self.file_path, self.settings)
+        except OSError:
+            self.spawn_failed = True
+            return
+
+        assert process.stdout is not None
+        self._process = process
+        written = 0
+        try:
+            # Replace (not truncate) any orphan so stale readers keep their inode
+            self.temp_path.unlink(missing_ok=True)
+            with open(self.temp_path, "wb") as cache_file:
+                self.started.set()
+                while chunk := await process.stdout.read(self.settings.stream_chunk_size):
+                    cache_file.write(chunk)
+                    cache_file.flush()
+                    written += len(chunk)
+                    self._notify()
+
+            exit_status = await process.wait()
+            if exit_status == 0:
+                # Publish and index while still holding the lock, so every
+                # cache file other processes can see has a manifest entry
+                try:
+                    self.succeeded = await run_blocking(self.settings, self._publish, written)
+                except StorageTimeoutError:
+                    # The source stopped answering; its thread still finishes the entry
+                    return
+                schedule_eviction(self.settings)
+        finally:
+            # Abandoned or FFmpeg failed: stop encoding and drop the partial file
+            await stop_process(process)
+            if not self.succeeded:
+                self.temp_path.unlink(missing_ok=True)
+
+    async def _follow(self) -> None:
+        """Track an encode running in another process until it releases the lock."""
+        self.started.set()
+        while True:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            self._notify()
+            lock_fd = await asyncio.to_thread(lock_cache_entry, self.cache_path)
+            if lock_fd is not None:
+                await asyncio.to_thread(unlock_cache_entry, self.cache_path, lock_fd)
+                return
+
+    def _open_output(self) -> BinaryIO | None:
+        """Open the in-progress output, or the finished cache file (blocking)."""
+        try:
+            return open(self.temp_path, "rb")
+        except FileNotFoundError:
+            pass
+        try:
+            return open(self.cache_path, "rb")
+        except FileNotFoundError:
+            return None
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Yield the encoded output from the start, following it as it grows."""
+        self.readers += 1
+        try:
+            await self.started.wait()
+            output = await asyncio.to_thread(self._open_output)
+            while output is None and not self.finished.is_set():
+                await self._progress.wait()
+                output = await asyncio.to_thread(self._open_output)
+            if output is None:
+                return
+
+            # Reads happen on worker threads, so a slow disk stalls only this reader
+            chunk_size = self.settings.stream_chunk_size
+            with output:
+                while True:
+                    waiter = self._progress
+                    finished = self.finished.is_set()
+                    chunk = await asyncio.to_thread(output.read, chunk_size)
+                    if chunk:
+                        yield chunk
+                    elif finished:
+                        return
+                    else:
+                        await waiter.wait()
+        finally:
+            self.readers -= 1
+            if self.readers == 0 and not self.keep_alive:
+                # Nobody is listening any more
+                self.abandon()
+
+
+# In-flight transcode jobs in this process, keyed by cache path
+_jobs: dict[Path, TranscodeJob] = {}
+
+
+def get_transcode_job(
+    file_path: Path,
+    cache_path: Path,
+    settings: Settings,
+    priority: TranscodePriority = TranscodePriority.INTERACTIVE,
+) -> TranscodeJob:
+    """Get the in-flight job for a cache entry, starting one if needed.
+
+    Joining an existing job at a more urgent priority promotes it, and
+    joining at a background priority keeps it running without readers.
+    """
+    job = _jobs.get(cache_path)
+    if job is None:
+        job = TranscodeJob(file_path, cache_path, settings, priority)
+        _jobs[cache_path] = job
+        job.start()
+    else:
+        job.promote(priority)
+        if priority != TranscodePriority.INTERACTIVE:
+            job.keep_alive = True
+    return job
+
+
+async def transcode_to_cache(
+    file_path: Path,
+    cache_path: Path,
+    settings: Settings,
+    priority: TranscodePriority = TranscodePriority.BACKGROUND,
+) -> bool:
+    """Transcode a file and save it to the cache.
+
+    Joins any encode of the same entry already running in this or another
+    process instead of encoding it a second time. Returns True once the
+    entry is cached.
+    """
+    return await get_transcode_job(file_path, cache_path, settings, priority).wait()
+
+
+async def stream_seek(
+    file_path: Path, settings: Settings, start: float, cache_path: Path | None = None
+) -> AsyncIterator[bytes]:
+    """Stream a file transcoded from ``start`` seconds in.
+
+    The output is encoded on the fly and not cached, so seeking costs one
+    FFmpeg startup however long the file is. With a ``cache_path``, the
+    full encode of that cache entry is queued once this stream has its slot,
+    so later requests are served from the cache.
     """
-    cached_path = get_cached_path(file_path, settings)
-    
-    # Check if already cached
-    if cached_path.exists():
-        async for chunk in stream_file(cached_path):
-            yield chunk
-        return
-    
-    # Check if MP3 passthrough
     if is_mp3_passthrough(file_path):
-        async for chunk in stream_file(file_path):
-            yield chunk
-        return
-    
-    # Transcode to cache first, then stream
-    # This is simpler than streaming while transcoding
-    success = await asyncio.get_event_loop().run_in_executor(
-        None, transcode_to_cache, file_path, cached_path, settings
-    )
-    
-    if success and cached_path.exists():
-        async for chunk in stream_file(cached_path):
-            yield chunk
+        # Copying MP3 frames is cheap; no need to wait for a slot
+        slot: contextlib.AbstractAsyncContextManager[None] = contextlib.nullcontext()
     else:
-        # Fallback: stream original if transcoding failed
-        async for chunk in stream_file(file_path):
-            yield chunk
+        slot = get_scheduler(settings).slot(TranscodePriority.INTERACTIVE)
+
+    async with slot:
+        if cache_path is not None:
+            get_transcode_job(file_path, cache_path, settings, TranscodePriority.PREFETCH)
+        try:
+            process = await start_transcode_process(file_path, settings, start=start)
+        except OSError:
+            return
+
+        assert process.stdout is not None
+        try:
+            while chunk := await process.stdout.read(settings.stream_chunk_size):
+                yield chunk
+        finally:
+            await stop_process(process)
 
 
 def ensure_cache_dir(settings: Settings) -> None:
@@ -160,11 +766,56 @@ def ensure_cache_dir(settings: Settings) -> None:
     settings.cache_path.mkdir(parents=True, exist_ok=True)
 
 
+def sweep_cache(settings: Settings) -> int:
+    """Remove leftovers of interrupted encodes from the cache directory.
+
+    Deletes temp and lock files that no live process holds, and cache files
+    with no index entry, since those can't be shown to be complete. Returns
+    the number of files removed.
+    """
+    cache_dir = settings.cache_path
+    index = get_cache_index(settings)
+    removed = 0
+
+    for leftover in [*cache_dir.glob("*.part"), *cache_dir.glob("*.lock")]:
+        cache_path = leftover.with_suffix("")
+        lock_fd = lock_cache_entry(cache_path)
+        if lock_fd is None:
+            continue  # Still being encoded
+        try:
+            if leftover.suffix == ".part" and leftover.exists():
+                leftover.unlink()
+                removed += 1
+        finally:
+            # Releasing also removes the lock file
+            unlock_cache_entry(cache_path, lock_fd)
+
+    indexed = index.cache_names()
+    outputs = [
+        cache_path
+        for codec in OUTPUT_CODECS.values()
+        for cache_path in cache_dir.glob(f"*{codec.extension}")
+    ]
+    for cache_path in outputs:
+        if cache_path.name in indexed:
+            continue
+        lock_fd = lock_cache_entry(cache_path)
+        if lock_fd is None:
+            continue
+        try:
+            # Check again under the lock in case an encode just finished
+            if not index.has_file(cache_path):
+                cache_path.unlink(missing_ok=True)
+                removed += 1
+        finally:
+            unlock_cache_entry(cache_path, lock_fd)
+
+    return removed
+
+
 def get_cache_size(settings: Settings) -> int:
     """Get total size of cached files in bytes."""
-    if not settings.cache_path.exists():
-        return 0
-    return sum(f.stat().st_size for f in settings.cache_path.glob("*.mp3"))
+    return get_cache_index(settings).total_size
 
 
 def clear_cache(settings: Settings) -> int:
@@ -173,7 +824,13 @@ def clear_cache(settings: Settings) -> int:
         return 0
     
     count = 0
-    for f in settings.cache_path.glob("*.mp3"):
-        f.unlink()
-        count += 1
+    for codec in OUTPUT_CODECS.values():
+        for f in settings.cache_path.glob(f"*{codec.extension}"):
+            f.unlink()
+            count += 1
+    hls_dir = settings.cache_path / HLS_DIRNAME
+    if hls_dir.exists():
+        count += sum(1 for _ in hls_dir.glob("*/*.ts"))
+        shutil.rmtree(hls_dir, ignore_errors=True)
+    get_cache_index(settings).clear()
     return count
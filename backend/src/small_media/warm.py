@@ -0,0 +1,184 @@
+"""Pre-warm the transcode cache for a whole library.
+
+Usage::
+
+    python -m small_media.warm [SUBTREE] [--jobs N] [--restart]
+
+Walks ``MEDIA_PATH`` (or a subtree of it) and transcodes every file that
+would otherwise be transcoded on first play. Encodes run in a process pool
+sized to the host's cores. Files that finish are appended to a checkpoint
+in the cache directory, so an interrupted run picks up where it stopped.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+
+from .config import Settings, get_settings
+from .services.cache import get_cache_index, get_output_profile
+from .services.filesystem import is_audio_file, is_safe_path
+from .services.metadata import load_audio_duration
+from .services.transcoder import (
+    ensure_cache_dir,
+    get_cached_path,
+    is_mp3_passthrough,
+    transcode_to_cache,
+)
+
+CHECKPOINT_FILENAME = "warm-checkpoint.txt"
+
+
+@dataclass
+class WarmResult:
+    """Outcome of warming one file."""
+
+    path: str
+    status: str  # "encoded", "cached" or "failed"
+    duration: float = 0.0  # Seconds of audio encoded
+
+
+def find_warm_targets(root: Path, settings: Settings) -> list[Path]:
+    """List the files under ``root`` that are transcoded on playback."""
+    allowed_ext = settings.allowed_extensions_set
+    targets = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            file_path = Path(dirpath) / filename
+            if is_audio_file(filename, allowed_ext) and not is_mp3_passthrough(file_path):
+                targets.append(file_path)
+    return targets
+
+
+def load_checkpoint(checkpoint: Path) -> set[str]:
+    """Read the files finished by previous runs."""
+    try:
+        return set(checkpoint.read_text(encoding="utf-8").splitlines())
+    except FileNotFoundError:
+        return set()
+
+
+async def _warm_file(file_path: Path, settings: Settings) -> WarmResult:
+    index = get_cache_index(settings)
+    try:
+        if index.lookup(file_path, get_output_profile(settings)) is not None:
+            return WarmResult(str(file_path), "cached")
+        cached_path = get_cached_path(file_path, settings)
+        if not await transcode_to_cache(file_path, cached_path, settings):
+            return WarmResult(str(file_path), "failed")
+    except OSError:
+        return WarmResult(str(file_path), "failed")
+    duration = await load_audio_duration(file_path, settings) or 0.0
+    return WarmResult(str(file_path), "encoded", duration)
+
+
+def warm_file(file_path: Path, settings: Settings) -> WarmResult:
+    """Transcode one file into the cache unless a valid entry exists.
+
+    Runs in a worker process.
+    """
+    return asyncio.run(_warm_file(file_path, settings))
+
+
+def warm_cache(
+    root: Path, settings: Settings, jobs: int, restart: bool = False
+) -> dict[str, int]:
+    """Warm every target under ``root``, printing progress and throughput.
+
+    Returns a count of files per outcome.
+    """
+    ensure_cache_dir(settings)
+    checkpoint = settings.cache_path / CHECKPOINT_FILENAME
+    if restart:
+        checkpoint.unlink(missing_ok=True)
+    done = load_checkpoint(checkpoint)
+
+    targets = [path for path in find_warm_targets(root, settings) if str(path) not in done]
+    counts = {"encoded": 0, "cached": 0, "failed": 0, "resumed": len(done)}
+    total = len(targets)
+    print(f"Warming {total} files under {root} with {jobs} workers", flush=True)
+
+    started = time.monotonic()
+    audio_seconds = 0.0
+    # Workers open their own cache index; SQLite connections must not be
+    # inherited across fork()
+    context = multiprocessing.get_context("spawn")
+    with (
+        ProcessPoolExecutor(max_workers=jobs, mp_context=context) as executor,
+        open(checkpoint, "a", encoding="utf-8") as log,
+    ):
+        # Keep a couple of files queued per worker so a huge library isn't
+        # submitted up front
+        remaining = iter(targets)
+        pending: set[Future[WarmResult]] = set()
+        finished = 0
+        while True:
+            while len(pending) < jobs * 2 and (file_path := next(remaining, None)):
+                pending.add(executor.submit(warm_file, file_path, settings))
+            if not pending:
+                break
+
+            completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                result = future.result()
+                finished += 1
+                counts[result.status] += 1
+                audio_seconds += result.duration
+                if result.status != "failed":
+                    # Failures are retried on the next run
+                    log.write(result.path + "\n")
+                    log.flush()
+                print(f"[{finished}/{total}] {result.status:7} {result.path}", flush=True)
+
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print(
+        f"Encoded {counts['encoded']}, already cached {counts['cached']}, "
+        f"failed {counts['failed']} in {elapsed:.1f}s "
+        f"({finished / elapsed:.2f} files/sec, "
+        f"{audio_seconds / 3600 / elapsed:.4f} audio-hours/sec)"
+    )
+
+    if counts["failed"] == 0:
+        # Everything is in the cache; the next run starts fresh
+        checkpoint.unlink(missing_ok=True)
+    return counts
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(
+        prog="python -m small_media.warm",
+        description="Transcode a media library into the cache ahead of playback.",
+    )
+    parser.add_argument(
+        "subtree", nargs="?", default="", help="folder relative to MEDIA_PATH (default: all)"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="parallel encodes (default: number of CPU cores)",
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore the checkpoint of a previous run"
+    )
+    args = parser.parse_args(argv)
+
+    settings = get_settings()
+    if args.subtree and not is_safe_path(settings.media_path, args.subtree):
+        parser.error(f"{args.subtree} is outside MEDIA_PATH")
+    # Keep paths spelled the way the server builds them so cache keys match
+    root = settings.media_path / args.subtree if args.subtree else settings.media_path
+    if not root.is_dir():
+        parser.error(f"{root} is not a directory")
+
+    counts = warm_cache(root, settings, jobs=max(1, args.jobs), restart=args.restart)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""Tests for cache index service."""
+
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from small_media.services.cache import CacheIndex
+
+
+@pytest.fixture
+def temp_dirs():
+    """Create temporary media and cache directories."""
+    with tempfile.TemporaryDirectory() as media_dir:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            yield Path(media_dir), Path(cache_dir)
+
+
+@pytest.fixture
+def index(temp_dirs):
+    """Create a cache index in the temporary cache directory."""
+    _, cache_dir = temp_dirs
+    index = CacheIndex(cache_dir, max_size=0, ttl=60)
+    yield index
+    index.close()
+
+
+def add_entry(index: CacheIndex, temp_dirs, name: str, size: int):
+    """Write a source and cache file and record the entry."""
+    media_dir, cache_dir = temp_dirs
+    source = media_dir / f"{name}.flac"
+    source.write_bytes(b"source " + name.encode())
+    cached = cache_dir / f"{name}.mp3"
+    cached.write_bytes(b"x" * size)
+    return index.record(source, "standard", cached)
+
+
+class TestRecord:
+    """Tests for the integrity checks on new entries."""
+
+    def test_failed_exit_rejected(self, index, temp_dirs):
+        """Output of an encoder that exited with an error is deleted."""
+        media_dir, cache_dir = temp_dirs
+        source = media_dir / "a.flac"
+        source.write_bytes(b"audio")
+        cached = cache_dir / "a.mp3"
+        cached.write_bytes(b"x" * 10)
+
+        assert index.record(source, "standard", cached, exit_status=1) is None
+        assert not cached.exists()
+        assert len(index) == 0
+
+    def test_size_mismatch_rejected(self, index, temp_dirs):
+        """A file shorter than what the encoder produced is deleted."""
+        media_dir, cache_dir = temp_dirs
+        source = media_dir / "a.flac"
+        source.write_bytes(b"audio")
+        cached = cache_dir / "a.mp3"
+        cached.write_bytes(b"x" * 10)
+
+        assert index.record(source, "standard", cached, expected_size=20) is None
+        assert not cached.exists()
+        assert index.record(source, "standard", cached.with_name("b.mp3")) is None
+
+    def test_has_file(self, index, temp_dirs):
+        """Indexed cache files are recognised by name."""
+        entry = add_entry(index, temp_dirs, "a", 10)
+        assert index.has_file(index.path_of(entry))
+        assert not index.has_file(index.path_of(entry).with_name("b.mp3"))
+
+
+class TestLookup:
+    """Tests for cache index lookups."""
+
+    def test_miss(self, index, temp_dirs):
+        """Unknown sources are a miss."""
+        media_dir, _ = temp_dirs
+        source = media_dir / "a.flac"
+        source.write_bytes(b"audio")
+        assert index.lookup(source, "standard") is None
+
+    def test_hit(self, index, temp_dirs):
+        """Recorded entries are found again."""
+        entry = add_entry(index, temp_dirs, "a", 100)
+        found = index.lookup(Path(entry.source), "standard")
+        assert found is not None
+        assert found.size == 100
+        assert index.lookup(Path(entry.source), "low") is None
+
+    def test_hot_hit_skips_source_stat(self, index, temp_dirs):
+        """Entries verified within the TTL are answered from memory."""
+        entry = add_entry(index, temp_dirs, "a", 100)
+        Path(entry.source).unlink()
+
+        assert index.lookup(Path(entry.source), "standard") is entry
+
+    def test_changed_source_is_stale(self, index, temp_dirs):
+        """A source modified after transcoding invalidates its entry."""
+        entry = add_entry(index, temp_dirs, "a", 100)
+        index.ttl = 0
+        source = Path(entry.source)
+        os.utime(source, (1000, 1000))
+
+        assert index.lookup(source, "standard") is None
+        assert not index.path_of(entry).exists()
+        assert index.total_size == 0
+
+    def test_persists_across_instances(self, index, temp_dirs):
+        """Entries survive a restart and are shared between processes."""
+        _, cache_dir = temp_dirs
+        entry = add_entry(index, temp_dirs, "a", 100)
+
+        reopened = CacheIndex(cache_dir)
+        reopened.load()
+        try:
+            assert reopened.total_size == 100
+            assert reopened.lookup(Path(entry.source), "standard") is not None
+        finally:
+            reopened.close()
+
+    def test_load_drops_missing_files(self, index, temp_dirs):
+        """Rows whose cache file has disappeared are removed on load."""
+        entry = add_entry(index, temp_dirs, "a", 100)
+        index.path_of(entry).unlink()
+
+        index.load()
+        assert len(index) == 0
+        assert index.total_size == 0
+
+
+class TestEviction:
+    """Tests for size accounting and eviction."""
+
+    def test_running_total(self, index, temp_dirs):
+        """Total size is kept up to date as entries come and go."""
+        a = add_entry(index, temp_dirs, "a", 100)
+        add_entry(index, temp_dirs, "b", 50)
+        assert index.total_size == 150
+
+        index.discard(a)
+        assert index.total_size == 50
+        assert len(index) == 1
+
+    def test_no_limit(self, index, temp_dirs):
+        """A zero limit never evicts."""
+        add_entry(index, temp_dirs, "a", 1000)
+        assert not index.over_limit()
+        assert index.evict() == []
+
+    def test_evicts_least_recently_used(self, index, temp_dirs):
+        """Eviction removes the oldest entries first."""
+        index.max_size = 250
+        a = add_entry(index, temp_dirs, "a", 100)
+        b = add_entry(index, temp_dirs, "b", 100)
+        c = add_entry(index, temp_dirs, "c", 100)
+        index.touch(a)
+
+        assert index.evict() == [index.path_of(b)]
+        assert not index.path_of(b).exists()
+        assert index.path_of(a).exists() and index.path_of(c).exists()
+        assert index.total_size == 200
+
+    def test_pinned_not_evicted(self, index, temp_dirs):
+        """Entries being served are skipped by eviction."""
+        index.max_size = 150
+        a = add_entry(index, temp_dirs, "a", 100)
+        b = add_entry(index, temp_dirs, "b", 100)
+        index.pin(index.path_of(a))
+
+        assert index.evict() == [index.path_of(b)]
+        assert index.path_of(a).exists()
+
+        index.unpin(index.path_of(a))
+        assert index.stats()["pinned"] == 0
+
+    def test_pinned_in_other_process(self, index, temp_dirs):
+        """A file pinned by another worker's index is not evicted."""
+        _, cache_dir = temp_dirs
+        index.max_size = 150
+        a = add_entry(index, temp_dirs, "a", 100)
+        b = add_entry(index, temp_dirs, "b", 100)
+        other = CacheIndex(cache_dir, max_size=150, ttl=60)
+        try:
+            assert other.pin(index.path_of(a)) is not None
+
+            assert index.evict() == [index.path_of(b)]
+            assert index.path_of(a).exists()
+        finally:
+            other.close()
+
+    def test_removed_while_pinned(self, index, temp_dirs):
+        """A pinned file outlives its entry until the last pin is released."""
+        a = add_entry(index, temp_dirs, "a", 100)
+        index.pin(index.path_of(a))
+        index.pin(index.path_of(a))
+
+        index.discard(a)
+        assert index.path_of(a).exists()
+        index.unpin(index.path_of(a))
+        assert index.path_of(a).exists()
+        index.unpin(index.path_of(a))
+        assert not index.path_of(a).exists()
+
+    def test_pin_missing_file(self, index, temp_dirs):
+        """A file that's gone can't be pinned."""
+        a = add_entry(index, temp_dirs, "a", 100)
+        index.path_of(a).unlink()
+
+        assert index.pin(index.path_of(a)) is None
+        assert index.stats()["pinned"] == 0
+
+    def test_stats(self, index, temp_dirs):
+        """Stats report entries, size and hits."""
+        a = add_entry(index, temp_dirs, "a", 100)
+        index.touch(a)
+        index.touch(a)
+
+        stats = index.stats()
+        assert stats["entries"] == 1
+        assert stats["total_size"] == 100
+        assert stats["hits"] == 2
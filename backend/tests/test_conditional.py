@@ -0,0 +1,90 @@
+"""Tests for conditional GET validators."""
+
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from small_media.services.conditional import etag_matches, get_folder_signature, make_etag
+
+
+@pytest.fixture
+def temp_media_dir():
+    """Create a temporary media directory with an album."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+
+        album = base / "Album1"
+        album.mkdir()
+        (album / "track01.flac").write_bytes(b"fake flac")
+        (album / "Disc2").mkdir()
+
+        yield base
+
+
+def bump_mtime(path: Path) -> None:
+    """Move a file's mtime forward so the change is visible at any resolution."""
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class TestMakeEtag:
+    """Tests for make_etag function."""
+
+    def test_strong_and_stable(self):
+        """ETags are quoted, strong and depend only on their parts."""
+        etag = make_etag("folder", "Album1", 123)
+        assert etag.startswith('"') and etag.endswith('"')
+        assert etag == make_etag("folder", "Album1", 123)
+        assert etag != make_etag("folder", "Album1", 124)
+
+
+class TestEtagMatches:
+    """Tests for etag_matches function."""
+
+    def test_match(self):
+        """Any tag in the list matches, weak or not."""
+        etag = make_etag("a")
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", W/{etag}', etag)
+        assert etag_matches("*", etag)
+
+    def test_no_match(self):
+        """Missing or different tags don't match."""
+        etag = make_etag("a")
+        assert not etag_matches(None, etag)
+        assert not etag_matches(make_etag("b"), etag)
+
+
+class TestGetFolderSignature:
+    """Tests for get_folder_signature function."""
+
+    def test_unchanged(self, temp_media_dir):
+        """An untouched folder keeps its signature."""
+        album = temp_media_dir / "Album1"
+        assert get_folder_signature(album) == get_folder_signature(album)
+
+    def test_file_rewritten(self, temp_media_dir):
+        """Rewriting a file in place changes the signature."""
+        album = temp_media_dir / "Album1"
+        before = get_folder_signature(album)
+
+        (album / "track01.flac").write_bytes(b"a longer fake flac")
+
+        assert get_folder_signature(album) != before
+
+    def test_subfolder_changed(self, temp_media_dir):
+        """Adding to a subfolder changes the parent's signature."""
+        album = temp_media_dir / "Album1"
+        before = get_folder_signature(album)
+
+        (album / "Disc2" / "track01.flac").write_bytes(b"fake flac")
+        bump_mtime(album / "Disc2")
+
+        assert get_folder_signature(album) != before
+
+    def test_missing_folder(self, temp_media_dir):
+        """A folder that doesn't exist raises OSError."""
+        with pytest.raises(OSError):
+            get_folder_signature(temp_media_dir / "Missing")
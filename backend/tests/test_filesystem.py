@@ -1,14 +1,20 @@
 """Tests for filesystem service."""
 
+import os
 import tempfile
 from pathlib import Path
 
 import pytest
 
 from small_media.config import Settings
+from small_media.services import filesystem
 from small_media.services.filesystem import (
+    encode_path,
+    get_file_extension,
     get_folder_contents,
+    get_path_prefix,
     is_safe_path,
+    iter_folder_contents,
     list_audio_files,
     list_folders,
 )
@@ -60,6 +66,22 @@ class TestIsSafePath:
         assert not is_safe_path(temp_media_dir, "Album1/../../etc")
 
 
+class TestEncoding:
+    """Tests for get_file_extension and get_path_prefix functions."""
+
+    @pytest.mark.parametrize("filename", ["Song.MP3", "a.b.flac", ".mp3", "noext", "trailing."])
+    def test_file_extension(self, filename):
+        """Extensions follow the same rules as Path.suffix."""
+        assert get_file_extension(filename) == Path(filename).suffix.lower().lstrip(".")
+
+    def test_path_prefix(self):
+        """A prefix and an encoded name make the encoded joined path."""
+        assert get_path_prefix(Path("A b/Cé")) + encode_path("x?y.mp3") == encode_path(
+            "A b/Cé/x?y.mp3"
+        )
+        assert get_path_prefix(Path(".")) == ""
+
+
 class TestListFolders:
     """Tests for list_folders function."""
 
@@ -82,6 +104,33 @@ class TestListFolders:
         assert folder_map["Album2"].has_audio is True
         assert folder_map["EmptyFolder"].has_audio is False
 
+    def test_subfolder_count(self, temp_media_dir, settings):
+        """Subfolders are counted, hidden ones included."""
+        (temp_media_dir / "Album1" / "Disc1").mkdir()
+        (temp_media_dir / "Album1" / ".covers").mkdir()
+        folder_map = {f.name: f for f in list_folders(temp_media_dir, "", settings)}
+
+        assert folder_map["Album1"].subfolder_count == 2
+        assert folder_map["Album2"].subfolder_count == 0
+
+    def test_one_pass_per_subfolder(self, temp_media_dir, settings, monkeypatch):
+        """Each subfolder is read once and nothing is stat'ed."""
+        reads: list[str] = []
+        scandir = os.scandir
+
+        def counting_scandir(path):
+            reads.append(os.fspath(path))
+            return scandir(path)
+
+        monkeypatch.setattr(filesystem.os, "scandir", counting_scandir)
+        monkeypatch.setattr(filesystem.os, "stat", pytest.fail)
+
+        list_folders(temp_media_dir, "", settings)
+
+        assert sorted(reads) == sorted(
+            str(temp_media_dir / name) for name in ["", "Album1", "Album2", "EmptyFolder"]
+        )
+
 
 class TestListAudioFiles:
     """Tests for list_audio_files function."""
@@ -103,6 +152,36 @@ class TestListAudioFiles:
         assert file_map["track02.wav"].format == "wav"
 
 
+class TestIterFolderContents:
+    """Tests for iter_folder_contents function."""
+
+    def test_folders_then_files(self, temp_media_dir, settings):
+        """Subfolders come before audio files, each sorted by name."""
+        (temp_media_dir / "intro.mp3").write_bytes(b"fake mp3")
+
+        items = list(iter_folder_contents(temp_media_dir, "", settings))
+
+        names = [data["name"] if kind == "folder" else data["filename"] for kind, data in items]
+        assert names == ["Album1", "Album2", "EmptyFolder", "intro.mp3"]
+
+    def test_start(self, temp_media_dir, settings):
+        """Iteration can start part way through, in folders or files."""
+        (temp_media_dir / "intro.mp3").write_bytes(b"fake mp3")
+
+        from_folders = list(iter_folder_contents(temp_media_dir, "", settings, start=2))
+        from_files = list(iter_folder_contents(temp_media_dir, "Album1", settings, start=1))
+
+        assert from_folders[0] == (
+            "folder",
+            {"name": "EmptyFolder", "path": "EmptyFolder", "has_audio": False, "subfolder_count": 0},
+        )
+        assert from_folders[1] == (
+            "file",
+            {"filename": "intro.mp3", "path": "intro.mp3", "format": "mp3", "size": 8},
+        )
+        assert [data["filename"] for _, data in from_files] == ["track02.wav"]
+
+
 class TestGetFolderContents:
     """Tests for get_folder_contents function."""
 
@@ -0,0 +1,70 @@
+"""Tests for the folder routes."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from small_media.config import get_settings
+from small_media.main import app
+
+
+@pytest.fixture
+def media_dir(tmp_path, monkeypatch):
+    """Point the app at a media root with three album folders."""
+    media_dir = tmp_path / "media"
+    for name in ["Alpha", "Beta", "Gamma"]:
+        (media_dir / name).mkdir(parents=True)
+        (media_dir / name / "01.mp3").write_bytes(b"ID3")
+    (media_dir / "loose.mp3").write_bytes(b"ID3")
+    monkeypatch.setenv("MEDIA_PATH", str(media_dir))
+    monkeypatch.setenv("CACHE_PATH", str(tmp_path / "cache"))
+    monkeypatch.setenv("LIBRARY_INDEX", "false")
+    get_settings.cache_clear()
+    yield media_dir
+    get_settings.cache_clear()
+
+
+@pytest.fixture
+def client(media_dir):
+    """Create a client for the app, running its startup and shutdown."""
+    with TestClient(app) as client:
+        yield client
+
+
+class TestListRootFolders:
+    """Tests for the root folder listing."""
+
+    def test_all_folders(self, client):
+        """Without a limit every folder is listed and there is no cursor."""
+        response = client.get("/api/folders")
+
+        assert response.status_code == 200
+        assert [folder["name"] for folder in response.json()["folders"]] == [
+            "Alpha",
+            "Beta",
+            "Gamma",
+        ]
+        assert response.json()["next_cursor"] is None
+
+    def test_pages(self, client):
+        """A limit cuts the list short and the cursor continues it, without files."""
+        first = client.get("/api/folders", params={"limit": 2}).json()
+        rest = client.get(
+            "/api/folders", params={"limit": 2, "cursor": first["next_cursor"]}
+        ).json()
+
+        assert [folder["name"] for folder in first["folders"]] == ["Alpha", "Beta"]
+        assert [folder["name"] for folder in rest["folders"]] == ["Gamma"]
+        assert rest["next_cursor"] is None
+
+    def test_pages_have_own_etags(self, client):
+        """Each page is revalidated on its own."""
+        first = client.get("/api/folders", params={"limit": 1})
+        second = client.get("/api/folders", params={"limit": 1, "cursor": "1"})
+
+        assert first.headers["etag"] != second.headers["etag"]
+
+    def test_invalid_cursor(self, client):
+        """A malformed cursor is rejected."""
+        response = client.get("/api/folders", params={"cursor": "abc"})
+
+        assert response.status_code == 400
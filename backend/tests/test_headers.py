@@ -0,0 +1,184 @@
+"""Tests for the native audio header readers."""
+
+import struct
+import tempfile
+import wave
+from pathlib import Path
+
+import pytest
+
+from small_media.services.headers import read_audio_info
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, joint stereo: 417 byte frames
+MP3_HEADER = bytes.fromhex("fffb9064")
+MP3_FRAME_LENGTH = 417
+
+
+@pytest.fixture
+def media_dir():
+    """Create a temporary media directory."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield Path(tmpdir)
+
+
+def mp3_frames(count: int, xing_frames: int | None = None) -> bytes:
+    """Build silent MP3 frames, optionally starting with a Xing header frame."""
+    frames = [MP3_HEADER + bytes(MP3_FRAME_LENGTH - 4) for _ in range(count)]
+    if xing_frames is not None:
+        # Side info for MPEG-1 stereo is 32 bytes
+        xing = b"Xing" + struct.pack(">II", 0x1, xing_frames)
+        first = MP3_HEADER + bytes(32) + xing
+        frames.insert(0, first + bytes(MP3_FRAME_LENGTH - len(first)))
+    return b"".join(frames)
+
+
+def ogg_page(granule: int, serial: int, packet: bytes, bos: bool = False) -> bytes:
+    """Build a single-segment Ogg page (CRC left zero)."""
+    header = b"OggS" + struct.pack(
+        "<BBqIIIB", 0, 0x02 if bos else 0, granule, serial, 0, 0, 1
+    )
+    return header + bytes([len(packet)]) + packet
+
+
+class TestWav:
+    """Tests for WAV headers."""
+
+    def test_reads_fmt_and_data(self, media_dir):
+        """Duration comes from the data size and byte rate."""
+        path = media_dir / "a.wav"
+        with wave.open(str(path), "wb") as w:
+            w.setnchannels(2)
+            w.setsampwidth(2)
+            w.setframerate(8000)
+            w.writeframes(bytes(8000 * 4 * 3))
+
+        info = read_audio_info(path)
+
+        assert info is not None
+        assert info["duration"] == pytest.approx(3.0)
+        assert info["sample_rate"] == 8000
+        assert info["channels"] == 2
+        assert info["bitrate"] == 256
+
+    def test_not_riff(self, media_dir):
+        """Files without a RIFF header are left to ffprobe."""
+        path = media_dir / "a.wav"
+        path.write_bytes(b"not a wav file at all")
+        assert read_audio_info(path) is None
+
+
+class TestFlac:
+    """Tests for FLAC STREAMINFO."""
+
+    def test_reads_streaminfo(self, media_dir):
+        """Sample rate, channels and total samples are unpacked."""
+        packed = (44100 << 44) | ((2 - 1) << 41) | ((16 - 1) << 36) | (44100 * 10)
+        streaminfo = struct.pack(">HH3s3sQ16s", 4096, 4096, b"\0\0\0", b"\0\0\0", packed, b"")
+        path = media_dir / "a.flac"
+        path.write_bytes(b"fLaC" + bytes([0x80, 0, 0, 34]) + streaminfo + bytes(1000))
+
+        info = read_audio_info(path)
+
+        assert info is not None
+        assert info["duration"] == pytest.approx(10.0)
+        assert info["sample_rate"] == 44100
+        assert info["channels"] == 2
+
+    def test_unknown_length(self, media_dir):
+        """A zero sample count falls back to ffprobe."""
+        packed = (44100 << 44) | ((2 - 1) << 41) | ((16 - 1) << 36)
+        streaminfo = struct.pack(">HH3s3sQ16s", 4096, 4096, b"\0\0\0", b"\0\0\0", packed, b"")
+        path = media_dir / "a.flac"
+        path.write_bytes(b"fLaC" + bytes([0x80, 0, 0, 34]) + streaminfo)
+        assert read_audio_info(path) is None
+
+
+class TestMp3:
+    """Tests for MP3 frame and Xing headers."""
+
+    def test_xing_frame_count(self, media_dir):
+        """VBR files use the frame count from the Xing header."""
+        path = media_dir / "a.mp3"
+        path.write_bytes(mp3_frames(10, xing_frames=1000))
+
+        info = read_audio_info(path)
+
+        assert info is not None
+        assert info["duration"] == pytest.approx(1000 * 1152 / 44100)
+        assert info["sample_rate"] == 44100
+        assert info["channels"] == 2
+
+    def test_cbr_estimate(self, media_dir):
+        """Without a Xing header the duration comes from the bitrate."""
+        path = media_dir / "a.mp3"
+        tag = b"ID3\x03\x00\x00" + bytes([0, 0, 0, 20]) + bytes(20)
+        path.write_bytes(tag + mp3_frames(100) + b"TAG" + bytes(125))
+
+        info = read_audio_info(path)
+
+        assert info is not None
+        assert info["duration"] == pytest.approx(100 * MP3_FRAME_LENGTH * 8 / 128000)
+
+    def test_false_sync_skipped(self, media_dir):
+        """Sync-like bytes not followed by another frame are ignored."""
+        path = media_dir / "a.mp3"
+        path.write_bytes(b"\xff\xfb\x90\x64junk" + mp3_frames(5, xing_frames=50))
+
+        info = read_audio_info(path)
+
+        assert info is not None
+        assert info["duration"] == pytest.approx(50 * 1152 / 44100)
+
+    def test_no_frames(self, media_dir):
+        """Files without MPEG frames are left to ffprobe."""
+        path = media_dir / "a.mp3"
+        path.write_bytes(bytes(5000))
+        assert read_audio_info(path) is None
+
+
+class TestOgg:
+    """Tests for Ogg granule positions."""
+
+    def test_vorbis(self, media_dir):
+        """Vorbis durations come from the last granule position."""
+        ident = b"\x01vorbis" + struct.pack("<IBI", 0, 2, 48000) + bytes(15)
+        path = media_dir / "a.ogg"
+        path.write_bytes(
+            ogg_page(0, 7, ident, bos=True)
+            + ogg_page(96000, 7, bytes(100))
+            + ogg_page(48000 * 5, 7, bytes(100))
+            + ogg_page(999999999, 8, bytes(10))  # Another stream's page
+        )
+
+        info = read_audio_info(path)
+
+        assert info is not None
+        assert info["duration"] == pytest.approx(5.0)
+        assert info["sample_rate"] == 48000
+        assert info["channels"] == 2
+
+    def test_opus_pre_skip(self, media_dir):
+        """Opus granules are 48 kHz samples minus the pre-skip."""
+        head = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, 312, 44100, 0, 0)
+        path = media_dir / "a.ogg"
+        path.write_bytes(ogg_page(0, 3, head, bos=True) + ogg_page(48000 * 2 + 312, 3, bytes(50)))
+
+        info = read_audio_info(path)
+
+        assert info is not None
+        assert info["duration"] == pytest.approx(2.0)
+        assert info["channels"] == 1
+
+
+class TestReadAudioInfo:
+    """Tests for format dispatch."""
+
+    def test_m4a_not_handled(self, media_dir):
+        """Formats without a reader go to ffprobe."""
+        path = media_dir / "a.m4a"
+        path.write_bytes(bytes(100))
+        assert read_audio_info(path) is None
+
+    def test_missing_file(self, media_dir):
+        """Unreadable files return None."""
+        assert read_audio_info(media_dir / "missing.flac") is None
@@ -0,0 +1,299 @@
+"""Tests for segmented (HLS) output."""
+
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from small_media.config import Settings
+from small_media.services import hls, transcoder
+from small_media.services.cache import get_cache_index
+from small_media.services.hls import (
+    build_playlist,
+    build_segment_command,
+    get_hls_dir,
+    get_hls_encode,
+    get_segment_count,
+    get_segment_profile,
+    parse_segment_name,
+    segment_name,
+    sweep_hls,
+)
+from small_media.services.transcoder import TranscodePriority, TranscodeScheduler, clear_cache
+
+
+@pytest.fixture
+def temp_dirs():
+    """Create temporary directories for testing."""
+    with tempfile.TemporaryDirectory() as media_dir:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            yield Path(media_dir), Path(cache_dir)
+
+
+@pytest.fixture
+def settings(temp_dirs):
+    """Create settings for testing."""
+    media_dir, cache_dir = temp_dirs
+    return Settings(media_path=media_dir, cache_path=cache_dir, hls_segment_duration=10)
+
+
+@pytest.fixture
+def source(temp_dirs):
+    """Create a source file to segment."""
+    media_dir, _ = temp_dirs
+    file_path = media_dir / "a.wav"
+    file_path.write_bytes(b"RIFF")
+    return file_path
+
+
+@pytest.fixture
+def fake_segmenter(monkeypatch):
+    """Replace FFmpeg with a fake segmenter; returns the (first, count) of each run."""
+    runs: list[tuple[int, int]] = []
+    options = {"exit_code": 0, "delay": 0.0}
+
+    async def start(file_path, out_dir, settings, first, count):
+        runs.append((first, count))
+        # Write each segment in turn, like the segment muxer does; a failing
+        # run writes nothing
+        written = range(first, first + count) if options["exit_code"] == 0 else range(0)
+        script = (
+            "import sys, time, pathlib; "
+            f"d = pathlib.Path({str(out_dir / hls.PARTIAL_DIRNAME)!r}); "
+            f"[(d.joinpath(f'seg{{i:05d}}.ts').write_bytes(b'ts'), time.sleep({options['delay']})) "
+            f"for i in {list(written)}]; "
+            f"sys.exit({options['exit_code']})"
+        )
+        return await asyncio.create_subprocess_exec(sys.executable, "-c", script)
+
+    monkeypatch.setattr(hls, "start_segment_process", start)
+    monkeypatch.setattr(transcoder, "_scheduler", TranscodeScheduler(concurrency=2))
+    return runs, options
+
+
+class TestPlaylist:
+    """Tests for playlist and segment naming."""
+
+    def test_segment_count(self):
+        """A partial last segment still counts."""
+        assert get_segment_count(30.0, 10) == 3
+        assert get_segment_count(30.5, 10) == 4
+        assert get_segment_count(0.0, 10) == 1
+
+    def test_lists_every_segment(self):
+        """The playlist is complete up front, with a short last segment."""
+        playlist = build_playlist(25.0, 10)
+
+        assert playlist.startswith("#EXTM3U\n")
+        assert "#EXT-X-TARGETDURATION:10" in playlist
+        assert "#EXT-X-PLAYLIST-TYPE:VOD" in playlist
+        assert playlist.count("#EXTINF:") == 3
+        assert "#EXTINF:5.000,\nseg00002.ts" in playlist
+        assert playlist.rstrip().endswith("#EXT-X-ENDLIST")
+
+    def test_segment_query(self):
+        """Segment URIs carry the playlist's query."""
+        playlist = build_playlist(25.0, 10, "?profile=low")
+        assert "\nseg00000.ts?profile=low\n" in playlist
+
+    def test_segment_names(self):
+        """Names round-trip and anything else is rejected."""
+        assert parse_segment_name(segment_name(42)) == 42
+        assert parse_segment_name("seg1.ts") is None
+        assert parse_segment_name("../seg00001.ts") is None
+        assert parse_segment_name("seg00001.ts.part") is None
+
+
+class TestSegmentCommand:
+    """Tests for the segmenting FFmpeg command."""
+
+    def test_seeks_to_first_segment(self, source, settings):
+        """Encoding starts at the first segment's offset with continuous timestamps."""
+        out_dir = get_hls_dir(source, settings)
+        cmd = build_segment_command(source, out_dir, settings, 3, 2)
+
+        assert cmd[cmd.index("-ss") + 1] == "30"
+        assert cmd.index("-ss") < cmd.index("-i")
+        assert cmd[cmd.index("-t") + 1] == "20"
+        assert cmd[cmd.index("-segment_start_number") + 1] == "3"
+        assert cmd[-1] == str(out_dir / "partial" / "seg%05d.ts")
+
+    def test_cuts_at_segment_boundaries(self, source, settings):
+        """Cuts fall a segment apart from the start of the run, before timestamps move on.
+
+        ``-output_ts_offset`` would shift timestamps before the muxer decides
+        where to cut, so a run from segment 3 would be cut at 10, 20, 30 and
+        40 seconds from the start of the track: a tiny segment, then three
+        misplaced ones.
+        """
+        cmd = build_segment_command(source, get_hls_dir(source, settings), settings, 3, 4)
+
+        assert "-output_ts_offset" not in cmd
+        assert "-segment_time" not in cmd
+        assert cmd[cmd.index("-segment_times") + 1] == "10,20,30"
+        assert cmd[cmd.index("-initial_offset") + 1] == "30"
+        assert cmd.index("-f") < cmd.index("-initial_offset")
+
+    def test_single_segment_length(self, source, settings):
+        """A run of one segment is cut at the segment length, not the muxer's default."""
+        cmd = build_segment_command(source, get_hls_dir(source, settings), settings, 5, 1)
+
+        assert "-segment_times" not in cmd
+        assert cmd[cmd.index("-segment_time") + 1] == "10"
+        assert cmd[cmd.index("-t") + 1] == "10"
+
+    def test_from_start(self, temp_dirs, settings):
+        """The first segment needs no seek."""
+        media_dir, _ = temp_dirs
+        cmd = build_segment_command(media_dir / "a.wav", media_dir, settings, 0, 2)
+        assert "-ss" not in cmd
+        assert cmd[cmd.index("-t") + 1] == "20"
+
+    def test_mp3_profile(self, source, settings):
+        """MP3 profiles keep their codec."""
+        cmd = build_segment_command(source, get_hls_dir(source, settings), settings, 0, 2)
+
+        assert cmd[cmd.index("-codec:a") + 1] == "libmp3lame"
+
+    def test_opus_profile_uses_aac(self, source, settings):
+        """Opus profiles are segmented as AAC at their bitrate, which HLS players play."""
+        opus = settings.model_copy(update={"audio_codec": "opus", "audio_bitrate": 64})
+        cmd = build_segment_command(source, get_hls_dir(source, opus), opus, 0, 2)
+
+        assert cmd[cmd.index("-codec:a") + 1] == "aac"
+        assert cmd[cmd.index("-b:a") + 1] == "64k"
+        assert "libopus" not in cmd
+        assert get_hls_dir(source, opus) != get_hls_dir(source, settings)
+        assert get_segment_profile(opus, 1) == "aac-64k/hls/00001"
+
+
+class TestHlsEncode:
+    """Tests for on-demand segment encoding."""
+
+    async def test_encodes_batch_ahead(self, source, settings, fake_segmenter):
+        """Asking for a segment encodes it and the few after it, and indexes them."""
+        encode = get_hls_encode(source, 100.0, settings)
+
+        path = await encode.segment(0)
+        assert path == encode.out_dir / "seg00000.ts"
+        await encode._task
+
+        runs, _ = fake_segmenter
+        assert runs == [(0, 4)]
+        assert [encode.segment_path(i).exists() for i in range(5)] == [True] * 4 + [False]
+        assert not list(encode.partial_dir.iterdir())
+
+        index = get_cache_index(settings)
+        assert len(index) == 4
+        assert index.lookup(source, get_segment_profile(settings, 3)) is not None
+        assert index.total_size == 4 * len(b"ts")
+
+    async def test_keeps_ahead_of_player(self, source, settings, fake_segmenter):
+        """Later requests encode the next batch, ahead of the player and preemptible."""
+        runs, _ = fake_segmenter
+        priorities = []
+        scheduler = transcoder._scheduler
+        slot = scheduler.slot
+
+        def record_slot(priority, key=None):
+            priorities.append(priority)
+            return slot(priority, key)
+
+        scheduler.slot = record_slot
+        encode = get_hls_encode(source, 100.0, settings)
+
+        await encode.segment(0)
+        await encode._task
+        assert await encode.segment(2) is not None
+        await encode._task
+
+        assert runs == [(0, 4), (4, 4)]
+        assert priorities == [TranscodePriority.INTERACTIVE, TranscodePriority.PREFETCH]
+
+    async def test_seek_starts_at_requested_segment(self, source, settings, fake_segmenter):
+        """A request far into the track starts there, not at the beginning."""
+        encode = get_hls_encode(source, 60.0, settings)
+
+        assert await encode.segment(4) is not None
+        await encode._task
+
+        runs, _ = fake_segmenter
+        assert runs == [(4, 2)]
+
+    async def test_restarts_for_distant_segment(self, source, settings, fake_segmenter):
+        """Seeking outside the current batch stops it and starts again from there."""
+        runs, options = fake_segmenter
+        options["delay"] = 0.3
+        encode = get_hls_encode(source, 200.0, settings)
+
+        await encode.segment(0)
+        assert await encode.segment(12) is not None
+
+        assert runs[1] == (12, 4)
+        encode._task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await encode._task
+
+    async def test_stops_without_listeners(self, source, settings, fake_segmenter, monkeypatch):
+        """An encode nobody is asking segments of stops and frees its slot."""
+        runs, options = fake_segmenter
+        options["delay"] = 0.3
+        monkeypatch.setattr(hls, "LISTENER_TIMEOUT_SEGMENTS", 0)
+        encode = get_hls_encode(source, 100.0, settings)
+
+        await encode.segment(0)
+        await encode._task
+
+        assert runs == [(0, 4)]
+        assert not encode.segment_path(3).exists()
+        assert not list(encode.partial_dir.iterdir())
+        assert transcoder._scheduler.active == 0
+        assert encode.out_dir not in hls._encodes
+
+    async def test_failure(self, source, settings, fake_segmenter):
+        """A failed encode answers None and leaves no partial segments."""
+        _, options = fake_segmenter
+        options["exit_code"] = 1
+        encode = get_hls_encode(source, 30.0, settings)
+
+        assert await encode.segment(1) is None
+        assert encode.failed
+        assert not list(encode.out_dir.glob("*.ts"))
+        assert not list(encode.partial_dir.iterdir())
+
+
+class TestCleanup:
+    """Tests for removing segments from the cache."""
+
+    async def test_sweep(self, source, settings, fake_segmenter):
+        """Partial and unindexed segments go; indexed ones stay."""
+        encode = get_hls_encode(source, 30.0, settings)
+        await encode.segment(0)
+        await encode._task
+        (encode.partial_dir / segment_name(5)).write_bytes(b"ts")
+        (encode.out_dir / segment_name(6)).write_bytes(b"ts")
+
+        assert sweep_hls(settings) == 2
+        assert sorted(p.name for p in encode.out_dir.glob("*.ts")) == [
+            segment_name(i) for i in range(3)
+        ]
+
+    def test_sweep_removes_empty_dirs(self, source, settings):
+        """Directories of segments that are all gone are removed."""
+        out_dir = get_hls_dir(source, settings)
+        (out_dir / hls.PARTIAL_DIRNAME).mkdir(parents=True)
+
+        assert sweep_hls(settings) == 0
+        assert not out_dir.exists()
+
+    async def test_clear_cache(self, source, settings, fake_segmenter):
+        """Clearing the cache removes segments too."""
+        encode = get_hls_encode(source, 30.0, settings)
+        await encode.segment(0)
+        await encode._task
+
+        assert clear_cache(settings) == 3
+        assert not encode.out_dir.exists()
+        assert len(get_cache_index(settings)) == 0
@@ -0,0 +1,322 @@
+"""Tests for the library index."""
+
+import asyncio
+import contextlib
+import errno
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from small_media.config import Settings
+from small_media.services import filesystem, library
+from small_media.services.library import LibraryIndex, LibraryWatcher
+
+
+@pytest.fixture
+def temp_media_dir():
+    """Create a temporary media directory structure."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+
+        (base / "Album1").mkdir()
+        (base / "Album1" / "track01.mp3").write_bytes(b"fake mp3")
+        (base / "Album1" / "Track02.wav").write_bytes(b"fake wav!")
+        (base / "Album1" / "cover.jpg").write_bytes(b"jpeg")
+        (base / "Album1" / "Disc2").mkdir()
+
+        (base / "Album2").mkdir()
+        (base / "Album2" / "song.flac").write_bytes(b"fake flac")
+
+        (base / "EmptyFolder").mkdir()
+
+        (base / ".hidden").mkdir()
+        (base / ".hidden" / "secret.mp3").write_bytes(b"hidden")
+
+        yield base
+
+
+@pytest.fixture
+def settings(temp_media_dir):
+    """Create settings for testing."""
+    return Settings(
+        media_path=temp_media_dir,
+        cache_path=temp_media_dir / "cache",
+        allowed_extensions="mp3,wav,flac",
+    )
+
+
+@pytest.fixture
+def index(temp_media_dir, settings):
+    """A scanned index of the media directory."""
+    index = LibraryIndex(temp_media_dir, settings.allowed_extensions_set)
+    index.scan()
+    return index
+
+
+def bump_mtime(path: Path) -> None:
+    """Move an mtime forward so the change is visible at any resolution."""
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class TestLibraryIndex:
+    """Tests for LibraryIndex."""
+
+    def test_matches_disk_listing(self, temp_media_dir, settings, index):
+        """Listings from the index are the same as reading the disk."""
+        for relative in ["", "Album1", "Album2", "EmptyFolder"]:
+            folder = temp_media_dir / relative if relative else temp_media_dir
+            assert index.list_folders(folder) == filesystem.list_folders(
+                temp_media_dir, relative, settings
+            )
+            assert index.list_audio_files(folder) == filesystem.list_audio_files(
+                temp_media_dir, relative, settings
+            )
+
+    def test_audio_filenames(self, temp_media_dir, index):
+        """Audio filenames are sorted case-insensitively."""
+        assert index.audio_filenames(temp_media_dir / "Album1") == ["track01.mp3", "Track02.wav"]
+
+    def test_not_indexed(self, temp_media_dir, settings, index):
+        """Hidden, missing and unscanned folders aren't answered from the index."""
+        assert index.lookup(temp_media_dir / ".hidden") is None
+        assert index.lookup(temp_media_dir / "Missing") is None
+        assert LibraryIndex(temp_media_dir, settings.allowed_extensions_set).lookup(
+            temp_media_dir
+        ) is None
+
+    def test_symlink_loop(self, temp_media_dir, settings):
+        """A symlink back up the tree doesn't recurse forever."""
+        (temp_media_dir / "Album1" / "Disc2" / "loop").symlink_to(temp_media_dir / "Album1")
+        index = LibraryIndex(temp_media_dir, settings.allowed_extensions_set)
+        index.scan()
+
+        assert index.lookup(temp_media_dir / "Album1" / "Disc2") is not None
+        assert index.lookup(temp_media_dir / "Album1" / "Disc2" / "loop") is None
+
+    def test_refresh_folder(self, temp_media_dir, index):
+        """Refreshing a folder picks up new files and subfolders."""
+        album = temp_media_dir / "Album1"
+        (album / "track03.flac").write_bytes(b"fake flac")
+        (album / "Bonus").mkdir()
+        (album / "Bonus" / "extra.mp3").write_bytes(b"fake mp3")
+
+        index.refresh("Album1")
+
+        assert "track03.flac" in index.audio_filenames(album)
+        assert index.audio_filenames(album / "Bonus") == ["extra.mp3"]
+        # Untouched folders keep their nodes
+        assert index.lookup(temp_media_dir / "Album2") is not None
+
+    def test_refresh_replaces_recreated_subfolder(self, temp_media_dir, index):
+        """A subfolder replaced under the same name is read again."""
+        disc = temp_media_dir / "Album1" / "Disc2"
+        disc.rmdir()
+        disc.mkdir()
+        (disc / "new.mp3").write_bytes(b"fake mp3")
+        bump_mtime(disc)
+
+        index.refresh("Album1")
+
+        assert index.audio_filenames(disc) == ["new.mp3"]
+
+    def test_iter_matches_disk(self, temp_media_dir, settings, index):
+        """Iterating from any position gives the same entries as reading the disk."""
+        for start in range(6):
+            assert list(index.iter_folder_contents(temp_media_dir / "Album1", start)) == list(
+                filesystem.iter_folder_contents(temp_media_dir, "Album1", settings, start)
+            )
+
+    def test_signature_follows_subfolders(self, temp_media_dir, index):
+        """A change inside a subfolder changes its parent's signature."""
+        before = index.signature(temp_media_dir)
+
+        (temp_media_dir / "EmptyFolder" / "new.mp3").write_bytes(b"fake mp3")
+        index.refresh("EmptyFolder")
+
+        assert index.signature(temp_media_dir) != before
+        assert index.list_folders(temp_media_dir)[2].has_audio is True
+
+
+class TestSnapshot:
+    """Tests for saving and loading the library snapshot."""
+
+    def test_round_trip(self, temp_media_dir, settings, index):
+        """A loaded snapshot answers like the scan it was saved from."""
+        snapshot_path = settings.cache_path / library.SNAPSHOT_FILENAME
+        index.snapshot_path = snapshot_path
+        index.save_snapshot()
+
+        loaded = LibraryIndex(temp_media_dir, settings.allowed_extensions_set, snapshot_path)
+
+        assert loaded.load_snapshot()
+        for relative in ["", "Album1", "Album2"]:
+            folder = temp_media_dir / relative if relative else temp_media_dir
+            assert loaded.list_folders(folder) == index.list_folders(folder)
+            assert loaded.list_audio_files(folder) == index.list_audio_files(folder)
+            assert loaded.signature(folder) == index.signature(folder)
+
+    def test_reconcile_changed_folders(self, temp_media_dir, settings, index):
+        """Reconciling re-reads folders whose mtime moved since the snapshot."""
+        snapshot_path = settings.cache_path / library.SNAPSHOT_FILENAME
+        index.snapshot_path = snapshot_path
+        index.save_snapshot()
+        (temp_media_dir / "Album1" / "Disc2" / "new.mp3").write_bytes(b"fake mp3")
+        bump_mtime(temp_media_dir / "Album1" / "Disc2")
+
+        loaded = LibraryIndex(temp_media_dir, settings.allowed_extensions_set, snapshot_path)
+        loaded.load_snapshot()
+        assert loaded.audio_filenames(temp_media_dir / "Album1" / "Disc2") == []
+        loaded.reconcile()
+
+        assert loaded.audio_filenames(temp_media_dir / "Album1" / "Disc2") == ["new.mp3"]
+        assert loaded.audio_filenames(temp_media_dir / "Album2") == ["song.flac"]
+
+    def test_ignores_other_library(self, temp_media_dir, settings, index):
+        """A snapshot of another root or extension set isn't used."""
+        snapshot_path = settings.cache_path / library.SNAPSHOT_FILENAME
+        index.snapshot_path = snapshot_path
+        index.save_snapshot()
+
+        other_root = LibraryIndex(
+            temp_media_dir / "Album1", settings.allowed_extensions_set, snapshot_path
+        )
+        other_extensions = LibraryIndex(temp_media_dir, {"mp3"}, snapshot_path)
+
+        assert not other_root.load_snapshot()
+        assert not other_extensions.load_snapshot()
+
+    def test_corrupt_snapshot(self, temp_media_dir, settings):
+        """An unreadable snapshot is ignored."""
+        snapshot_path = settings.cache_path / library.SNAPSHOT_FILENAME
+        snapshot_path.parent.mkdir(parents=True)
+        snapshot_path.write_bytes(b"not gzip")
+
+        index = LibraryIndex(temp_media_dir, settings.allowed_extensions_set, snapshot_path)
+
+        assert not index.load_snapshot()
+        assert not index.loaded
+
+    def test_damaged_compressed_data(self, temp_media_dir, settings, index):
+        """A snapshot with flipped bits is either loaded or ignored, never raises."""
+        snapshot_path = settings.cache_path / library.SNAPSHOT_FILENAME
+        index.snapshot_path = snapshot_path
+        index.save_snapshot()
+        data = snapshot_path.read_bytes()
+
+        for offset in range(len(data)):
+            damaged = bytearray(data)
+            damaged[offset] ^= 1 << (offset % 8)
+            snapshot_path.write_bytes(damaged)
+
+            loaded = LibraryIndex(temp_media_dir, settings.allowed_extensions_set, snapshot_path)
+            assert loaded.load_snapshot() in (True, False)
+
+    def test_saves_through_own_temp_file(self, temp_media_dir, settings, index, monkeypatch):
+        """Each save writes a temp file of its own, so concurrent savers can't mix."""
+        snapshot_path = settings.cache_path / library.SNAPSHOT_FILENAME
+        index.snapshot_path = snapshot_path
+        temp_names = []
+        mkstemp = library.tempfile.mkstemp
+
+        def recording_mkstemp(*args, **kwargs):
+            fd, name = mkstemp(*args, **kwargs)
+            temp_names.append(name)
+            return fd, name
+
+        monkeypatch.setattr(library.tempfile, "mkstemp", recording_mkstemp)
+        index.save_snapshot()
+        index.save_snapshot()
+
+        assert len(set(temp_names)) == 2
+        assert all(Path(name).parent == snapshot_path.parent for name in temp_names)
+        assert [path.name for path in snapshot_path.parent.iterdir()] == [snapshot_path.name]
+        assert LibraryIndex(
+            temp_media_dir, settings.allowed_extensions_set, snapshot_path
+        ).load_snapshot()
+
+
+class TestFallback:
+    """Tests for the module-level helpers."""
+
+    def test_reads_disk_until_loaded(self, temp_media_dir, settings, monkeypatch):
+        """Until the index has loaded, listings come from the disk."""
+        monkeypatch.setattr(library, "_indexes", {})
+
+        contents = library.get_folder_contents(temp_media_dir, "Album1", settings)
+
+        assert contents == filesystem.get_folder_contents(temp_media_dir, "Album1", settings)
+
+    def test_served_from_index(self, temp_media_dir, settings, monkeypatch):
+        """Once loaded, listings come from the index without touching the disk."""
+        monkeypatch.setattr(library, "_indexes", {})
+        library.get_library_index(settings).scan()
+        monkeypatch.setattr(filesystem, "get_folder_contents", pytest.fail)
+
+        contents = library.get_folder_contents(temp_media_dir, "Album1", settings)
+
+        assert [f.filename for f in contents.files] == ["track01.mp3", "Track02.wav"]
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+class TestLibraryWatcher:
+    """Tests for following changes with inotify."""
+
+    async def test_follows_changes(self, temp_media_dir, settings, monkeypatch):
+        """New files appear in the index without a rescan."""
+        monkeypatch.setattr(library, "WATCH_DEBOUNCE", 0.05)
+        index = LibraryIndex(temp_media_dir, settings.allowed_extensions_set)
+        task = asyncio.create_task(LibraryWatcher(index, rescan_interval=0).run())
+        try:
+            while not index.loaded:
+                await asyncio.sleep(0.01)
+
+            (temp_media_dir / "Album2" / "new.mp3").write_bytes(b"fake mp3")
+            for _ in range(200):
+                if "new.mp3" in index.audio_filenames(temp_media_dir / "Album2"):
+                    break
+                await asyncio.sleep(0.01)
+
+            assert "new.mp3" in index.audio_filenames(temp_media_dir / "Album2")
+        finally:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def _count_scans(self, index, watcher, monkeypatch):
+        """Run a watcher briefly and count its full scans."""
+        scans = []
+        scan = index.scan
+        monkeypatch.setattr(index, "scan", lambda: (scans.append(1), scan()))
+        task = asyncio.create_task(watcher.run())
+        try:
+            await asyncio.sleep(0.5)
+        finally:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        return len(scans)
+
+    async def test_no_rescans_while_watched(self, temp_media_dir, settings, monkeypatch):
+        """With every folder watched, only the first scan reads the whole library."""
+        index = LibraryIndex(temp_media_dir, settings.allowed_extensions_set)
+        watcher = LibraryWatcher(index, rescan_interval=0.05)
+
+        assert await self._count_scans(index, watcher, monkeypatch) == 1
+        assert not watcher.needs_rescans
+
+    async def test_rescans_when_out_of_watches(self, temp_media_dir, settings, monkeypatch):
+        """Folders that can't be watched are kept current by periodic rescans."""
+
+        def add_watch(self, path, mask=0):
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC), str(path))
+
+        monkeypatch.setattr(library.Inotify, "add_watch", add_watch)
+        index = LibraryIndex(temp_media_dir, settings.allowed_extensions_set)
+        watcher = LibraryWatcher(index, rescan_interval=0.05)
+
+        assert await self._count_scans(index, watcher, monkeypatch) > 1
+        assert watcher.needs_rescans
@@ -0,0 +1,161 @@
+"""Tests for the audio metadata cache."""
+
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from small_media.config import Settings
+from small_media.services import metadata
+from small_media.services.metadata import (
+    METADATA_FILENAME,
+    MetadataStore,
+    load_audio_durations,
+    load_audio_info,
+)
+
+INFO = {"duration": 12.5, "bitrate": 1411, "sample_rate": 44100, "channels": 2}
+
+
+@pytest.fixture
+def temp_dirs():
+    """Create temporary media and cache directories."""
+    with tempfile.TemporaryDirectory() as media_dir:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            yield Path(media_dir), Path(cache_dir)
+
+
+@pytest.fixture
+def settings(temp_dirs):
+    """Create settings for testing."""
+    media_dir, cache_dir = temp_dirs
+    return Settings(media_path=media_dir, cache_path=cache_dir)
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    """Replace ffprobe with a fake; returns the list of probed files."""
+    probed: list[Path] = []
+
+    async def probe(file_path, settings=None):
+        probed.append(file_path)
+        return dict(INFO)
+
+    monkeypatch.setattr(metadata, "probe_audio_info", probe)
+    return probed
+
+
+class TestLoadAudioInfo:
+    """Tests for cached metadata lookups."""
+
+    async def test_probes_once(self, temp_dirs, settings, probes):
+        """Repeat lookups are served from the cache."""
+        media_dir, _ = temp_dirs
+        source = media_dir / "a.flac"
+        source.write_bytes(b"audio")
+
+        assert await load_audio_info(source, settings) == INFO
+        assert await load_audio_info(source, settings) == INFO
+        assert probes == [source]
+
+    async def test_changed_file_probed_again(self, temp_dirs, settings, probes):
+        """A new size or mtime invalidates the stored result."""
+        media_dir, _ = temp_dirs
+        source = media_dir / "a.flac"
+        source.write_bytes(b"audio")
+        await load_audio_info(source, settings)
+
+        source.write_bytes(b"longer audio")
+        await load_audio_info(source, settings)
+
+        assert probes == [source, source]
+
+    async def test_survives_restart(self, temp_dirs, settings, probes):
+        """Results persist in the cache directory."""
+        media_dir, cache_dir = temp_dirs
+        source = media_dir / "a.flac"
+        source.write_bytes(b"audio")
+        await load_audio_info(source, settings)
+
+        store = MetadataStore(cache_dir / METADATA_FILENAME)
+        stat = os.stat(source)
+        assert store.get((str(source), stat.st_size, stat.st_mtime)) == INFO
+        store.close()
+
+    async def test_failed_probe_not_stored(self, temp_dirs, settings, monkeypatch):
+        """Files ffprobe can't read are retried next time."""
+        media_dir, _ = temp_dirs
+        source = media_dir / "a.flac"
+        source.write_bytes(b"audio")
+
+        async def probe(file_path, settings=None):
+            return None
+
+        monkeypatch.setattr(metadata, "probe_audio_info", probe)
+
+        assert await load_audio_info(source, settings) is None
+        assert len(metadata.get_metadata_store(settings)) == 0
+
+    async def test_missing_file(self, temp_dirs, settings, probes):
+        """Missing files are not probed."""
+        media_dir, _ = temp_dirs
+        assert await load_audio_info(media_dir / "missing.flac", settings) is None
+        assert probes == []
+
+
+class TestLoadAudioDurations:
+    """Tests for bulk duration lookups."""
+
+    async def test_probes_misses_in_parallel(self, temp_dirs, settings, monkeypatch):
+        """Uncached files are probed concurrently, up to the configured limit."""
+        media_dir, _ = temp_dirs
+        settings.probe_concurrency = 2
+        files = []
+        for n in range(5):
+            files.append(media_dir / f"{n}.flac")
+            files[-1].write_bytes(b"audio")
+        running = 0
+        peak = 0
+
+        async def probe(file_path, settings=None):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.05)
+            running -= 1
+            return dict(INFO)
+
+        monkeypatch.setattr(metadata, "probe_audio_info", probe)
+        durations = await load_audio_durations([*files, media_dir / "missing.flac"], settings)
+
+        assert durations == [12.5] * 5 + [None]
+        assert peak == 2
+
+    async def test_uses_cache(self, temp_dirs, settings, probes):
+        """Stored durations are not probed again."""
+        media_dir, _ = temp_dirs
+        source = media_dir / "a.flac"
+        source.write_bytes(b"audio")
+        await load_audio_info(source, settings)
+
+        assert await load_audio_durations([source, source], settings) == [12.5, 12.5]
+        assert probes == [source]
+
+
+class TestMetadataStore:
+    """Tests for the in-memory LRU layer."""
+
+    def test_memory_is_bounded(self, temp_dirs):
+        """Least recently used results leave memory but stay in the database."""
+        _, cache_dir = temp_dirs
+        store = MetadataStore(cache_dir / METADATA_FILENAME, memory_entries=2)
+        keys = [(f"/m/{n}.flac", 1, 1.0) for n in range(3)]
+        for key in keys:
+            store.put(key, INFO)
+
+        assert store.get_memory(keys[0]) is None
+        assert store.get_memory(keys[2]) == INFO
+        assert store.get(keys[0]) == INFO
+        store.close()
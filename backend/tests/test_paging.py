@@ -0,0 +1,130 @@
+"""Tests for cursor pagination and NDJSON streaming."""
+
+import json
+
+import pytest
+
+from small_media.models import AudioFile, FolderContents
+from small_media.services.filesystem import file_entry
+from small_media.services.paging import (
+    NDJSON_BATCH_SIZE,
+    encode_json,
+    iter_ndjson,
+    make_cursor,
+    parse_cursor,
+    take_page,
+    wants_ndjson,
+)
+
+
+def make_file(number: int) -> dict:
+    """Build an audio file entry."""
+    return file_entry(f"{number}.mp3", f"{number}.mp3", number)[1]
+
+
+class TestCursor:
+    """Tests for parse_cursor and make_cursor functions."""
+
+    def test_round_trip(self):
+        """A cursor points back at its position; no cursor is the start."""
+        assert parse_cursor(make_cursor(120)) == 120
+        assert parse_cursor(None) == 0
+        assert parse_cursor("") == 0
+
+    @pytest.mark.parametrize("cursor", ["-1", "abc", "1.5"])
+    def test_malformed(self, cursor):
+        """Malformed cursors raise ValueError."""
+        with pytest.raises(ValueError):
+            parse_cursor(cursor)
+
+
+class TestWantsNdjson:
+    """Tests for wants_ndjson function."""
+
+    def test_accept(self):
+        """Only an explicit NDJSON media type selects streaming."""
+        assert wants_ndjson("application/x-ndjson")
+        assert wants_ndjson("application/json;q=0.5, application/x-ndjson")
+        assert not wants_ndjson("application/json")
+        assert not wants_ndjson("*/*")
+        assert not wants_ndjson(None)
+
+
+class TestTakePage:
+    """Tests for take_page function."""
+
+    def test_pages(self):
+        """A page stops at the limit, with a cursor to the next entry."""
+        page, cursor = take_page(iter(range(10, 15)), 10, 3)
+        assert page == [10, 11, 12]
+        assert cursor == make_cursor(13)
+
+        page, cursor = take_page(iter(range(13, 15)), 13, 3)
+        assert page == [13, 14]
+        assert cursor is None
+
+    def test_consumes_one_past_the_page(self):
+        """Only one entry past the page is produced."""
+        consumed = []
+
+        def items():
+            for number in range(100):
+                consumed.append(number)
+                yield number
+
+        take_page(items(), 0, 5)
+
+        assert consumed == list(range(6))
+
+    def test_no_limit(self):
+        """Without a limit, everything is one page."""
+        assert take_page(iter(range(3)), 0, None) == ([0, 1, 2], None)
+
+
+class TestIterNdjson:
+    """Tests for iter_ndjson function."""
+
+    def test_lines(self):
+        """The header comes first, then one line per entry, then the cursor."""
+        entries = (("file", make_file(number)) for number in range(5))
+
+        body = b"".join(iter_ndjson({"path": "a"}, entries, 0, 2))
+
+        assert [json.loads(line) for line in body.splitlines()] == [
+            {"path": "a"},
+            {"file": make_file(0)},
+            {"file": make_file(1)},
+            {"next_cursor": make_cursor(2)},
+        ]
+
+    def test_last_page(self):
+        """No cursor is sent once the entries run out."""
+        entries = (("file", make_file(number)) for number in range(2))
+
+        body = b"".join(iter_ndjson({"path": "a"}, entries, 4, 2))
+
+        assert body.endswith(b"\n")
+        assert b"next_cursor" not in body
+
+    def test_chunks(self):
+        """The header is sent on its own and entries in batches."""
+        entries = (("file", make_file(number)) for number in range(NDJSON_BATCH_SIZE + 1))
+
+        chunks = list(iter_ndjson({"path": "a"}, entries, 0, None))
+
+        assert [chunk.count(b"\n") for chunk in chunks] == [1, NDJSON_BATCH_SIZE, 1]
+
+
+class TestEncodeJson:
+    """Tests for encode_json function."""
+
+    def test_matches_response_model(self):
+        """Trusted entries encode to what the response model would produce."""
+        body = {"path": "a", "name": "a", "folders": [], "files": [make_file(1)]}
+
+        encoded = encode_json({**body, "next_cursor": None})
+
+        assert encoded == FolderContents.model_validate(body).model_dump_json().encode()
+        assert FolderContents.model_validate_json(encoded).files == [
+            AudioFile(filename="1.mp3", path="1.mp3", format="mp3", size=1)
+        ]
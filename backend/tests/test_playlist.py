@@ -7,11 +7,15 @@ import pytest
 import yaml
 
 from small_media.config import Settings
+from small_media.services import library
+from small_media.services.filesystem import encode_path
 from small_media.services.playlist import (
     PLAYLIST_FILENAME,
     build_playlist,
     get_audio_files_in_folder,
+    get_playlist_order,
     load_playlist_file,
+    make_tracks,
     save_playlist_file,
     update_playlist,
 )
@@ -124,6 +128,48 @@ class TestBuildPlaylist:
         assert tracks[2].skip is False
 
 
+class TestGetPlaylistOrder:
+    """Tests for get_playlist_order function."""
+
+    def test_listed_tracks_first(self, temp_media_dir, settings):
+        """Listed tracks keep their order and skip flags, the rest follow sorted."""
+        album = temp_media_dir / "Album1"
+        save_playlist_file(
+            album, {"version": 1, "tracks": [{"filename": "track_02.mp3", "skip": True}]}
+        )
+
+        assert get_playlist_order(album, settings) == [
+            ("track_02.mp3", True),
+            ("track_01.mp3", False),
+            ("track_03.mp3", False),
+        ]
+
+
+class TestMakeTracks:
+    """Tests for make_tracks function."""
+
+    @pytest.mark.parametrize("indexed", [False, True])
+    def test_encoded_paths(self, temp_media_dir, settings, monkeypatch, indexed):
+        """Track paths are encoded the same with or without the library index."""
+        monkeypatch.setattr(library, "_indexes", {})
+        folder = temp_media_dir / "Disc 1"
+        folder.mkdir()
+        (folder / "A & B?.mp3").write_bytes(b"fake mp3")
+        if indexed:
+            library.get_library_index(settings).scan()
+
+        tracks = make_tracks("Disc 1", folder, [("A & B?.mp3", True)], settings)
+
+        assert tracks == [
+            {
+                "filename": "A & B?.mp3",
+                "path": encode_path("Disc 1/A & B?.mp3"),
+                "skip": True,
+                "duration": None,
+            }
+        ]
+
+
 class TestUpdatePlaylist:
     """Tests for update_playlist function."""
 
@@ -0,0 +1,112 @@
+"""Tests for prefetch service."""
+
+import asyncio
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from small_media.config import Settings
+from small_media.services import prefetch
+from small_media.services.playlist import save_playlist_file
+from small_media.services.prefetch import get_upcoming_tracks, prefetch_upcoming
+
+
+@pytest.fixture
+def temp_media_dir():
+    """Create a temporary media directory with an album."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+
+        album = base / "Album1"
+        album.mkdir()
+        for name in ["track_01.flac", "track_02.flac", "track_03.mp3", "track_04.wav"]:
+            (album / name).write_bytes(b"fake audio")
+
+        yield base
+
+
+@pytest.fixture
+def settings(temp_media_dir):
+    """Create settings for testing."""
+    return Settings(
+        media_path=temp_media_dir,
+        cache_path=temp_media_dir / "cache",
+        allowed_extensions="mp3,wav,flac",
+        prefetch_tracks=2,
+    )
+
+
+class TestGetUpcomingTracks:
+    """Tests for get_upcoming_tracks function."""
+
+    def test_next_tracks(self, temp_media_dir, settings):
+        """Returns the tracks that follow in playlist order."""
+        upcoming = get_upcoming_tracks(temp_media_dir / "Album1/track_01.flac", settings, 2)
+        assert [p.name for p in upcoming] == ["track_02.flac", "track_03.mp3"]
+
+    def test_skipped_tracks_ignored(self, temp_media_dir, settings):
+        """Tracks flagged as skipped are not prefetched."""
+        save_playlist_file(
+            temp_media_dir / "Album1",
+            {"version": 1, "tracks": [{"filename": "track_02.flac", "skip": True}]},
+        )
+
+        upcoming = get_upcoming_tracks(temp_media_dir / "Album1/track_01.flac", settings, 2)
+        assert [p.name for p in upcoming] == ["track_03.mp3", "track_04.wav"]
+
+    def test_last_track(self, temp_media_dir, settings):
+        """Nothing follows the last track."""
+        assert get_upcoming_tracks(temp_media_dir / "Album1/track_04.wav", settings, 2) == []
+
+    def test_unknown_track(self, temp_media_dir, settings):
+        """A file that isn't in the playlist has no upcoming tracks."""
+        assert get_upcoming_tracks(temp_media_dir / "Album1/missing.wav", settings, 2) == []
+
+    def test_percent_in_names(self, temp_media_dir, settings):
+        """Names that look URL-encoded are taken as they are."""
+        album = temp_media_dir / "100%41 Hits"
+        album.mkdir()
+        for name in ["01 %41.flac", "02 %42.flac"]:
+            (album / name).write_bytes(b"fake audio")
+
+        upcoming = get_upcoming_tracks(album / "01 %41.flac", settings, 2)
+        assert upcoming == [album / "02 %42.flac"]
+
+
+class TestPrefetchUpcoming:
+    """Tests for prefetch_upcoming function."""
+
+    async def test_queues_transcodes(self, temp_media_dir, settings, monkeypatch):
+        """Upcoming tracks that need transcoding are queued at prefetch priority."""
+        started: list[tuple[str, str]] = []
+
+        class FinishedJob:
+            async def wait(self):
+                return True
+
+        def fake_job(file_path, cache_path, settings, priority):
+            started.append((file_path.name, priority.name))
+            return FinishedJob()
+
+        monkeypatch.setattr(prefetch, "get_transcode_job", fake_job)
+
+        await prefetch_upcoming(temp_media_dir / "Album1" / "track_02.flac", settings)
+        await asyncio.gather(*prefetch._tasks)
+
+        # track_03.mp3 is served as-is, so only track_04.wav needs encoding
+        assert started == [("track_04.wav", "PREFETCH")]
+
+    async def test_native_formats_skipped(self, temp_media_dir, settings, monkeypatch):
+        """Tracks the client plays as they are aren't transcoded ahead."""
+        monkeypatch.setattr(prefetch, "get_transcode_job", pytest.fail)
+
+        await prefetch_upcoming(temp_media_dir / "Album1" / "track_02.flac", settings, {"wav"})
+        await asyncio.gather(*prefetch._tasks)
+
+    async def test_disabled(self, temp_media_dir, settings, monkeypatch):
+        """Setting prefetch_tracks to 0 turns prefetching off."""
+        settings.prefetch_tracks = 0
+        monkeypatch.setattr(prefetch, "get_transcode_job", pytest.fail)
+
+        await prefetch_upcoming(temp_media_dir / "Album1" / "track_01.flac", settings)
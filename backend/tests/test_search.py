@@ -0,0 +1,164 @@
+"""Tests for library search."""
+
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from small_media.config import Settings
+from small_media.services import library, search
+from small_media.services.library import LibraryIndex
+from small_media.services.search import SearchIndex, normalize
+
+
+@pytest.fixture
+def temp_media_dir():
+    """Create a temporary media directory structure."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+
+        (base / "Beyoncé").mkdir()
+        (base / "Beyoncé" / "Halo.mp3").write_bytes(b"fake mp3")
+        (base / "Beyoncé" / "cover.jpg").write_bytes(b"jpeg")
+
+        (base / "Live").mkdir()
+        (base / "Live" / "Live at Leeds.flac").write_bytes(b"fake flac")
+        (base / "Live" / "Disc2").mkdir()
+        (base / "Live" / "Disc2" / "Olive Tree.mp3").write_bytes(b"fake mp3")
+
+        (base / ".hidden").mkdir()
+        (base / ".hidden" / "Live Secret.mp3").write_bytes(b"hidden")
+
+        yield base
+
+
+@pytest.fixture
+def settings(temp_media_dir):
+    """Create settings for testing."""
+    return Settings(
+        media_path=temp_media_dir,
+        cache_path=temp_media_dir / ".cache",
+        allowed_extensions="mp3,flac",
+    )
+
+
+@pytest.fixture
+def indexes(temp_media_dir, settings):
+    """A scanned library index with a search index following it."""
+    library_index = LibraryIndex(temp_media_dir, settings.allowed_extensions_set)
+    search_index = SearchIndex()
+    library_index.subscribe(search_index.update)
+    library_index.scan()
+    return library_index, search_index
+
+
+def paths(entries):
+    """Get the relative paths of search entries."""
+    return [entry.path for entry in entries]
+
+
+class TestNormalize:
+    """Tests for normalize function."""
+
+    def test_folds_case_and_accents(self):
+        """Case and accents are ignored."""
+        assert normalize("Beyoncé") == "beyonce"
+        assert normalize("STRASSE") == normalize("Straße")
+
+
+class TestSearchIndex:
+    """Tests for SearchIndex."""
+
+    def test_substring(self, indexes):
+        """Any part of a name matches, ignoring case and accents."""
+        _, index = indexes
+
+        entries, total = index.search("YONCE", 10)
+
+        assert paths(entries) == ["Beyoncé"]
+        assert total == 1
+
+    def test_every_term(self, indexes):
+        """Every term must appear in the name, in any order."""
+        _, index = indexes
+
+        entries, _ = index.search("leeds live", 10)
+
+        assert paths(entries) == ["Live/Live at Leeds.flac"]
+
+    def test_ranking(self, indexes):
+        """Exact names come first, then prefixes, then other matches."""
+        _, index = indexes
+
+        entries, total = index.search("live", 10)
+
+        assert paths(entries) == ["Live", "Live/Live at Leeds.flac", "Live/Disc2/Olive Tree.mp3"]
+        assert total == 3
+        assert paths(index.search("live", 1)[0]) == ["Live"]
+
+    def test_short_terms(self, indexes):
+        """Terms shorter than a trigram still match."""
+        _, index = indexes
+
+        entries, _ = index.search("ha", 10)
+
+        assert paths(entries) == ["Beyoncé/Halo.mp3"]
+
+    def test_not_indexed(self, indexes):
+        """Hidden folders and non-audio files aren't searched."""
+        _, index = indexes
+
+        assert index.search("secret", 10) == ([], 0)
+        assert index.search("cover", 10) == ([], 0)
+        assert index.search("nothing like this", 10) == ([], 0)
+
+    def test_follows_refresh(self, temp_media_dir, indexes):
+        """Added and removed names are picked up from a refresh."""
+        library_index, index = indexes
+        (temp_media_dir / "Live" / "Live at Leeds.flac").unlink()
+        (temp_media_dir / "Live" / "Tommy").mkdir()
+        (temp_media_dir / "Live" / "Tommy" / "Pinball Wizard.mp3").write_bytes(b"fake mp3")
+
+        library_index.refresh("Live")
+
+        assert index.search("leeds", 10) == ([], 0)
+        assert paths(index.search("wizard", 10)[0]) == ["Live/Tommy/Pinball Wizard.mp3"]
+        assert paths(index.search("tommy", 10)[0]) == ["Live/Tommy"]
+
+    def test_follows_removed_folder(self, temp_media_dir, indexes):
+        """Removing a folder removes everything below it."""
+        library_index, index = indexes
+        (temp_media_dir / "Live" / "Disc2" / "Olive Tree.mp3").unlink()
+        (temp_media_dir / "Live" / "Disc2").rmdir()
+
+        library_index.scan()
+
+        assert index.search("olive", 10) == ([], 0)
+        assert index.search("disc2", 10) == ([], 0)
+        assert len(index) == 4
+
+
+class TestSearchLibrary:
+    """Tests for search_library function."""
+
+    def test_not_loaded(self, settings, monkeypatch):
+        """There are no results until the library has been indexed."""
+        monkeypatch.setattr(library, "_indexes", {})
+        monkeypatch.setattr(search, "_indexes", {})
+
+        assert search.search_library("halo", 10, settings) is None
+
+    def test_results(self, settings, monkeypatch):
+        """Results carry encoded paths and the containing folder."""
+        monkeypatch.setattr(library, "_indexes", {})
+        monkeypatch.setattr(search, "_indexes", {})
+        search.get_search_index(settings)
+        library.get_library_index(settings).scan()
+
+        results, total = search.search_library("halo", 10, settings)
+
+        assert total == 1
+        assert results[0].name == "Halo.mp3"
+        assert results[0].path == "Beyonc%C3%A9%2FHalo.mp3"
+        assert results[0].folder == "Beyonc%C3%A9"
+        assert results[0].is_folder is False
@@ -0,0 +1,119 @@
+"""Tests for running blocking library work off the event loop."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from small_media.config import Settings
+from small_media.services import storage
+from small_media.services.storage import (
+    StorageTimeoutError,
+    get_stuck_threads,
+    iterate_blocking,
+    run_blocking,
+)
+
+
+@pytest.fixture
+def settings(tmp_path):
+    """Create settings for testing."""
+    return Settings(media_path=tmp_path, cache_path=tmp_path / "cache", storage_timeout=5)
+
+
+@pytest.fixture
+def small_pool(settings, monkeypatch):
+    """Give the test a storage pool of its own, with two threads."""
+    monkeypatch.setattr(storage, "_storage_pool", None)
+    monkeypatch.setattr(storage, "_storage_threads", 0)
+    yield settings.model_copy(update={"storage_threads": 2})
+    if storage._storage_pool is not None:
+        storage._storage_pool.shutdown(wait=False)
+
+
+async def wait_unstuck() -> None:
+    """Wait for released calls to give their threads back."""
+    for _ in range(100):
+        if get_stuck_threads() == 0:
+            return
+        await asyncio.sleep(0.01)
+
+
+class TestRunBlocking:
+    """Tests for run_blocking function."""
+
+    async def test_runs_on_storage_pool(self, settings):
+        """Work runs on a storage thread and its result is returned."""
+        name = await run_blocking(settings, lambda: threading.current_thread().name)
+
+        assert name.startswith("storage")
+
+    async def test_errors_propagate(self, settings):
+        """Exceptions from the work reach the caller."""
+        with pytest.raises(FileNotFoundError):
+            await run_blocking(settings, (settings.media_path / "missing").stat)
+
+    async def test_timeout(self, settings):
+        """A hung operation times out without holding up other work."""
+        release = threading.Event()
+        try:
+            started = time.monotonic()
+            hung = asyncio.create_task(run_blocking(settings, release.wait, timeout=0.2))
+
+            assert await run_blocking(settings, sum, [1, 2]) == 3
+            assert time.monotonic() - started < 0.2
+            with pytest.raises(StorageTimeoutError):
+                await hung
+        finally:
+            release.set()
+
+    async def test_fails_fast_when_every_thread_is_stuck(self, small_pool):
+        """Once every thread is held by a timed-out call, new calls fail straight away."""
+        release = threading.Event()
+        try:
+            for _ in range(2):
+                with pytest.raises(StorageTimeoutError):
+                    await run_blocking(small_pool, release.wait, timeout=0.05)
+            assert get_stuck_threads() == 2
+
+            started = time.monotonic()
+            with pytest.raises(StorageTimeoutError, match="stuck"):
+                await run_blocking(small_pool, sum, [1, 2])
+            assert time.monotonic() - started < 0.05
+        finally:
+            release.set()
+        await wait_unstuck()
+
+        assert get_stuck_threads() == 0
+        assert await run_blocking(small_pool, sum, [1, 2]) == 3
+
+    async def test_queued_call_dropped_after_timeout(self, small_pool):
+        """A call that times out before a thread picks it up never runs."""
+        release = threading.Event()
+        ran = []
+        busy = [
+            asyncio.create_task(run_blocking(small_pool, release.wait, timeout=5))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0.01)  # Let them take both threads
+        try:
+            with pytest.raises(StorageTimeoutError):
+                await run_blocking(small_pool, ran.append, 1, timeout=0.05)
+        finally:
+            release.set()
+        await asyncio.gather(*busy)
+        await run_blocking(small_pool, time.sleep, 0.01)
+
+        assert ran == []
+        assert get_stuck_threads() == 0
+
+
+class TestIterateBlocking:
+    """Tests for iterate_blocking function."""
+
+    async def test_yields_everything(self, settings):
+        """Every item of the iterator is yielded, in order."""
+        items = [item async for item in iterate_blocking(settings, iter(range(5)))]
+
+        assert items == [0, 1, 2, 3, 4]
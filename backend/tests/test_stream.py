@@ -0,0 +1,267 @@
+"""Tests for the stream routes."""
+
+import asyncio
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.responses import FileResponse
+from fastapi.testclient import TestClient
+
+from small_media.config import Settings, get_settings
+from small_media.main import app
+from small_media.routes import stream
+from small_media.routes.stream import MediaFileResponse
+from small_media.services import hls, transcoder
+from small_media.services.cache import get_cache_index, record_cache_entry
+from small_media.services.transcoder import TranscodeScheduler, get_cached_path
+
+
+@pytest.fixture
+def temp_dirs(tmp_path):
+    """Create temporary media and cache directories."""
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    return media_dir, tmp_path / "cache"
+
+
+@pytest.fixture
+def settings(temp_dirs, monkeypatch):
+    """Point the app's settings at the temporary directories."""
+    media_dir, cache_dir = temp_dirs
+    monkeypatch.setenv("MEDIA_PATH", str(media_dir))
+    monkeypatch.setenv("CACHE_PATH", str(cache_dir))
+    monkeypatch.setenv("LIBRARY_INDEX", "false")
+    monkeypatch.setenv("PREFETCH_TRACKS", "0")
+    get_settings.cache_clear()
+    yield get_settings()
+    get_settings.cache_clear()
+
+
+@pytest.fixture
+def no_ffmpeg(tmp_path, monkeypatch):
+    """Leave FFmpeg off the PATH while keeping the usual tools on it."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for tool in ["nice"]:
+        if path := shutil.which(tool):
+            os.symlink(path, bin_dir / tool)
+    monkeypatch.setenv("PATH", str(bin_dir))
+
+
+@pytest.fixture
+def client(settings):
+    """Create a client for the app, running its startup and shutdown."""
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def fake_segmenter(monkeypatch):
+    """Give every track 25 seconds and segment it with a fake FFmpeg.
+
+    Returns the encoder each run was asked to use.
+    """
+    codecs: list[str] = []
+
+    async def load_audio_info(file_path, settings):
+        return {"duration": 25.0}
+
+    async def start(file_path, out_dir, settings, first, count):
+        codecs.append(hls.get_segment_encoder_args(settings)[1])
+        script = (
+            "import pathlib; "
+            f"d = pathlib.Path({str(out_dir / hls.PARTIAL_DIRNAME)!r}); "
+            f"[d.joinpath(f'seg{{i:05d}}.ts').write_bytes(b'ts') "
+            f"for i in range({first}, {first + count})]"
+        )
+        return await asyncio.create_subprocess_exec(sys.executable, "-c", script)
+
+    monkeypatch.setattr(stream, "load_audio_info", load_audio_info)
+    monkeypatch.setattr(hls, "start_segment_process", start)
+    monkeypatch.setattr(transcoder, "_scheduler", TranscodeScheduler(concurrency=2))
+    return codecs
+
+
+def add_cached(file_path: Path, settings: Settings, data: bytes) -> Path:
+    """Put a transcode of a file in the cache, as a finished encode would."""
+    cached = get_cached_path(file_path, settings)
+    cached.write_bytes(data)
+    assert record_cache_entry(file_path, cached, settings, expected_size=len(data))
+    return cached
+
+
+class TestStreamAudio:
+    """Tests for the stream_audio route."""
+
+    def test_missing_ffmpeg_serves_original(self, temp_dirs, settings, client, no_ffmpeg):
+        """Without FFmpeg the original file is served, with the default niceness."""
+        media_dir, _ = temp_dirs
+        (media_dir / "a.wav").write_bytes(b"RIFF" + b"x" * 1000)
+        assert settings.transcode_nice
+
+        response = client.get("/api/stream/a.wav")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "audio/wav"
+        assert response.content == b"RIFF" + b"x" * 1000
+
+    def test_cached(self, temp_dirs, settings, client):
+        """A cached transcode is served with Range support and unpinned once sent."""
+        media_dir, _ = temp_dirs
+        source = media_dir / "a.wav"
+        source.write_bytes(b"RIFF")
+        add_cached(source, settings, b"0123456789")
+
+        response = client.get("/api/stream/a.wav")
+        partial = client.get("/api/stream/a.wav", headers={"Range": "bytes=2-5"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "audio/mpeg"
+        assert response.content == b"0123456789"
+        assert partial.status_code == 206
+        assert partial.content == b"2345"
+        assert get_cache_index(settings).stats()["pinned"] == 0
+
+    def test_pinned_while_served(self, temp_dirs, settings, client, monkeypatch):
+        """Eviction leaves a cached file alone while a response is sending it."""
+        media_dir, _ = temp_dirs
+        source = media_dir / "a.wav"
+        source.write_bytes(b"RIFF")
+        cached = add_cached(source, settings, b"0123456789")
+        index = get_cache_index(settings)
+        evicted = []
+
+        async def send_after_eviction(self, scope, receive, send):
+            index.max_size = 1
+            evicted.extend(index.evict())
+            await FileResponse.__call__(self, scope, receive, send)
+
+        monkeypatch.setattr(MediaFileResponse, "__call__", send_after_eviction)
+
+        response = client.get("/api/stream/a.wav")
+
+        assert evicted == []
+        assert response.content == b"0123456789"
+        assert index.stats()["pinned"] == 0
+        assert cached.exists()
+
+    def test_seek_pins_cached_file(self, temp_dirs, settings, client, monkeypatch):
+        """Seeking reads from the cached file, pinned until the response is sent."""
+        media_dir, _ = temp_dirs
+        source = media_dir / "a.wav"
+        source.write_bytes(b"RIFF")
+        cached = add_cached(source, settings, b"0123456789")
+        index = get_cache_index(settings)
+        reads = []
+
+        async def start(file_path, settings, start=0.0):
+            reads.append((file_path, index.stats()["pinned"]))
+            return await asyncio.create_subprocess_exec(
+                sys.executable, "-c", "print('seek')", stdout=asyncio.subprocess.PIPE
+            )
+
+        monkeypatch.setattr(transcoder, "start_transcode_process", start)
+
+        response = client.get("/api/stream/a.wav", params={"t": 10})
+
+        assert response.status_code == 200
+        assert response.content == b"seek\n"
+        assert reads == [(cached, 1)]
+        assert index.stats()["pinned"] == 0
+
+    def test_damaged_cache_file(self, temp_dirs, settings, client, no_ffmpeg):
+        """A cached file that lost data is dropped instead of being served."""
+        media_dir, _ = temp_dirs
+        source = media_dir / "a.wav"
+        source.write_bytes(b"RIFF")
+        cached = add_cached(source, settings, b"0123456789")
+        cached.write_bytes(b"01234")
+
+        response = client.get("/api/stream/a.wav")
+
+        assert response.content == b"RIFF"
+        assert not cached.exists()
+        assert len(get_cache_index(settings)) == 0
+
+    def test_passthrough_not_modified(self, temp_dirs, settings, client):
+        """A passed-through file is revalidated against its ETag."""
+        media_dir, _ = temp_dirs
+        (media_dir / "a.mp3").write_bytes(b"ID3" + b"x" * 100)
+
+        response = client.get("/api/stream/a.mp3")
+        etag = response.headers["etag"]
+        revalidated = client.get("/api/stream/a.mp3", headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert revalidated.status_code == 304
+        assert revalidated.headers["etag"] == etag
+        assert revalidated.content == b""
+
+    def test_cached_not_modified(self, temp_dirs, settings, client, no_ffmpeg):
+        """A cached transcode is revalidated without being opened or pinned."""
+        media_dir, _ = temp_dirs
+        source = media_dir / "a.wav"
+        source.write_bytes(b"RIFF")
+        add_cached(source, settings, b"0123456789")
+
+        etag = client.get("/api/stream/a.wav").headers["etag"]
+        revalidated = client.get("/api/stream/a.wav", headers={"If-None-Match": etag})
+        other_profile = client.get("/api/stream/a.wav?profile=low", headers={"If-None-Match": etag})
+
+        assert revalidated.status_code == 304
+        assert revalidated.headers["etag"] == etag
+        assert get_cache_index(settings).stats()["pinned"] == 0
+        assert other_profile.status_code != 304
+
+
+class TestHls:
+    """Tests for the HLS playlist and segment routes."""
+
+    def test_playlist(self, temp_dirs, settings, client, fake_segmenter):
+        """The playlist lists every segment and passes the profile on to them."""
+        media_dir, _ = temp_dirs
+        (media_dir / "a.wav").write_bytes(b"RIFF")
+
+        response = client.get("/api/stream/a.wav/hls/index.m3u8?profile=low")
+        unknown = client.get("/api/stream/a.wav/hls/index.m3u8?profile=loud")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/vnd.apple.mpegurl"
+        assert response.text.count("#EXTINF:") == 3
+        assert "\nseg00002.ts?profile=low\n" in response.text
+        assert unknown.status_code == 400
+
+    def test_segment(self, temp_dirs, settings, client, fake_segmenter):
+        """A segment is encoded on request, indexed, and unpinned once sent."""
+        media_dir, _ = temp_dirs
+        (media_dir / "a.wav").write_bytes(b"RIFF")
+
+        response = client.get("/api/stream/a.wav/hls/seg00001.ts")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "video/mp2t"
+        assert response.content == b"ts"
+        index = get_cache_index(settings)
+        assert len(index) == 2
+        assert index.stats()["pinned"] == 0
+
+    def test_segment_profile(self, temp_dirs, settings, client, fake_segmenter):
+        """Segments are encoded at the requested profile, as AAC in place of Opus."""
+        media_dir, _ = temp_dirs
+        (media_dir / "a.wav").write_bytes(b"RIFF")
+
+        response = client.get("/api/stream/a.wav/hls/seg00000.ts?profile=low")
+
+        assert response.status_code == 200
+        assert fake_segmenter == ["aac"]
+
+    def test_segment_out_of_range(self, temp_dirs, settings, client, fake_segmenter):
+        """Segments past the end of the track, or badly named, are not found."""
+        media_dir, _ = temp_dirs
+        (media_dir / "a.wav").write_bytes(b"RIFF")
+
+        assert client.get("/api/stream/a.wav/hls/seg00003.ts").status_code == 404
+        assert client.get("/api/stream/a.wav/hls/seg3.ts").status_code == 404
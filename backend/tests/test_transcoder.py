@@ -1,15 +1,35 @@
 """Tests for transcoder service."""
 
+import asyncio
+import os
+import shutil
+import sys
 import tempfile
+import threading
 from pathlib import Path
 
 import pytest
 
 from small_media.config import Settings
+from small_media.services import transcoder
+from small_media.services.cache import get_cache_index, get_output_profile, record_cache_entry
+from small_media.services.profiles import get_profile_settings
 from small_media.services.transcoder import (
+    TranscodePriority,
+    TranscodeScheduler,
+    build_transcode_command,
+    get_audio_info,
     get_cache_key,
     get_cached_path,
+    get_temp_path,
+    get_transcode_job,
     is_mp3_passthrough,
+    is_native_passthrough,
+    lock_cache_entry,
+    stream_seek,
+    sweep_cache,
+    transcode_to_cache,
+    unlock_cache_entry,
 )
 
 
@@ -58,6 +78,99 @@ class TestIsMp3Passthrough:
         assert is_mp3_passthrough(flac_file) is False
 
 
+class TestIsNativePassthrough:
+    """Tests for is_native_passthrough function."""
+
+    def test_declared_format(self, temp_dirs):
+        """Files in a format the client plays are passed through."""
+        media_dir, _ = temp_dirs
+        assert is_native_passthrough(media_dir / "test.FLAC", {"flac", "ogg"}) is True
+        assert is_native_passthrough(media_dir / "test.wav", {"flac", "ogg"}) is False
+
+    def test_mp3_always(self, temp_dirs):
+        """MP3 is passed through even when the client declares nothing."""
+        media_dir, _ = temp_dirs
+        assert is_native_passthrough(media_dir / "test.mp3", set()) is True
+        assert is_native_passthrough(media_dir / "test.flac", set()) is False
+
+
+class TestTranscodeCommand:
+    """Tests for FFmpeg command construction."""
+
+    def test_threads(self, temp_dirs, settings):
+        """Thread count comes from settings and FFmpeg is run directly."""
+        media_dir, _ = temp_dirs
+        settings.transcode_threads = 2
+        settings.transcode_nice = 5
+
+        cmd = build_transcode_command(media_dir / "a.wav", "pipe:1", settings)
+
+        assert cmd[0] == "ffmpeg"
+        assert cmd[cmd.index("-threads") + 1] == "2"
+        assert cmd[-1] == "pipe:1"
+        assert "-ss" not in cmd
+
+    def test_seek(self, temp_dirs, settings):
+        """A start offset seeks on the input side."""
+        media_dir, _ = temp_dirs
+
+        cmd = build_transcode_command(media_dir / "a.wav", "pipe:1", settings, start=2700)
+
+        assert cmd[cmd.index("-ss") + 1] == "2700.000"
+        assert cmd.index("-ss") < cmd.index("-i")
+
+    def test_mp3_copied(self, temp_dirs, settings):
+        """MP3 input is copied instead of re-encoded."""
+        media_dir, _ = temp_dirs
+
+        cmd = build_transcode_command(media_dir / "a.mp3", "pipe:1", settings, start=5)
+
+        assert cmd[cmd.index("-codec:a") + 1] == "copy"
+
+    def test_opus_profile(self, temp_dirs, settings):
+        """The low profile encodes Opus in Ogg at its bitrate."""
+        media_dir, _ = temp_dirs
+        low = get_profile_settings(settings, "low")
+
+        cmd = build_transcode_command(media_dir / "a.flac", "pipe:1", low)
+
+        assert cmd[cmd.index("-codec:a") + 1] == "libopus"
+        assert cmd[cmd.index("-b:a") + 1] == "64k"
+        assert cmd[cmd.index("-f") + 1] == "ogg"
+
+
+class TestStartTranscodeProcess:
+    """Tests for start_transcode_process function."""
+
+    async def test_niceness(self, temp_dirs, settings, monkeypatch):
+        """The encoder is lowered to the configured niceness once started."""
+        media_dir, _ = temp_dirs
+        settings.transcode_nice = 5
+        monkeypatch.setattr(
+            transcoder,
+            "build_transcode_command",
+            lambda *args, **kwargs: [sys.executable, "-c", "import time; time.sleep(5)"],
+        )
+
+        process = await transcoder.start_transcode_process(media_dir / "a.wav", settings)
+        try:
+            assert os.getpriority(os.PRIO_PROCESS, process.pid) == 5
+        finally:
+            await transcoder.stop_process(process)
+
+    async def test_missing_ffmpeg(self, temp_dirs, settings, monkeypatch):
+        """A missing FFmpeg fails to start with the default niceness."""
+        media_dir, _ = temp_dirs
+        # Only nice is left on the PATH
+        if nice := shutil.which("nice"):
+            os.symlink(nice, media_dir / "nice")
+        monkeypatch.setenv("PATH", str(media_dir))
+        assert settings.transcode_nice
+
+        with pytest.raises(OSError):
+            await transcoder.start_transcode_process(media_dir / "a.wav", settings)
+
+
 class TestCacheKey:
     """Tests for cache key generation."""
 
@@ -107,3 +220,419 @@ class TestCachedPath:
 
         cached = get_cached_path(test_file, settings)
         assert cached.suffix == ".mp3"
+
+    def test_profiles_cached_separately(self, temp_dirs, settings):
+        """Each profile gets its own cache file and index profile."""
+        media_dir, _ = temp_dirs
+        test_file = media_dir / "test.flac"
+        test_file.write_bytes(b"test content")
+        profiles = [get_profile_settings(settings, name) for name in ("low", "standard", "high")]
+
+        paths = [get_cached_path(test_file, profile) for profile in profiles]
+
+        assert len(set(paths)) == 3
+        assert [path.suffix for path in paths] == [".opus", ".mp3", ".mp3"]
+        assert len({get_output_profile(profile) for profile in profiles}) == 3
+        # The configured output keeps the key it had before profiles existed
+        assert get_profile_settings(settings, "standard") is settings
+
+    def test_unknown_profile(self, settings):
+        """Unknown profile names are rejected."""
+        with pytest.raises(KeyError):
+            get_profile_settings(settings, "lossless")
+
+
+async def fake_encoder(
+    size: int, exit_code: int = 0, delay: float = 0
+) -> asyncio.subprocess.Process:
+    """Start a process that writes ``size`` bytes to stdout like FFmpeg would.
+
+    With a ``delay``, it pauses for that long halfway through.
+    """
+    script = (
+        "import sys, time; "
+        f"sys.stdout.buffer.write(b'x' * {size // 2}); "
+        "sys.stdout.buffer.flush(); "
+        f"time.sleep({delay}); "
+        f"sys.stdout.buffer.write(b'x' * {size - size // 2}); "
+        "sys.stdout.buffer.flush(); "
+        f"sys.exit({exit_code})"
+    )
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "-c", script, stdout=asyncio.subprocess.PIPE
+    )
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """Replace FFmpeg with fake encoders; returns the list of spawned jobs."""
+    spawned: list[Path] = []
+    options = {"size": 200_000, "exit_code": 0, "delay": 0}
+
+    async def start(file_path, settings, start=0.0):
+        spawned.append(file_path)
+        return await fake_encoder(options["size"], options["exit_code"], options["delay"])
+
+    monkeypatch.setattr(transcoder, "start_transcode_process", start)
+    return spawned, options
+
+
+async def read_all(stream) -> bytes:
+    """Drain an async byte stream."""
+    return b"".join([chunk async for chunk in stream])
+
+
+class TestTranscodeJob:
+    """Tests for shared in-flight transcodes."""
+
+    async def test_streams_and_promotes(self, temp_dirs, settings, fake_ffmpeg):
+        """Output is streamed and the cache file appears after a clean exit."""
+        media_dir, cache_dir = temp_dirs
+        cached = cache_dir / "abc.mp3"
+        (media_dir / "a.wav").write_bytes(b"RIFF")
+
+        job = get_transcode_job(media_dir / "a.wav", cached, settings)
+        data = await read_all(job.stream())
+
+        assert data == b"x" * 200_000
+        assert await job.wait() is True
+        assert cached.read_bytes() == data
+        assert not list(cache_dir.glob("*.part"))
+        assert not list(cache_dir.glob("*.lock"))
+
+    async def test_failed_encode_not_cached(self, temp_dirs, settings, fake_ffmpeg):
+        """A non-zero exit leaves no cache file or temp file."""
+        media_dir, cache_dir = temp_dirs
+        cached = cache_dir / "abc.mp3"
+        _, options = fake_ffmpeg
+        options["exit_code"] = 1
+
+        job = get_transcode_job(media_dir / "a.wav", cached, settings)
+        await read_all(job.stream())
+
+        assert await job.wait() is False
+        assert not cached.exists()
+        assert not list(cache_dir.glob("*.part"))
+
+    async def test_concurrent_requests_share_encode(self, temp_dirs, settings, fake_ffmpeg):
+        """Readers of the same entry attach to one encode."""
+        media_dir, cache_dir = temp_dirs
+        cached = cache_dir / "abc.mp3"
+        spawned, _ = fake_ffmpeg
+
+        first = get_transcode_job(media_dir / "a.wav", cached, settings)
+        second = get_transcode_job(media_dir / "a.wav", cached, settings)
+        results = await asyncio.gather(read_all(first.stream()), read_all(second.stream()))
+
+        assert first is second
+        assert len(spawned) == 1
+        assert results[0] == results[1] == b"x" * 200_000
+
+    async def test_abandoned_job_demoted(self, temp_dirs, settings, fake_ffmpeg):
+        """With nothing else queued, an abandoned encode finishes in the background."""
+        media_dir, cache_dir = temp_dirs
+        cached = cache_dir / "abc.mp3"
+        (media_dir / "a.wav").write_bytes(b"RIFF")
+        _, options = fake_ffmpeg
+        options["delay"] = 0.2
+
+        job = get_transcode_job(media_dir / "a.wav", cached, settings)
+        stream = job.stream()
+        await anext(stream)
+        await stream.aclose()
+
+        assert job.demoted is True
+        assert job.priority == TranscodePriority.BACKGROUND
+        assert await asyncio.wait_for(job.wait(), timeout=5) is True
+        assert cached.exists()
+
+    async def test_abandoned_job_stopped_when_others_wait(
+        self, temp_dirs, settings, fake_ffmpeg, monkeypatch
+    ):
+        """An abandoned encode holding up queued work is stopped."""
+        media_dir, cache_dir = temp_dirs
+        monkeypatch.setattr(transcoder, "_scheduler", TranscodeScheduler(concurrency=1))
+        _, options = fake_ffmpeg
+        options["delay"] = 0.2
+        for name in ("a.wav", "b.wav"):
+            (media_dir / name).write_bytes(b"RIFF")
+
+        first = get_transcode_job(media_dir / "a.wav", cache_dir / "a.mp3", settings)
+        stream = first.stream()
+        await anext(stream)
+        second = get_transcode_job(
+            media_dir / "b.wav", cache_dir / "b.mp3", settings, TranscodePriority.PREFETCH
+        )
+        await asyncio.sleep(0.05)
+        await stream.aclose()
+
+        assert await asyncio.wait_for(first.wait(), timeout=5) is False
+        assert await asyncio.wait_for(second.wait(), timeout=5) is True
+        assert not (cache_dir / "a.mp3").exists()
+        assert not list(cache_dir.glob("*.part"))
+
+    async def test_demoted_job_preempted(self, temp_dirs, settings, fake_ffmpeg, monkeypatch):
+        """A demoted encode gives up its slot to a new interactive request."""
+        media_dir, cache_dir = temp_dirs
+        monkeypatch.setattr(transcoder, "_scheduler", TranscodeScheduler(concurrency=1))
+        _, options = fake_ffmpeg
+        options["delay"] = 0.5
+        for name in ("a.wav", "b.wav"):
+            (media_dir / name).write_bytes(b"RIFF")
+
+        first = get_transcode_job(media_dir / "a.wav", cache_dir / "a.mp3", settings)
+        stream = first.stream()
+        await anext(stream)
+        await stream.aclose()
+        assert first.demoted is True
+
+        options["delay"] = 0
+        second = get_transcode_job(media_dir / "b.wav", cache_dir / "b.mp3", settings)
+
+        assert await asyncio.wait_for(read_all(second.stream()), timeout=5)
+        assert await asyncio.wait_for(first.wait(), timeout=5) is False
+        assert await second.wait() is True
+
+    async def test_follows_other_process(self, temp_dirs, settings, fake_ffmpeg):
+        """A job defers to the process holding the entry lock."""
+        media_dir, cache_dir = temp_dirs
+        cached = cache_dir / "abc.mp3"
+        spawned, _ = fake_ffmpeg
+        source = media_dir / "a.wav"
+        source.write_bytes(b"RIFF")
+
+        # Simulate another worker encoding this entry
+        lock_fd = lock_cache_entry(cached)
+        assert lock_fd is not None
+        get_temp_path(cached).write_bytes(b"partial")
+
+        job = get_transcode_job(source, cached, settings)
+        reader = asyncio.create_task(read_all(job.stream()))
+        await asyncio.sleep(0.1)
+
+        get_temp_path(cached).rename(cached)
+        assert record_cache_entry(source, cached, settings)
+        unlock_cache_entry(cached, lock_fd)
+
+        assert await asyncio.wait_for(reader, timeout=5) == b"partial"
+        assert job.succeeded is True
+        assert spawned == []
+
+    async def test_unindexed_file_is_replaced(self, temp_dirs, settings, fake_ffmpeg):
+        """A cache file without an index entry is not trusted."""
+        media_dir, cache_dir = temp_dirs
+        cached = cache_dir / "abc.mp3"
+        spawned, _ = fake_ffmpeg
+        source = media_dir / "a.wav"
+        source.write_bytes(b"RIFF")
+        cached.write_bytes(b"truncated")
+
+        job = get_transcode_job(source, cached, settings)
+        data = await read_all(job.stream())
+
+        assert len(spawned) == 1
+        assert await job.wait() is True
+        assert cached.read_bytes() == data == b"x" * 200_000
+
+    async def test_records_on_storage_thread(self, temp_dirs, settings, fake_ffmpeg, monkeypatch):
+        """The cache entry, which stats the source, is recorded off the event loop."""
+        media_dir, cache_dir = temp_dirs
+        source = media_dir / "a.wav"
+        source.write_bytes(b"RIFF")
+        index = get_cache_index(settings)
+        record = index.record
+        threads = []
+
+        def recording(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return record(*args, **kwargs)
+
+        monkeypatch.setattr(index, "record", recording)
+        job = get_transcode_job(source, cache_dir / "abc.mp3", settings)
+        await read_all(job.stream())
+
+        assert await job.wait() is True
+        assert len(threads) == 1
+        assert threads[0].startswith("storage")
+
+
+class TestAsyncHelpers:
+    """Tests for the async probe and transcode entry points."""
+
+    async def test_transcode_to_cache(self, temp_dirs, settings, fake_ffmpeg):
+        """A background transcode runs to completion without readers."""
+        media_dir, cache_dir = temp_dirs
+        (media_dir / "a.wav").write_bytes(b"RIFF")
+
+        assert await transcode_to_cache(media_dir / "a.wav", cache_dir / "a.mp3", settings)
+        assert (cache_dir / "a.mp3").stat().st_size == 200_000
+
+    async def test_get_audio_info_falls_back(self, temp_dirs, monkeypatch):
+        """Files the header readers can't parse go to ffprobe."""
+        media_dir, _ = temp_dirs
+        probed = []
+
+        async def run_ffprobe(file_path, entries, output_format):
+            probed.append(file_path)
+            return '{"format": {"duration": "3.5", "bit_rate": "128000"}, "streams": []}'
+
+        monkeypatch.setattr(transcoder, "run_ffprobe", run_ffprobe)
+        (media_dir / "a.m4a").write_bytes(b"not parsed natively")
+
+        info = await get_audio_info(media_dir / "a.m4a")
+
+        assert probed == [media_dir / "a.m4a"]
+        assert info["duration"] == 3.5
+        assert info["bitrate"] == 128
+
+
+class TestStreamSeek:
+    """Tests for streaming from a time offset."""
+
+    async def test_streams_and_fills_cache(self, temp_dirs, settings, fake_ffmpeg):
+        """The seek stream starts at once and the full encode is queued behind it."""
+        media_dir, cache_dir = temp_dirs
+        source = media_dir / "a.wav"
+        source.write_bytes(b"RIFF")
+        cached = cache_dir / "a.mp3"
+        spawned, _ = fake_ffmpeg
+
+        data = await read_all(stream_seek(source, settings, 60.0, cache_path=cached))
+
+        assert data == b"x" * 200_000
+        job = transcoder._jobs.get(cached)
+        if job is not None:
+            assert await job.wait() is True
+        assert cached.exists()
+        assert spawned == [source, source]
+
+    async def test_cached_copy(self, temp_dirs, settings, fake_ffmpeg):
+        """Seeking in a cached file doesn't start a cache encode."""
+        _, cache_dir = temp_dirs
+        cached = cache_dir / "a.mp3"
+        cached.write_bytes(b"mp3")
+        spawned, _ = fake_ffmpeg
+
+        await read_all(stream_seek(cached, settings, 10.0))
+
+        assert spawned == [cached]
+
+
+class TestSweepCache:
+    """Tests for the startup cache sweep."""
+
+    def test_removes_orphans(self, temp_dirs, settings):
+        """Leftover temp files and unindexed cache files are deleted."""
+        media_dir, cache_dir = temp_dirs
+        source = media_dir / "a.wav"
+        source.write_bytes(b"RIFF")
+        kept = cache_dir / "kept.mp3"
+        kept.write_bytes(b"mp3")
+        assert record_cache_entry(source, kept, settings)
+        (cache_dir / "orphan.mp3").write_bytes(b"mp3")
+        (cache_dir / "crashed.mp3.part").write_bytes(b"mp3")
+        (cache_dir / "crashed.mp3.lock").touch()
+
+        assert sweep_cache(settings) == 2
+        assert [p.name for p in cache_dir.glob("*.mp3*")] == ["kept.mp3"]
+
+    def test_skips_locked_entries(self, temp_dirs, settings):
+        """Entries another process is still encoding are left alone."""
+        _, cache_dir = temp_dirs
+        cached = cache_dir / "busy.mp3"
+        lock_fd = lock_cache_entry(cached)
+        assert lock_fd is not None
+        get_temp_path(cached).write_bytes(b"partial")
+        try:
+            assert sweep_cache(settings) == 0
+            assert get_temp_path(cached).exists()
+        finally:
+            unlock_cache_entry(cached, lock_fd)
+
+
+class TestTranscodeScheduler:
+    """Tests for the bounded, prioritized transcode scheduler."""
+
+    async def test_concurrency_limit(self):
+        """No more than the configured number of encodes run at once."""
+        scheduler = TranscodeScheduler(concurrency=2)
+        running = 0
+        peak = 0
+
+        async def encode():
+            nonlocal running, peak
+            async with scheduler.slot(TranscodePriority.INTERACTIVE):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(encode() for _ in range(6)))
+
+        assert peak == 2
+        assert scheduler.active == 0
+
+    async def test_priority_order(self):
+        """Waiting encodes start in priority order, then arrival order."""
+        scheduler = TranscodeScheduler(concurrency=1)
+        order: list[str] = []
+        gate = asyncio.Event()
+
+        async def encode(name, priority):
+            async with scheduler.slot(priority):
+                order.append(name)
+                await gate.wait()
+
+        tasks = [asyncio.create_task(encode("first", TranscodePriority.BACKGROUND))]
+        await asyncio.sleep(0)
+        for name, priority in [
+            ("warm", TranscodePriority.BACKGROUND),
+            ("prefetch", TranscodePriority.PREFETCH),
+            ("listener", TranscodePriority.INTERACTIVE),
+        ]:
+            tasks.append(asyncio.create_task(encode(name, priority)))
+        await asyncio.sleep(0)
+
+        assert scheduler.queued() == 3
+        gate.set()
+        await asyncio.gather(*tasks)
+
+        assert order == ["first", "listener", "prefetch", "warm"]
+
+    async def test_promote(self):
+        """A queued encode can be promoted ahead of others."""
+        scheduler = TranscodeScheduler(concurrency=1)
+        order: list[str] = []
+        gate = asyncio.Event()
+
+        async def encode(name, priority):
+            async with scheduler.slot(priority, key=name):
+                order.append(name)
+                await gate.wait()
+
+        tasks = [asyncio.create_task(encode("first", TranscodePriority.INTERACTIVE))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(encode("prefetch", TranscodePriority.PREFETCH)))
+        tasks.append(asyncio.create_task(encode("warm", TranscodePriority.BACKGROUND)))
+        await asyncio.sleep(0)
+
+        scheduler.promote("warm", TranscodePriority.INTERACTIVE)
+        gate.set()
+        await asyncio.gather(*tasks)
+
+        assert order == ["first", "warm", "prefetch"]
+        # The promoted encode is counted under the priority it ran at
+        started = {q["priority"]: q["started"] for q in scheduler.stats()["queues"]}
+        assert started == {"interactive": 2, "prefetch": 1, "background": 0}
+
+    async def test_stats(self):
+        """Queue depth and wait times are reported per priority."""
+        scheduler = TranscodeScheduler(concurrency=1)
+
+        async with scheduler.slot(TranscodePriority.PREFETCH):
+            stats = scheduler.stats()
+
+        assert stats["active"] == 1
+        queues = {q["priority"]: q for q in stats["queues"]}
+        assert queues["prefetch"]["started"] == 1
+        assert queues["interactive"]["queued"] == 0
@@ -0,0 +1,68 @@
+"""Tests for the cache pre-warm command."""
+
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from small_media.config import Settings
+from small_media.warm import CHECKPOINT_FILENAME, find_warm_targets, main, warm_cache
+
+
+@pytest.fixture
+def temp_dirs():
+    """Create temporary media and cache directories."""
+    with tempfile.TemporaryDirectory() as media_dir:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            yield Path(media_dir), Path(cache_dir)
+
+
+@pytest.fixture
+def settings(temp_dirs):
+    """Create settings for testing."""
+    media_dir, cache_dir = temp_dirs
+    return Settings(media_path=media_dir, cache_path=cache_dir)
+
+
+class TestFindWarmTargets:
+    """Tests for selecting files to pre-warm."""
+
+    def test_skips_passthrough_and_hidden(self, temp_dirs, settings):
+        """Only files that would be transcoded are selected."""
+        media_dir, _ = temp_dirs
+        (media_dir / "album").mkdir()
+        (media_dir / ".hidden").mkdir()
+        for name in ["album/b.flac", "album/a.wav", "album/c.mp3", "album/notes.txt",
+                     ".hidden/d.wav", "e.ogg"]:
+            (media_dir / name).write_bytes(b"audio")
+
+        targets = find_warm_targets(media_dir, settings)
+
+        assert [p.relative_to(media_dir).as_posix() for p in targets] == [
+            "e.ogg",
+            "album/a.wav",
+            "album/b.flac",
+        ]
+
+
+class TestWarmCache:
+    """Tests for the pre-warm run."""
+
+    def test_resumes_from_checkpoint(self, temp_dirs, settings, capsys):
+        """Files listed in the checkpoint are not processed again."""
+        media_dir, cache_dir = temp_dirs
+        source = media_dir / "a.wav"
+        source.write_bytes(b"audio")
+        (cache_dir / CHECKPOINT_FILENAME).write_text(f"{source}\n")
+
+        counts = warm_cache(media_dir, settings, jobs=1)
+
+        assert counts == {"encoded": 0, "cached": 0, "failed": 0, "resumed": 1}
+        assert "Warming 0 files" in capsys.readouterr().out
+        assert not (cache_dir / CHECKPOINT_FILENAME).exists()
+
+    def test_rejects_paths_outside_media(self, settings, monkeypatch):
+        """The subtree must stay inside MEDIA_PATH."""
+        monkeypatch.setattr("small_media.warm.get_settings", lambda: settings)
+        with pytest.raises(SystemExit):
+            main(["../elsewhere"])
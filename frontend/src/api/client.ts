@@ -4,12 +4,15 @@
 
 import type {
     FolderContents,
+    FolderContentsLine,
     FolderListResponse,
     Playlist,
     PlaylistUpdate,
+    SearchResponse,
 } from '../types'
 
 const API_BASE = import.meta.env.VITE_API_BASE || '/api'
+const NDJSON_MEDIA_TYPE = 'application/x-ndjson'
 
 class ApiError extends Error {
     status: number
@@ -61,10 +64,46 @@ export async function getFolderContents(path: string): Promise<FolderContents> {
 }
 
 /**
- * Get playlist for a folder
+ * Stream the contents of a folder, calling back with each line as it arrives
+ * so large folders can be shown before the whole listing has been read
  */
-export async function getPlaylist(path: string): Promise<Playlist> {
-    const response = await fetch(`${API_BASE}/folders/${path}/playlist`)
+export async function streamFolderContents(
+    path: string,
+    onLine: (line: FolderContentsLine) => void
+): Promise<void> {
+    const response = await fetch(`${API_BASE}/folders/${path}`, {
+        headers: { Accept: NDJSON_MEDIA_TYPE },
+    })
+    if (!response.ok || response.redirected || !response.body) {
+        // Errors and expired sessions are handled like any other response
+        await handleResponse<unknown>(response)
+        return
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+    let buffer = ''
+    for (;;) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffer += value
+        const lines = buffer.split('\n')
+        buffer = lines.pop() ?? ''
+        for (const line of lines) {
+            if (line) onLine(JSON.parse(line))
+        }
+    }
+    if (buffer) onLine(JSON.parse(buffer))
+}
+
+/**
+ * Get playlist for a folder, optionally with the duration of every track
+ */
+export async function getPlaylist(
+    path: string,
+    options: { durations?: boolean } = {}
+): Promise<Playlist> {
+    const query = options.durations ? '?durations=true' : ''
+    const response = await fetch(`${API_BASE}/folders/${path}/playlist${query}`)
     return handleResponse<Playlist>(response)
 }
 
@@ -86,9 +125,61 @@ export async function updatePlaylist(
 }
 
 /**
- * Get stream URL for an audio file
+ * Find folders and audio files by name anywhere in the library
  */
-export function getStreamUrl(path: string): string {
-    return `${API_BASE}/stream/${path}`
+export async function search(query: string, limit?: number): Promise<SearchResponse> {
+    const params = new URLSearchParams({ q: query })
+    if (limit) params.set('limit', String(limit))
+    const response = await fetch(`${API_BASE}/search?${params}`)
+    return handleResponse<SearchResponse>(response)
+}
+
+/**
+ * Output profiles the server can transcode to; `low` is Opus for slow connections
+ */
+export type StreamProfile = 'low' | 'standard' | 'high'
+
+// Source formats the server can pass through, and the media type to probe for each
+const SOURCE_FORMATS: Record<string, string> = {
+    flac: 'audio/flac',
+    ogg: 'audio/ogg',
+    m4a: 'audio/mp4',
+    mp4: 'audio/mp4',
+    wav: 'audio/wav',
+}
+
+let nativeFormats: string | undefined
+
+/**
+ * Source formats this browser plays without transcoding, as a comma-separated list
+ */
+function getNativeFormats(): string {
+    if (nativeFormats === undefined) {
+        const audio = document.createElement('audio')
+        nativeFormats = Object.entries(SOURCE_FORMATS)
+            .filter(([, type]) => audio.canPlayType(type) !== '')
+            .map(([ext]) => ext)
+            .join(',')
+    }
+    return nativeFormats
+}
+
+/**
+ * Get stream URL for an audio file, optionally starting at an offset in seconds
+ * and in a specific output profile (the server's default otherwise).
+ * Files this browser can play natively are served untranscoded.
+ */
+export function getStreamUrl(
+    path: string,
+    startTime?: number,
+    profile?: StreamProfile
+): string {
+    const params = new URLSearchParams()
+    if (startTime) params.set('t', startTime.toFixed(3))
+    if (profile) params.set('profile', profile)
+    const formats = getNativeFormats()
+    if (formats) params.set('formats', formats)
+    const query = params.toString()
+    return `${API_BASE}/stream/${path}${query ? `?${query}` : ''}`
 }
 
@@ -5,7 +5,7 @@
 import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
 import type { FolderItem, AudioFile } from '../types'
-import { getRootFolders, getFolderContents } from '../api/client'
+import { getRootFolders, streamFolderContents } from '../api/client'
 
 export const useFolderStore = defineStore('folder', () => {
     // State
@@ -15,6 +15,7 @@ export const useFolderStore = defineStore('folder', () => {
     const files = ref<AudioFile[]>([])
     const isLoading = ref(false)
     const error = ref<string | null>(null)
+    let loadId = 0 // Lines from a superseded load are dropped
 
     // Getters
     const isRoot = computed(() => currentPath.value === '')
@@ -23,6 +24,7 @@ export const useFolderStore = defineStore('folder', () => {
 
     // Actions
     async function loadRootFolders() {
+        loadId++
         isLoading.value = true
         error.value = null
 
@@ -40,19 +42,32 @@ export const useFolderStore = defineStore('folder', () => {
     }
 
     async function loadFolder(path: string) {
+        const load = ++loadId
         isLoading.value = true
         error.value = null
 
         try {
-            const contents = await getFolderContents(path)
-            folders.value = contents.folders
-            files.value = contents.files
-            currentPath.value = contents.path
-            currentName.value = contents.name
+            // Entries are shown as they arrive, so large folders render straight away
+            await streamFolderContents(path, (line) => {
+                if (load !== loadId) return
+                if ('folder' in line) {
+                    folders.value.push(line.folder)
+                } else if ('file' in line) {
+                    files.value.push(line.file)
+                } else if ('name' in line) {
+                    folders.value = []
+                    files.value = []
+                    currentPath.value = line.path
+                    currentName.value = line.name
+                    isLoading.value = false
+                }
+            })
         } catch (e) {
-            error.value = e instanceof Error ? e.message : 'Failed to load folder'
+            if (load === loadId) {
+                error.value = e instanceof Error ? e.message : 'Failed to load folder'
+            }
         } finally {
-            isLoading.value = false
+            if (load === loadId) isLoading.value = false
         }
     }
 
@@ -21,10 +21,35 @@ export interface FolderContents {
     name: string
     folders: FolderItem[]
     files: AudioFile[]
+    next_cursor?: string | null // set when a limit cut the listing short
 }
 
+/**
+ * One line of a streamed (NDJSON) folder listing: the folder itself first,
+ * then its subfolders and files, then a cursor if a limit cut it short
+ */
+export type FolderContentsLine =
+    | { path: string; name: string }
+    | { folder: FolderItem }
+    | { file: AudioFile }
+    | { next_cursor: string }
+
 export interface FolderListResponse {
     folders: FolderItem[]
+    next_cursor?: string | null // set when a limit cut the listing short
+}
+
+export interface SearchResult {
+    name: string
+    path: string // URL-encoded relative path
+    folder: string // URL-encoded path of the containing folder
+    is_folder: boolean
+}
+
+export interface SearchResponse {
+    query: string
+    results: SearchResult[]
+    total: number // matches, including those beyond the limit
 }
 
 export interface PlaylistTrack {
@@ -37,6 +62,7 @@ export interface PlaylistTrack {
 export interface Playlist {
     path: string
     tracks: PlaylistTrack[]
+    next_cursor?: string | null // set when a limit cut the playlist short
 }
 
 export interface PlaylistTrackUpdate {